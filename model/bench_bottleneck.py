@@ -0,0 +1,72 @@
+#compare the bottleneck variants of the Unet by training throughput and validation R^2
+#usage: python -m model.bench_bottleneck [--x 'sample_data/stage1/x/X_20*.npy' --y 'sample_data/stage1/y/Y_20*.npy']
+#                                        [--years 2] [--epochs 3] [--batch-size 30] [--variants lstm conv attention]
+#without --x and --y, synthetic data of the training shape is used (throughput only, R^2 is meaningless)
+import argparse
+import glob
+import time
+import numpy as np
+from keras.callbacks import Callback
+from tensorflow.keras.optimizers import Adam
+
+from model.bottleneck import BOTTLENECKS
+from model.core import Unet
+from unox.loaders import load_years
+from utils.functions import r2_keras, msenonzero, data_split
+
+
+class EpochTimer(Callback):
+    # Record the wall time of every training epoch
+
+    def on_train_begin(self, logs=None):
+        self.times = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.times.append(time.perf_counter() - self.start)
+
+
+def load_data(x_pattern=None, y_pattern=None, years=2, n_samples=120, seed=0):
+    # The first `years` years of the given files, or random data of the training shape
+    if x_pattern and y_pattern:
+        x_files, y_files = sorted(glob.glob(x_pattern))[:years], sorted(glob.glob(y_pattern))[:years]
+        x, y = load_years(x_files), load_years(y_files)
+        return x, y
+    rng = np.random.default_rng(seed)
+    return (rng.random((n_samples, 56, 120, 9), dtype=np.float32),
+            rng.random((n_samples, 56, 120, 1), dtype=np.float32))
+
+
+def bench_variant(bottleneck, xtrain, ytrain, xvalid, yvalid, epochs=3, batch_size=30):
+    unet = Unet(bottleneck=bottleneck)
+    unet.compile(optimizer=Adam(learning_rate=1e-5), loss=msenonzero, metrics=[r2_keras, msenonzero])
+    timer = EpochTimer()
+    history = unet.model.fit(xtrain, ytrain, validation_data=(xvalid, yvalid), batch_size=batch_size,
+                             epochs=epochs, callbacks=[timer], shuffle=True, verbose=0)
+    # The first epoch includes tracing and compiling, so leave it out of the throughput when possible
+    epoch_times = timer.times[1:] or timer.times
+    return {'bottleneck': bottleneck,
+            'params': unet.model.count_params(),
+            'samples_per_s': len(xtrain) / float(np.median(epoch_times)),
+            'val_r2': history.history['val_r2_keras'][-1],
+            'val_loss': history.history['val_loss'][-1]}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the Unet bottleneck variants')
+    parser.add_argument('--x', default=None, help='glob pattern of the X files')
+    parser.add_argument('--y', default=None, help='glob pattern of the Y files')
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=30)
+    parser.add_argument('--variants', nargs='+', default=list(BOTTLENECKS))
+    args = parser.parse_args()
+
+    x, y = load_data(args.x, args.y, args.years)
+    xtrain, ytrain, xvalid, yvalid = data_split(x, y, 0.9)
+    print(f"{'bottleneck':<12} {'params':>12} {'samples/s':>10} {'val R^2':>8} {'val loss':>10}")
+    for variant in args.variants:
+        r = bench_variant(variant, xtrain, ytrain, xvalid, yvalid, args.epochs, args.batch_size)
+        print(f"{r['bottleneck']:<12} {r['params']:>12,d} {r['samples_per_s']:>10.2f} {r['val_r2']:>8.3f} {r['val_loss']:>10.4g}")
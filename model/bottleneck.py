@@ -0,0 +1,73 @@
+#bottleneck variants of the Unet, between the Block4 convolutions and the Block5 up-convolution
+#each variant takes the Block4 feature map (batch, 7, 15, 1024) and returns a feature map of the same shape
+from keras.layers import Layer, LSTM, Permute, Reshape, Add, Dense, LayerNormalization, MultiHeadAttention
+from keras.layers.convolutional import Conv2D
+
+
+def lstm_bottleneck(c4):
+    # The original bottleneck: two LSTMs over the 7 x 15 = 105 positions of the feature map
+    # Layer names and order are unchanged, so existing h5 weights still load
+    _, h, w, c = c4.shape
+    c4 = Permute((3, 1, 2), name='Block4_Permute1') (c4)
+    c4 = Reshape((-1, h*w), name='Block4_Reshape') (c4)
+    f4 = Permute((2, 1), name='Block4_Permute2') (c4)  # 105 x 1024
+
+    lstm = LSTM(c, return_sequences=True, name='LSTM1') (f4)
+    lstm = LSTM(c, return_sequences=True, name='LSTM2') (lstm)
+
+    return Reshape( (h, w, c) , name='Block5_Reshape') (lstm)
+
+
+def conv_bottleneck(c4, width=256):
+    # Convolutions only: reduce the channels, widen the receptive field to the whole 7 x 15 map with
+    # dilated convolutions, expand the channels again and add the result to the input
+    _, h, w, c = c4.shape
+    b = Conv2D(width, (1, 1), activation='softplus', padding='same', name='Bottleneck_Reduce') (c4)
+    for rate in (1, 2, 4):
+        b = Conv2D(width, (3, 3), dilation_rate=rate, activation='softplus', padding='same',
+                   name=f'Bottleneck_Conv_d{rate}') (b)
+    b = Conv2D(c, (1, 1), padding='same', name='Bottleneck_Expand') (b)
+    return Add(name='Block5_Residual') ([c4, b])
+
+
+class PositionEmbedding(Layer):
+    # Learned embedding of the position of each element of a sequence, added to the sequence
+
+    def build(self, input_shape):
+        self.positions = self.add_weight(name='positions', shape=tuple(input_shape[1:]), initializer='zeros')
+
+    def call(self, x):
+        return x + self.positions
+
+
+def attention_bottleneck(c4, num_heads=8, key_dim=64):
+    # A transformer encoder block: self-attention over the 105 positions, followed by a feed-forward layer
+    # All positions are processed at once, rather than one after the other as in the LSTMs
+    _, h, w, c = c4.shape
+    seq = Reshape((h*w, c), name='Bottleneck_Reshape') (c4)
+    seq = PositionEmbedding(name='Bottleneck_Position') (seq)
+    att = MultiHeadAttention(num_heads=num_heads, key_dim=key_dim, name='Bottleneck_Attention') (seq, seq)
+    seq = LayerNormalization(name='Bottleneck_Norm1') (Add(name='Bottleneck_Add1') ([seq, att]))
+    ff = Dense(c, activation='softplus', name='Bottleneck_Dense1') (seq)
+    ff = Dense(c, name='Bottleneck_Dense2') (ff)
+    seq = LayerNormalization(name='Bottleneck_Norm2') (Add(name='Bottleneck_Add2') ([seq, ff]))
+    return Reshape( (h, w, c) , name='Block5_Reshape') (seq)
+
+
+BOTTLENECKS = {
+    'lstm': lstm_bottleneck,
+    'conv': conv_bottleneck,
+    'attention': attention_bottleneck,
+}
+
+# Needed to load a saved model that uses one of the bottlenecks, e.g. load_model(path, custom_objects=CUSTOM_OBJECTS)
+CUSTOM_OBJECTS = {'PositionEmbedding': PositionEmbedding}
+
+
+def get_bottleneck(bottleneck):
+    # Look up a bottleneck by name, or use the given function as the bottleneck
+    if callable(bottleneck):
+        return bottleneck
+    if bottleneck not in BOTTLENECKS:
+        raise ValueError(f'Unknown bottleneck {bottleneck!r}, must be one of {list(BOTTLENECKS)} or a function.')
+    return BOTTLENECKS[bottleneck]
@@ -1,12 +1,15 @@
 from keras.models import Model, load_model
-from keras.layers import Input, LSTM, Permute, Reshape
+from keras.layers import Input
 from keras.layers.core import Lambda
 from keras.layers.convolutional import Conv2D, Conv2DTranspose
 from keras.layers.pooling import MaxPooling2D
 from keras.layers.merging import concatenate
 import tensorflow as tf
+import os
 
-def build_Unet():
+from model.bottleneck import get_bottleneck
+
+def build_Unet(bottleneck='lstm'):
     inputs = Input( ( 56, 120, 9 ), name='model_input')
 
     c1 = Conv2D(128, (3, 3), activation='softplus', padding='same', name='Block1_Conv1') (inputs)    # 56, 120
@@ -24,14 +27,7 @@ def build_Unet():
     c4 = Conv2D(1024, (3, 3), activation='softplus', padding='same', name='Block4_Conv1') (p3) # 7, 15
     c4 = Conv2D(1024, (3, 3), activation='softplus', padding='same', name='Block4_Conv2') (c4) # 7, 15
 
-    c4 = Permute((3, 1, 2), name='Block4_Permute1') (c4)
-    c4 = Reshape((-1, 105), name='Block4_Reshape') (c4)
-    f4 = Permute((2, 1), name='Block4_Permute2') (c4)  # 20 x 512
-
-    lstm = LSTM(1024, return_sequences=True, name='LSTM1') (f4)
-    lstm = LSTM(1024, return_sequences=True, name='LSTM2') (lstm)
-
-    resh = Reshape( (7, 15, 1024) , name='Block5_Reshape') (lstm)
+    resh = get_bottleneck(bottleneck) (c4)  # 7, 15, 1024
 
     u5 = Conv2DTranspose(512, (2, 2), strides=(2, 2), padding='same', name='Block5_UpConv') (resh)  # 14 x 30
     # u5_cropped = Lambda(lambda x: tf.slice(x, [0, 0, 0, 0], [-1, 0, 0, -1]))(u5)
@@ -59,10 +55,25 @@ def build_Unet():
 
 
 
+def set_threads(intra_op_threads=None, inter_op_threads=None, cores=None):
+    # Must be called before the TensorFlow runtime is initialized, that is, before a model is built.
+    # Pin this process to the given cores, so that several workers on one node do not compete for them
+    if cores is not None:
+        os.sched_setaffinity(0, cores)
+        if intra_op_threads is None:
+            intra_op_threads = len(cores)
+    if intra_op_threads is not None:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    if inter_op_threads is not None:
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+
 class Unet():
 
-    def __init__(self):
-        self.model = build_Unet()
+    def __init__(self, intra_op_threads=None, inter_op_threads=None, cores=None, bottleneck='lstm'):
+        # By default, TensorFlow uses every core for its thread pools
+        set_threads(intra_op_threads, inter_op_threads, cores)
+        self.model = build_Unet(bottleneck)
 
     def compile(self, optimizer, loss, **kwargs):
         self.model.compile(optimizer=optimizer, loss=loss, **kwargs)
@@ -73,8 +84,8 @@ class Unet():
     def train(self, *args, **kwargs):
         self.model.fit( *args, **kwargs )
 
-    def predict(self, x):
-        return self.model.predict(x)
+    def predict(self, x, batch_size=None, **kwargs):
+        return self.model.predict(x, batch_size=batch_size, **kwargs)
 
     def summary(self):
         self.model.summary()
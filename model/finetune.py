@@ -0,0 +1,190 @@
+#stage-2 fine-tuning with a frozen encoder: the activations of the frozen prefix of layers are computed once,
+#cached on disk, and only the remaining layers are trained from the cache
+#usage: python -m model.finetune <savedir> [--cut Block4_Conv2] [--dtype float16] [--epochs 250]
+#expects <savedir>/unet_stage1_model.h5, as written by test_unet.py, and writes the stage-2 outputs like test_unet.py
+import argparse
+import glob
+import hashlib
+import json
+import os
+import numpy as np
+import tensorflow as tf
+from keras.models import Model
+from keras.layers import Input
+from keras.utils import Sequence
+
+from unox.loaders import load_years
+from unox.pixels import update_year
+from unox.rollups import write_rollup
+from unox.sketch import sketch_file
+
+
+def split_model(model, cut):
+    # Split the model after the layer named `cut` into a frozen encoder and a trainable head
+    # The encoder outputs every tensor of the prefix that the rest of the model uses, including the
+    # skip connections, and the head takes those tensors as its inputs
+    # The head shares its layers with the model, so training the head trains the model
+    names = [layer.name for layer in model.layers]
+    if cut not in names:
+        raise ValueError(f'No layer named {cut!r} in the model.')
+    prefix = model.layers[:names.index(cut) + 1]
+    suffix = model.layers[names.index(cut) + 1:]
+    for layer in prefix:
+        layer.trainable = False
+
+    # Tensors the suffix uses that it does not compute itself
+    computed = set()
+    boundary = []
+    for layer in suffix:
+        for t in layer.inbound_nodes[0].keras_inputs:
+            if t.name not in computed and t.name not in [b.name for b in boundary]:
+                boundary.append(t)
+        for t in tf.nest.flatten(layer.output):
+            computed.add(t.name)
+
+    encoder = Model(inputs=model.inputs, outputs=boundary, name='frozen_encoder')
+    head_inputs = [Input(t.shape[1:], name='cached_' + t.name.split('/')[0]) for t in boundary]
+    tensors = {t.name: i for t, i in zip(boundary, head_inputs)}
+    # Call the suffix layers on the new inputs, with the same arguments as in the model
+    for layer in suffix:
+        node = layer.inbound_nodes[0]
+        args, kwargs = tf.nest.map_structure(lambda t: tensors.get(getattr(t, 'name', None), t),
+                                             (node.call_args, node.call_kwargs))
+        outputs = layer(*args, **kwargs)
+        for t, out in zip(tf.nest.flatten(layer.output), tf.nest.flatten(outputs)):
+            tensors[t.name] = out
+    head = Model(inputs=head_inputs, outputs=[tensors[t.name] for t in model.outputs], name='trainable_head')
+    return encoder, head
+
+
+def _sources(x_files):
+    return [{'file': f, 'mtime': os.path.getmtime(f), 'size': os.path.getsize(f)} for f in x_files]
+
+
+def _weights_digest(encoder):
+    # Digest of the encoder weights, so that a retrained stage 1 model does not reuse the old activations
+    h = hashlib.sha1()
+    for w in encoder.get_weights():
+        h.update(str(w.shape).encode())
+        h.update(np.ascontiguousarray(w).tobytes())
+    return h.hexdigest()
+
+
+def cache_features(encoder, x_files, cache_dir, dtype='float16', batch_size=30):
+    # Compute the encoder outputs for every sample of the X files once and store them as memory-mapped .npy files
+    # The cache is reused as long as the X files, the encoder weights and outputs and the dtype are unchanged
+    os.makedirs(cache_dir, exist_ok=True)
+    index_file = os.path.join(cache_dir, 'index.json')
+    names = [t.name.split('/')[0] for t in encoder.outputs]
+    index = {'sources': _sources(x_files), 'weights': _weights_digest(encoder), 'outputs': names,
+             'dtype': str(np.dtype(dtype))}
+    if os.path.exists(index_file):
+        with open(index_file) as f:
+            if json.load(f) == index:
+                return load_features(cache_dir)
+        # Remove the old index first, so that it never describes half-overwritten caches
+        os.remove(index_file)
+
+    lengths = [np.load(x, mmap_mode='r').shape[0] for x in x_files]
+    caches = [np.lib.format.open_memmap(os.path.join(cache_dir, f'{i:02d}_{name}.npy'), mode='w+', dtype=dtype,
+                                        shape=(sum(lengths), *t.shape[1:]))
+              for i, (name, t) in enumerate(zip(names, encoder.outputs))]
+    start = 0
+    for x, n in zip(x_files, lengths):
+        xnow = np.load(x, mmap_mode='r')
+        for b in range(0, n, batch_size):
+            batch = np.asarray(xnow[b:b+batch_size], dtype=np.float32)
+            outputs = encoder.predict_on_batch(batch)
+            outputs = outputs if isinstance(outputs, list) else [outputs]
+            for cache, out in zip(caches, outputs):
+                cache[start+b:start+b+len(batch)] = out
+        start += n
+    for cache in caches:
+        cache.flush()
+    # Write the index last, so that an interrupted run is not mistaken for a complete cache
+    with open(index_file, 'w') as f:
+        json.dump(index, f)
+    return load_features(cache_dir)
+
+
+def load_features(cache_dir):
+    with open(os.path.join(cache_dir, 'index.json')) as f:
+        names = json.load(f)['outputs']
+    return [np.load(os.path.join(cache_dir, f'{i:02d}_{name}.npy'), mmap_mode='r') for i, name in enumerate(names)]
+
+
+class CachedFeatures(Sequence):
+    # Batches of cached encoder outputs and targets, read from the memory-mapped cache on demand
+
+    def __init__(self, features, y, indices, batch_size=30, shuffle=True):
+        self.features = features
+        self.y = y
+        self.indices = np.array(indices)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.on_epoch_end()
+
+    def __len__(self):
+        return int(np.ceil(len(self.indices) / self.batch_size))
+
+    def __getitem__(self, i):
+        # Sorted indices make the reads from the memory-mapped files more sequential
+        batch = np.sort(self.indices[i*self.batch_size:(i+1)*self.batch_size])
+        return [np.asarray(f[batch], dtype=np.float32) for f in self.features], self.y[batch]
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            np.random.shuffle(self.indices)
+
+
+def finetune(unet, x_files, y_files, cache_dir, optimizer, loss, metrics=None, cut='Block4_Conv2', dtype='float16',
+             ratio=0.9, batch_size=30, **fit_kwargs):
+    # Fine-tune the layers of the Unet after `cut`, training from the cached outputs of the frozen layers
+    encoder, head = split_model(unet.model, cut)
+    head.compile(optimizer=optimizer, loss=loss, metrics=metrics)
+    features = cache_features(encoder, x_files, cache_dir, dtype, batch_size)
+    y = load_years(y_files, dtype=np.float32)
+    # Split into training and validation sets, as data_split() does
+    dmask = np.random.permutation(len(y))
+    dsize = int(len(y) * ratio)
+    train = CachedFeatures(features, y, dmask[:dsize], batch_size)
+    valid = CachedFeatures(features, y, dmask[dsize:], batch_size, shuffle=False)
+    return head.fit(train, validation_data=valid, **fit_kwargs)
+
+
+if __name__ == '__main__':
+    from tensorflow.keras.optimizers import Adam
+    from keras.callbacks import CSVLogger, EarlyStopping
+    from model.core import Unet
+    from utils.functions import r2_keras, msenonzero
+
+    parser = argparse.ArgumentParser(description='Stage-2 fine-tuning from cached encoder activations')
+    parser.add_argument('savedir')
+    parser.add_argument('--cut', default='Block4_Conv2', help='last layer of the frozen prefix')
+    parser.add_argument('--dtype', default='float16', help='dtype of the cached activations')
+    parser.add_argument('--cache-dir', default=None, help='defaults to <savedir>/stage2_cache')
+    parser.add_argument('--epochs', type=int, default=250)
+    parser.add_argument('--batch-size', type=int, default=30)
+    args = parser.parse_args()
+    savedir = args.savedir + '/'
+
+    unet = Unet()
+    unet.load_weights(savedir+'unet_stage1_model.h5')
+
+    x_files = sorted(glob.glob('sample_data/stage2/x/X_20*.npy'))
+    y_files = sorted(glob.glob('sample_data/stage2/y/Y_20*.npy'))
+    csv_logger = CSVLogger(savedir+'unet_stage2_log.csv', append=True, separator=';')
+    earlystopper = EarlyStopping(patience=15, verbose=1)
+    finetune(unet, x_files[:5], y_files[:5], args.cache_dir or savedir+'stage2_cache',
+             Adam(learning_rate=1e-5), msenonzero, [r2_keras, msenonzero], args.cut, args.dtype,
+             batch_size=args.batch_size, epochs=args.epochs, callbacks=[earlystopper, csv_logger])
+
+    # The head shares its layers with the Unet, so the full model now has the fine-tuned weights
+    unet.save_model(savedir+'unet_stage2_model.h5')
+    os.makedirs(savedir+'stage2_output/', exist_ok=True)
+    for x in x_files[5:]:
+        pred = unet.predict(np.load(x))
+        np.save(savedir+'stage2_output/pred_' + x.split('/')[-1], pred)
+        write_rollup(savedir+'stage2_output/pred_' + x.split('/')[-1])
+        sketch_file(savedir+'stage2_output/pred_' + x.split('/')[-1])
+        update_year(savedir+'stage2_output/pred_' + x.split('/')[-1])
@@ -0,0 +1,175 @@
+#multi-process inference with an explicit thread budget and core affinity per worker
+#usage: python -m model.parallel predict <weights.h5> <output dir> <X files> [-w workers] [-t threads] [-b batch size]
+#       python -m model.parallel autotune [<weights.h5>]
+import argparse
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import time
+import numpy as np
+
+from unox.pixels import update_year
+from unox.rollups import write_rollup
+from unox.sketch import sketch_file
+
+# Seconds between checks that the workers are still alive, while waiting for their results
+POLL_INTERVAL = 1.0
+# Seconds the benchmark workers wait for each other to warm up before giving up
+BARRIER_TIMEOUT = 600
+
+
+def available_cores():
+    # Cores this process may run on, e.g. as restricted by the job scheduler
+    return sorted(os.sched_getaffinity(0))
+
+
+def plan_cores(n_workers, cores=None):
+    # Split the cores of the node into n_workers contiguous groups of (nearly) equal size
+    cores = available_cores() if cores is None else sorted(cores)
+    if n_workers < 1 or n_workers > len(cores):
+        raise ValueError(f'Cannot split {len(cores)} cores across {n_workers} workers.')
+    return [[int(c) for c in group] for group in np.array_split(np.array(cores), n_workers)]
+
+
+def _load_unet(weights, cores, threads, inter_op_threads):
+    # TensorFlow is only imported in the worker, after its affinity and thread budget are known
+    from model.core import Unet
+    unet = Unet(intra_op_threads=threads, inter_op_threads=inter_op_threads, cores=cores)
+    if weights:
+        unet.load_weights(weights)
+    return unet
+
+
+def _predict_worker(weights, x_files, out_dir, cores, threads, inter_op_threads, batch_size, queue):
+    unet = _load_unet(weights, cores, threads, inter_op_threads)
+    n_samples = 0
+    start = time.perf_counter()
+    for x in x_files:
+        xnow = np.load(x)
+        pred = unet.predict(xnow, batch_size=batch_size, verbose=0)
+        np.save(os.path.join(out_dir, 'pred_' + os.path.basename(x)), pred)
+        write_rollup(os.path.join(out_dir, 'pred_' + os.path.basename(x)))
+        sketch_file(os.path.join(out_dir, 'pred_' + os.path.basename(x)))
+        n_samples += len(xnow)
+    queue.put((n_samples, time.perf_counter() - start))
+
+
+def _benchmark_worker(weights, cores, threads, inter_op_threads, batch_size, n_samples, barrier, queue):
+    unet = _load_unet(weights, cores, threads, inter_op_threads)
+    xnow = np.random.default_rng(0).random((n_samples, 56, 120, 9), dtype=np.float32)
+    # Warm up, then wait for the other workers so that all of them are timed running concurrently
+    unet.predict(xnow[:batch_size], batch_size=batch_size, verbose=0)
+    barrier.wait()
+    start = time.perf_counter()
+    unet.predict(xnow, batch_size=batch_size, verbose=0)
+    queue.put((n_samples, time.perf_counter() - start))
+
+
+def _run_workers(target, worker_args):
+    # A fresh process per worker, so that each one starts its own TensorFlow runtime
+    # A worker that dies before sending its result, e.g. on a bad weights path or out of memory, stops
+    # the others instead of leaving the parent waiting forever
+    ctx = mp.get_context('spawn')
+    results_queue = ctx.Queue()
+    procs = [ctx.Process(target=target, args=(*args, results_queue)) for args in worker_args]
+    try:
+        for p in procs:
+            p.start()
+        results = []
+        while len(results) < len(procs):
+            try:
+                results.append(results_queue.get(timeout=POLL_INTERVAL))
+            except queue.Empty:
+                for p in procs:
+                    if p.exitcode not in (None, 0):
+                        raise RuntimeError(f'Worker {p.name} exited with code {p.exitcode}.')
+                if all(p.exitcode == 0 for p in procs) and results_queue.empty():
+                    raise RuntimeError('The workers exited without sending their results.')
+        for p in procs:
+            p.join()
+            if p.exitcode != 0:
+                raise RuntimeError(f'Worker {p.name} exited with code {p.exitcode}.')
+    finally:
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+                p.join()
+    return results
+
+
+def predict_files(weights, x_files, out_dir, n_workers=1, threads=None, inter_op_threads=1, batch_size=32, cores=None):
+    # Predict the given X files with n_workers processes, each pinned to its own group of cores
+    # threads defaults to the number of cores of each worker
+    # Returns the throughput in samples per second
+    plan = plan_cores(n_workers, cores)
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+    results = _run_workers(_predict_worker, [(weights, x_files[i::n_workers], out_dir, plan[i], threads,
+                                               inter_op_threads, batch_size) for i in range(n_workers)])
+    # Update the pixel store of the outputs, if there is one, once all the years are written
+    if x_files:
+        update_year(os.path.join(out_dir, 'pred_' + os.path.basename(x_files[0])))
+    return sum(n for n, t in results) / (time.perf_counter() - start)
+
+
+def benchmark(weights=None, n_workers=1, threads=None, inter_op_threads=1, batch_size=32, n_samples=128, cores=None):
+    # Throughput in samples per second of n_workers concurrent workers predicting synthetic inputs
+    plan = plan_cores(n_workers, cores)
+    barrier = mp.get_context('spawn').Barrier(n_workers, timeout=BARRIER_TIMEOUT)
+    results = _run_workers(_benchmark_worker, [(weights, plan[i], threads, inter_op_threads, batch_size,
+                                                 n_samples, barrier) for i in range(n_workers)])
+    # The workers ran concurrently, so the throughput of the node is the sum over the workers
+    return sum(n / t for n, t in results)
+
+
+def autotune(weights=None, worker_options=None, thread_options=None, batch_options=(8, 16, 32, 64),
+             n_samples=128, cores=None, verbose=True):
+    # Benchmark every (workers x threads x batch size) configuration that fits on the cores
+    # and return the one with the highest throughput, along with the results of all of them
+    cores = available_cores() if cores is None else sorted(cores)
+    n_cores = len(cores)
+    if worker_options is None:
+        worker_options = [k for k in (1, 2, 4, 8, 16) if k <= n_cores]
+    results = []
+    for n_workers in worker_options:
+        group = n_cores // n_workers
+        if group == 0:
+            continue
+        # By default, try every power of two up to the size of each worker's group of cores
+        threads_list = thread_options or sorted({2**i for i in range(group.bit_length()) if 2**i <= group} | {group})
+        for threads, batch_size in itertools.product(threads_list, batch_options):
+            if n_workers * threads > n_cores:
+                continue
+            throughput = benchmark(weights, n_workers, threads, 1, batch_size, n_samples, cores)
+            results.append({'workers': n_workers, 'threads': threads, 'batch_size': batch_size,
+                            'throughput': throughput})
+            if verbose:
+                print(f'workers={n_workers:3d} threads={threads:3d} batch_size={batch_size:4d} '
+                      f'throughput={throughput:9.2f} samples/s')
+    best = max(results, key=lambda r: r['throughput'])
+    return best, results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Multi-process Unet inference')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('predict', help='predict X files with several pinned workers')
+    p.add_argument('weights')
+    p.add_argument('out_dir')
+    p.add_argument('x_files', nargs='+')
+    p.add_argument('-w', '--workers', type=int, default=1)
+    p.add_argument('-t', '--threads', type=int, default=None)
+    p.add_argument('-b', '--batch-size', type=int, default=32)
+    a = sub.add_parser('autotune', help='find the fastest workers x threads x batch size configuration')
+    a.add_argument('weights', nargs='?', default=None)
+    a.add_argument('-n', '--samples', type=int, default=128)
+    args = parser.parse_args()
+
+    if args.command == 'predict':
+        throughput = predict_files(args.weights, sorted(args.x_files), args.out_dir, args.workers, args.threads,
+                                   batch_size=args.batch_size)
+        print(f'{throughput:.2f} samples/s')
+    else:
+        best, results = autotune(args.weights, n_samples=args.samples)
+        print('best:', best)
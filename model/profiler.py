@@ -0,0 +1,176 @@
+#per-layer profile of the Unet: parameters, FLOPs, activation memory and measured forward/backward time
+#usage: python -m model.profiler [--model unet_stage1_model.h5] [--batch-size 30] [--repeats 10] [--out unet_profile]
+#writes <out>.csv (one row per layer) and <out>.json (trace viewable in chrome://tracing or Perfetto)
+import argparse
+import csv
+import json
+import time
+import numpy as np
+import tensorflow as tf
+from keras.models import Model, load_model
+
+from model.core import build_Unet
+
+
+def layer_flops(layer):
+    # Floating point operations of one forward pass of the layer for a single sample
+    # A multiply-add counts as 2 operations
+    kind = type(layer).__name__
+    out = layer.output_shape
+    if kind == 'Conv2D':
+        kh, kw = layer.kernel_size
+        c_in = layer.input_shape[-1]
+        return 2 * out[1] * out[2] * kh * kw * c_in * layer.filters + out[1] * out[2] * layer.filters
+    if kind == 'Conv2DTranspose':
+        kh, kw = layer.kernel_size
+        _, h_in, w_in, c_in = layer.input_shape
+        return 2 * h_in * w_in * kh * kw * c_in * layer.filters + out[1] * out[2] * layer.filters
+    if kind == 'LSTM':
+        _, steps, n_in = layer.input_shape
+        units = layer.units
+        # 4 gates of matrix-vector products with the input and the hidden state, plus the cell update
+        return steps * (2 * 4 * units * (n_in + units) + 4 * units + 10 * units)
+    if kind == 'MaxPooling2D':
+        ph, pw = layer.pool_size
+        return out[1] * out[2] * out[3] * ph * pw
+    if kind == 'Dense':
+        return 2 * int(np.prod(layer.input_shape[1:])) * layer.units
+    # Reshapes, permutes and concatenations move data but do no arithmetic
+    return 0
+
+
+def layer_table(model, batch_size):
+    # Static profile of every layer for a batch of the given size
+    rows = []
+    for layer in model.layers:
+        out_shapes = layer.output_shape if isinstance(layer.output_shape, list) else [layer.output_shape]
+        activations = sum(int(np.prod(s[1:])) for s in out_shapes) * batch_size
+        rows.append({'layer': layer.name,
+                     'type': type(layer).__name__,
+                     'output_shape': str(layer.output_shape),
+                     'params': layer.count_params(),
+                     'flops': layer_flops(layer) * batch_size,
+                     'activation_bytes': activations * np.dtype(layer.dtype or 'float32').itemsize})
+    return rows
+
+
+def _time(fn, repeats):
+    # Median wall time of fn() in seconds, after one warm-up call
+    fn()
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def _layer_functions(layer, inputs):
+    # Compiled forward and backward pass of a single layer on fixed inputs
+    @tf.function
+    def forward():
+        return layer(inputs)
+
+    @tf.function
+    def backward():
+        with tf.GradientTape() as tape:
+            tape.watch(inputs)
+            loss = tf.reduce_sum(layer(inputs))
+        return tape.gradient(loss, [inputs, layer.trainable_weights])
+
+    return forward, backward
+
+
+def time_layers(model, x, repeats=10):
+    # Measured forward and backward time of each layer, run on its own recorded inputs
+    layers = [layer for layer in model.layers if type(layer).__name__ != 'InputLayer']
+    # A model that returns the inputs of every layer, to feed each layer in isolation
+    recorder = Model(inputs=model.inputs, outputs=[layer.input for layer in layers])
+    recorded = recorder(x)
+    times = {}
+    for layer, inputs in zip(layers, recorded):
+        forward, backward = _layer_functions(layer, inputs)
+        times[layer.name] = (_time(lambda: forward().numpy(), repeats),
+                             _time(lambda: tf.nest.map_structure(lambda g: g.numpy(), backward()), repeats))
+    return times
+
+
+def time_model(model, x, y, repeats=10):
+    # Measured forward and forward+backward (one training step without the optimizer update) time of the whole model
+    forward = tf.function(lambda: model(x, training=False))
+
+    @tf.function
+    def backward():
+        with tf.GradientTape() as tape:
+            loss = tf.reduce_mean(tf.square(model(x, training=True) - y))
+        return tape.gradient(loss, model.trainable_weights)
+
+    return _time(lambda: forward().numpy(), repeats), _time(lambda: [g.numpy() for g in backward()], repeats)
+
+
+def profile(model=None, batch_size=30, repeats=10, seed=0):
+    # Profile the given model, or a newly built Unet, on a synthetic batch of the training shape
+    if model is None:
+        model = build_Unet()
+    rng = np.random.default_rng(seed)
+    x = tf.constant(rng.random((batch_size, *model.input_shape[1:]), dtype=np.float32))
+    y = tf.constant(rng.random((batch_size, *model.output_shape[1:]), dtype=np.float32))
+    rows = layer_table(model, batch_size)
+    times = time_layers(model, x, repeats)
+    for row in rows:
+        row['forward_s'], row['backward_s'] = times.get(row['layer'], (0.0, 0.0))
+    forward_s, backward_s = time_model(model, x, y, repeats)
+    total = {'forward_s': forward_s, 'backward_s': backward_s}
+    return rows, total
+
+
+def write_table(rows, filename):
+    with open(filename, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_trace(rows, filename):
+    # Chrome trace event format: the layers one after the other, forward then backward in reverse order
+    events = []
+    t = 0.0
+    for row in rows:
+        events.append({'name': row['layer'], 'cat': 'forward', 'ph': 'X', 'pid': 0, 'tid': 0, 'ts': t * 1e6,
+                       'dur': row['forward_s'] * 1e6, 'args': {k: row[k] for k in ('type', 'params', 'flops', 'activation_bytes')}})
+        t += row['forward_s']
+    for row in reversed(rows):
+        events.append({'name': row['layer'], 'cat': 'backward', 'ph': 'X', 'pid': 0, 'tid': 1, 'ts': t * 1e6,
+                       'dur': row['backward_s'] * 1e6})
+        t += row['backward_s']
+    with open(filename, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+def print_table(rows, total):
+    print(f"{'layer':<20} {'type':<16} {'params':>12} {'GFLOPs':>10} {'act. MB':>10} {'fwd ms':>9} {'bwd ms':>9}")
+    for row in rows:
+        print(f"{row['layer']:<20} {row['type']:<16} {row['params']:>12,d} {row['flops']/1e9:>10.2f} "
+              f"{row['activation_bytes']/2**20:>10.1f} {row['forward_s']*1e3:>9.2f} {row['backward_s']*1e3:>9.2f}")
+    print(f"{'total':<20} {'':<16} {sum(r['params'] for r in rows):>12,d} {sum(r['flops'] for r in rows)/1e9:>10.2f} "
+          f"{sum(r['activation_bytes'] for r in rows)/2**20:>10.1f} {total['forward_s']*1e3:>9.2f} {total['backward_s']*1e3:>9.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-layer profile of the Unet')
+    parser.add_argument('--model', default=None, help='saved model (.h5) to profile instead of a newly built Unet')
+    parser.add_argument('--batch-size', type=int, default=30)
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--out', default='unet_profile', help='prefix of the .csv table and .json trace')
+    parser.add_argument('--tf-trace', default=None, help='also write a TensorFlow profiler trace to this log directory')
+    args = parser.parse_args()
+
+    model = load_model(args.model, compile=False) if args.model else None
+    if args.tf_trace:
+        tf.profiler.experimental.start(args.tf_trace)
+    rows, total = profile(model, args.batch_size, args.repeats)
+    if args.tf_trace:
+        tf.profiler.experimental.stop()
+    print_table(rows, total)
+    write_table(rows, args.out + '.csv')
+    write_trace(rows, args.out + '.json')
@@ -0,0 +1,26 @@
+#operational mode: build the input of one new day, append it to the X file of
+#its year, predict just that day and append the prediction to the run directory
+#usage: python predict_daily.py <date> <stage> <run directory> [<datafiles dir> <ERA5 dir> <inputfiles dir>]
+from model.core import Unet
+from unox import daily
+import sys
+
+date = sys.argv[1]   #e.g. 2021-07-19
+stage = int(sys.argv[2])
+run_dir = sys.argv[3]   #e.g. HPC_runs/test_unet_601760
+try:
+  datadir, era5dir, store_dir = sys.argv[4:7]
+except ValueError:
+  datadir, era5dir, store_dir = 'datafiles', 'datafiles', 'datafiles/inputfiles'
+
+##################################################################
+# Load the trained Unet of the given stage
+
+unet = Unet()
+unet.load_weights(run_dir+'/unet_stage'+str(stage)+'_model.h5')
+
+##################################################################
+# Build, store and predict the new day
+
+pred = daily.update_day(date, unet, stage, run_dir, datadir=datadir, era5dir=era5dir, store_dir=store_dir)
+print(date, pred.shape, 'written to', daily.pred_path(run_dir, stage, daily.to_date(date).year))
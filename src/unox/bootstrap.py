@@ -0,0 +1,166 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from unox import unox
+from unox import loaders
+from unox import metrics
+
+# Default length of the resampled blocks of days, to keep the autocorrelation within a week
+BLOCK_DAYS = 7
+
+# Number of replicates computed at once, from a single matrix of weights
+BATCH = 250
+
+def daily_stats(truth, pred, channel=0, region=None):
+    """Sufficient statistics of each day of a year of truth and predictions.
+
+    Parameters
+    ----------
+    truth, pred : array_like
+        Arrays of shape (time, lat, lon, channel). They are read one day at a
+        time, so they can be memory-mapped files.
+    channel : int
+        The channel to evaluate.
+    region : unox.regions.Region, optional
+        Only evaluate the cells of this region.
+
+    Returns
+    -------
+    stats : unox.metrics.Stats
+        Statistics of shape (time,).
+    """
+    if truth.shape[0] != pred.shape[0]:
+        raise ValueError(f"The truth has {truth.shape[0]} days, but the prediction has {pred.shape[0]}.")
+    days = []
+    for t in range(truth.shape[0]):
+        truth_day, pred_day = np.asarray(truth[t:t+1])[..., channel], np.asarray(pred[t:t+1])[..., channel]
+        if region is not None:
+            truth_day, pred_day = region.gather([truth_day, pred_day])
+        days.append(metrics.Stats.from_arrays(truth_day, pred_day))
+    return concatenate(days)
+
+def concatenate(stats):
+    """Concatenate the statistics of consecutive periods, e.g. the daily statistics of several years."""
+    return metrics.Stats(*(np.concatenate([np.atleast_1d(getattr(s, f)) for s in stats]) for f in metrics.FIELDS))
+
+def run_daily_stats(HPC_run, stage=1, years=range(2005, 2020), region=None):
+    """Daily statistics of the predictions of an HPC run against the Y files, for several years.
+
+    Returns Stats of shape (time,), with the days of the years one after the other.
+    """
+    return concatenate([daily_stats(loaders.open_array(unox.get_sample_data(stage, 'y', year)),
+                                    loaders.open_array(unox.get_pred_data(stage, HPC_run, year)), region=region)
+                        for year in years])
+
+def block_weights(n_days, n_replicates, block=BLOCK_DAYS, rng=None):
+    """Number of times each day is drawn in each replicate of a moving block bootstrap.
+
+    Each replicate is made of blocks of `block` consecutive days with random
+    starts, cut to n_days days.
+
+    Returns
+    -------
+    weights : numpy.ndarray
+        Array of shape (n_replicates, n_days).
+    """
+    rng = rng or np.random.default_rng()
+    block = min(block, n_days)
+    n_blocks = math.ceil(n_days / block)
+    starts = rng.integers(0, n_days - block + 1, size=(n_replicates, n_blocks))
+    days = (starts[:, :, None] + np.arange(block)).reshape(n_replicates, -1)[:, :n_days]
+    weights = np.zeros((n_replicates, n_days))
+    np.add.at(weights, (np.arange(n_replicates)[:, None], days), 1)
+    return weights
+
+def weighted_reduce(stats, weights):
+    """Merge daily statistics, counting each day as many times as its weight.
+
+    Parameters
+    ----------
+    stats : unox.metrics.Stats
+        Statistics of shape (time,).
+    weights : numpy.ndarray
+        Array of shape (n_replicates, time).
+
+    Returns
+    -------
+    stats : unox.metrics.Stats
+        Statistics of shape (n_replicates,).
+    """
+    n = weights @ stats.n
+    # Centre the daily means on the overall means first, so the expansion below does not lose precision
+    centre = stats.reduce()
+    d_t, d_p = stats.mean_t - centre.mean_t, stats.mean_p - centre.mean_p
+    mean_t = np.nan_to_num(metrics._divide(weights @ (stats.n * d_t), n))
+    mean_p = np.nan_to_num(metrics._divide(weights @ (stats.n * d_p), n))
+    # Sum of n * (daily mean - replicate mean)**2 over the days, expanded so that it is a product with the weights
+    m2_t = weights @ (stats.m2_t + stats.n * d_t**2) - n * mean_t**2
+    m2_p = weights @ (stats.m2_p + stats.n * d_p**2) - n * mean_p**2
+    c_tp = weights @ (stats.c_tp + stats.n * d_t * d_p) - n * mean_t * mean_p
+    return metrics.Stats(n, mean_t + centre.mean_t, mean_p + centre.mean_p, np.maximum(m2_t, 0), np.maximum(m2_p, 0),
+                         c_tp, weights @ stats.sse, weights @ stats.sse_nonzero)
+
+def _replicates(fields, n_replicates, block, seed):
+    """Metrics of a batch of replicates of each set of daily statistics, resampled with the same days."""
+    weights = block_weights(len(fields[0][0]), n_replicates, block, np.random.default_rng(seed))
+    return [weighted_reduce(metrics.Stats(*f), weights).metrics() for f in fields]
+
+def bootstrap(stats, n_replicates=1000, block=BLOCK_DAYS, seed=0, max_workers=None):
+    """Block bootstrap replicates of the metrics of daily statistics.
+
+    Days are resampled in blocks of consecutive days, and the metrics of
+    each replicate are computed from the daily statistics, so the arrays
+    are not read again. The replicates are shared out to a process pool.
+
+    Parameters
+    ----------
+    stats : unox.metrics.Stats or list of unox.metrics.Stats
+        Daily statistics of shape (time,), e.g. from run_daily_stats(). If
+        several are given, e.g. of two runs over the same days, all of them
+        are resampled with the same days, so their replicates are paired.
+    n_replicates : int
+        Number of replicates.
+    block : int
+        Number of consecutive days in each block.
+    seed : int
+        Seed of the resampling.
+    max_workers : int, optional
+        Number of processes. Defaults to the number of CPUs. 1 runs in this process.
+
+    Returns
+    -------
+    replicates : dict or list of dict
+        Metric name -> array of shape (n_replicates,), for each of the stats.
+
+    Examples
+    --------
+    >>> stats_a, stats_b = run_daily_stats('run_a'), run_daily_stats('run_b')
+    >>> a, b = bootstrap([stats_a, stats_b], n_replicates=5000)
+    >>> low, high = confidence_interval(a['r2'] - b['r2'])
+    """
+    single = isinstance(stats, metrics.Stats)
+    all_stats = [stats] if single else list(stats)
+    if len({len(s.n) for s in all_stats}) != 1:
+        raise ValueError("All statistics must have the same number of days.")
+    fields = [tuple(getattr(s, f) for f in metrics.FIELDS) for s in all_stats]
+    max_workers = max_workers or os.cpu_count() or 1
+    # Each batch has its own stream of random numbers, so the replicates do not depend on the number of processes
+    sizes = [BATCH] * (n_replicates // BATCH) + ([n_replicates % BATCH] if n_replicates % BATCH else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [fields] * len(sizes), sizes, [block] * len(sizes), seeds
+    if max_workers == 1 or len(sizes) == 1:
+        results = list(map(_replicates, *args))
+    else:
+        with ProcessPoolExecutor(min(max_workers, len(sizes))) as executor:
+            results = list(executor.map(_replicates, *args, chunksize=math.ceil(len(sizes) / max_workers)))
+    out = [{name: np.concatenate([r[k][name] for r in results]) for name in metrics.METRICS}
+           for k in range(len(all_stats))]
+    return out[0] if single else out
+
+def confidence_interval(samples, level=0.95):
+    """The percentile confidence interval of bootstrap replicates, ignoring NaN values."""
+    alpha = (1 - level) / 2
+    low, high = np.nanquantile(samples, [alpha, 1 - alpha])
+    return float(low), float(high)
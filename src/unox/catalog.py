@@ -0,0 +1,318 @@
+import os
+import re
+import sqlite3
+import hashlib
+import numpy as np
+
+# Directory of the catalog databases, and the environment variable that overrides it.
+#   The databases are kept out of the data directories, as writing them would change the
+#   mtime of the root directory and make every refresh list it again
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'unox')
+CACHE_VAR = 'UNOX_CACHE_DIR'
+
+# Patterns of the paths of the data files, relative to the root of the data directory
+SAMPLE_PATTERN = re.compile(r'stage(?P<stage>\d+)/(?P<kind>[xy])/[XY]_(?P<year>\d+)\.npy$')
+PRED_PATTERN = re.compile(r'(?P<run>[^/]+)/stage(?P<stage>\d+)_output/pred_X_(?P<year>\d+)(?:\.q)?\.npy$')
+RUN_PATTERN = re.compile(r'(?P<run>[^/]+)/')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime REAL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT,
+    kind TEXT,
+    stage INTEGER,
+    year INTEGER,
+    run TEXT,
+    shape TEXT,
+    dtype TEXT,
+    mtime REAL,
+    size INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+CREATE INDEX IF NOT EXISTS files_query ON files (kind, stage, year, run);
+"""
+
+# Open connections, one per process and database
+_connections = {}
+
+def catalog_path(root):
+    """Get the path of the catalog database of the given data directory.
+
+    The catalog is stored in ~/.cache/unox/, or in the directory given by
+    the UNOX_CACHE_DIR environment variable, under a name derived from the
+    absolute path of the data directory.
+
+    Parameters
+    ----------
+    root : str
+        Path to the data directory, e.g. 'HPC_runs/'.
+
+    Returns
+    -------
+    db_path : str
+        Path to the catalog database.
+    """
+    cache_dir = os.environ.get(CACHE_VAR, CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    key = hashlib.sha1(os.path.abspath(root).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f'catalog_{key}.sqlite')
+
+def connect(root):
+    """Open the catalog of the given data directory, creating it if needed.
+
+    Parameters
+    ----------
+    root : str
+        Path to the data directory.
+
+    Returns
+    -------
+    conn : sqlite3.Connection
+        Connection to the catalog database.
+    """
+    db_path = catalog_path(root)
+    key = (os.getpid(), os.path.abspath(db_path))
+    if key not in _connections:
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.executescript(SCHEMA)
+        _connections[key] = conn
+    return _connections[key]
+
+def parse_path(rel_path):
+    """Parse the stage, year, run and kind of data from a relative file path.
+
+    Parameters
+    ----------
+    rel_path : str
+        Path of the file, relative to the root of the data directory.
+
+    Returns
+    -------
+    info : dict
+        The 'kind' ('x', 'y', 'pred' or 'other'), 'stage', 'year' and 'run'
+        of the file. Values that do not apply are None.
+
+    Examples
+    --------
+    >>> parse_path('test_unet_601760/stage1_output/pred_X_2019.npy')
+    {'kind': 'pred', 'stage': 1, 'year': 2019, 'run': 'test_unet_601760'}
+    """
+    info = {'kind': 'other', 'stage': None, 'year': None, 'run': None}
+    match = PRED_PATTERN.search(rel_path)
+    if match:
+        info.update(kind='pred', stage=int(match['stage']), year=int(match['year']), run=match['run'])
+        return info
+    match = SAMPLE_PATTERN.search(rel_path)
+    if match:
+        info.update(kind=match['kind'], stage=int(match['stage']), year=int(match['year']))
+        return info
+    match = RUN_PATTERN.match(rel_path)
+    if match:
+        info['run'] = match['run']
+    return info
+
+def npy_header(file_path):
+    """Read the shape and dtype of a .npy file from its header.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the .npy file.
+
+    Returns
+    -------
+    shape : tuple or None
+        The shape of the array, or None if the file is not a valid .npy file.
+    dtype : str or None
+        The dtype of the array, or None if the file is not a valid .npy file.
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        return tuple(shape), dtype.str
+    except (ValueError, OSError):
+        return None, None
+
+def _scan_dir(conn, root, rel_dir, mtime):
+    """Update the entries of a single directory in the catalog.
+
+    Files whose size and mtime are unchanged are not read again.
+    Subdirectories that are new are returned, so the caller can scan them.
+    """
+    full_dir = os.path.join(root, rel_dir)
+    known = {row[0]: (row[1], row[2]) for row in
+             conn.execute('SELECT path, mtime, size FROM files WHERE dir = ?', (rel_dir,))}
+    known_dirs = {row[0] for row in conn.execute(
+        "SELECT path FROM dirs WHERE path != ? AND path LIKE ? ESCAPE '\\' AND path NOT LIKE ? ESCAPE '\\'",
+        (rel_dir, _like_prefix(rel_dir) + '%', _like_prefix(rel_dir) + '%/%'))}
+    seen_files, seen_dirs = set(), set()
+    new_dirs = []
+    for entry in os.scandir(full_dir):
+        # Exclude hidden files, as recursive_paths() does
+        if entry.name.startswith('.'):
+            continue
+        rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+        if entry.is_dir():
+            seen_dirs.add(rel_path)
+            if rel_path not in known_dirs:
+                new_dirs.append(rel_path)
+            continue
+        seen_files.add(rel_path)
+        stat = entry.stat()
+        if known.get(rel_path) == (stat.st_mtime, stat.st_size):
+            continue
+        info = parse_path(rel_path)
+        shape, dtype = npy_header(entry.path) if entry.name.endswith('.npy') else (None, None)
+        conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                     (rel_path, rel_dir, info['kind'], info['stage'], info['year'], info['run'],
+                      None if shape is None else str(shape), dtype, stat.st_mtime, stat.st_size))
+    # Remove files and directories that no longer exist
+    for rel_path in set(known) - seen_files:
+        conn.execute('DELETE FROM files WHERE path = ?', (rel_path,))
+    for rel_path in known_dirs - seen_dirs:
+        _forget_dir(conn, rel_path)
+    conn.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?)', (rel_dir, mtime))
+    return new_dirs
+
+def _like_prefix(rel_dir):
+    """The SQL LIKE prefix of the entries of the given directory."""
+    if not rel_dir:
+        return ''
+    return rel_dir.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '/'
+
+def _forget_dir(conn, rel_dir):
+    """Remove a directory and everything below it from the catalog."""
+    prefix = _like_prefix(rel_dir) + '%'
+    conn.execute("DELETE FROM files WHERE dir = ? OR dir LIKE ? ESCAPE '\\'", (rel_dir, prefix))
+    conn.execute("DELETE FROM dirs WHERE path = ? OR path LIKE ? ESCAPE '\\'", (rel_dir, prefix))
+
+def _refresh_dirs(conn, root, rel_dirs):
+    """Rescan the given directories whose mtime changed, and any new directories below them."""
+    queue = list(rel_dirs)
+    while queue:
+        rel_dir = queue.pop()
+        try:
+            mtime = os.stat(os.path.join(root, rel_dir)).st_mtime
+        except FileNotFoundError:
+            _forget_dir(conn, rel_dir)
+            continue
+        row = conn.execute('SELECT mtime FROM dirs WHERE path = ?', (rel_dir,)).fetchone()
+        if row is not None and row[0] == mtime:
+            continue
+        queue.extend(_scan_dir(conn, root, rel_dir, mtime))
+
+def refresh(root):
+    """Bring the catalog of the given data directory up to date.
+
+    Only directories whose mtime changed since the last refresh are
+    listed again, and only files that are new or changed are read.
+
+    Parameters
+    ----------
+    root : str
+        Path to the data directory.
+
+    Examples
+    --------
+    >>> refresh('HPC_runs/')
+    """
+    conn = connect(root)
+    with conn:
+        known = [row[0] for row in conn.execute("SELECT path FROM dirs WHERE path != ''")]
+        _refresh_dirs(conn, root, known + [''])
+
+def _relative(root, file_path):
+    """Path of file_path relative to root."""
+    return os.path.relpath(file_path, root).replace(os.sep, '/')
+
+def _row_to_dict(root, row):
+    """Convert a row of the files table to a dictionary with the full path."""
+    path, rel_dir, kind, stage, year, run, shape, dtype, mtime, size = row
+    return {'path': os.path.join(root, path), 'kind': kind, 'stage': stage, 'year': year, 'run': run,
+            'shape': None if shape is None else tuple(int(n) for n in shape.strip('()').split(',') if n.strip()),
+            'dtype': dtype, 'mtime': mtime, 'size': size}
+
+def lookup(file_path, root):
+    """Look up a single file in the catalog.
+
+    Only the directory containing the file is checked for changes,
+    so the cost does not depend on the number of files in root.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the file, including root.
+    root : str
+        Path to the data directory.
+
+    Returns
+    -------
+    entry : dict or None
+        The catalog entry of the file with 'path', 'kind', 'stage', 'year',
+        'run', 'shape', 'dtype', 'mtime' and 'size', or None if the file
+        is not in root.
+
+    Examples
+    --------
+    >>> entry = lookup('HPC_runs/test_unet_601760/stage1_output/pred_X_2019.npy', 'HPC_runs/')
+    """
+    rel_path = _relative(root, file_path)
+    if rel_path.startswith('..'):
+        return None
+    rel_dir = os.path.dirname(rel_path)
+    conn = connect(root)
+    with conn:
+        _refresh_dirs(conn, root, [rel_dir])
+        row = conn.execute('SELECT * FROM files WHERE path = ?', (rel_path,)).fetchone()
+        # Overwriting a file does not change the mtime of its directory, so check the file itself
+        if row is not None:
+            stat = os.stat(file_path)
+            if (row[8], row[9]) != (stat.st_mtime, stat.st_size):
+                _scan_dir(conn, root, rel_dir, os.stat(os.path.join(root, rel_dir)).st_mtime)
+                row = conn.execute('SELECT * FROM files WHERE path = ?', (rel_path,)).fetchone()
+    if row is None:
+        return None
+    return _row_to_dict(root, row)
+
+def list_files(root, kind=None, stage=None, year=None, run=None):
+    """List the files in the catalog that match the given values.
+
+    Parameters
+    ----------
+    root : str
+        Path to the data directory.
+    kind : str, optional
+        'x', 'y', 'pred' or 'other'.
+    stage : int, optional
+        Stage of the data (1 or 2).
+    year : int, optional
+        Year of the data.
+    run : str, optional
+        ID of the HPC run.
+
+    Returns
+    -------
+    entries : list of dict
+        The catalog entries, as returned by lookup(), sorted by path.
+
+    Examples
+    --------
+    >>> entries = list_files('HPC_runs/', kind='pred', stage=1, year=2019)
+    """
+    refresh(root)
+    query, values = [], []
+    for column, value in (('kind', kind), ('stage', stage), ('year', year), ('run', run)):
+        if value is not None:
+            query.append(f'{column} = ?')
+            values.append(value)
+    where = ' WHERE ' + ' AND '.join(query) if query else ''
+    rows = connect(root).execute(f'SELECT * FROM files{where} ORDER BY path', values).fetchall()
+    return [_row_to_dict(root, row) for row in rows]
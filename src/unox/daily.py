@@ -0,0 +1,541 @@
+"""Incremental, day-by-day creation of Unet inputs and predictions.
+
+`datafiles/inputfiles.py` builds the input files one year at a time. The
+functions in this module build the input for a single day instead, so that
+an operational update costs one day of work rather than one year.
+"""
+import calendar
+import datetime
+import functools
+import os
+import numpy as np
+
+from unox import unox
+from unox import grid as ugrid
+
+# Number of days in each X, Y and prediction file.
+#   Day t starts on January 2nd so that day t-1 is January 1st,
+#   and February 29th is dropped (see datafiles/README.md)
+N_DAYS = 364
+# Names of the channels of the X input files, in order
+CHANNELS = ['no2', 'no2_tm1', 'u10', 'v10', 'blh', 'sp', 'skt', 't2m', 'ssrd']
+# ERA5 variables in the X input files, in order
+ERA5_VARIABLES = CHANNELS[2:]
+# Rescaling of the ERA5 variables, as done in xinput
+ERA5_SCALES = {'blh': 1/1000, 'sp': 1/100000, 'ssrd': 1/1000000}
+
+def to_date(date):
+    """Convert the given date to a datetime.date.
+
+    Parameters
+    ----------
+    date : str, datetime.date, datetime.datetime or numpy.datetime64
+        The date to convert. Strings must be in ISO format, e.g. '2019-07-19'.
+
+    Returns
+    -------
+    date : datetime.date
+        The converted date.
+
+    Examples
+    --------
+    >>> to_date('2019-07-19T00:00:00')
+    datetime.date(2019, 7, 19)
+    """
+    if isinstance(date, np.datetime64):
+        date = str(date.astype('datetime64[D]'))
+    if isinstance(date, str):
+        date = datetime.date.fromisoformat(date[:10])
+    if isinstance(date, datetime.datetime):
+        date = date.date()
+    if not isinstance(date, datetime.date):
+        raise TypeError(f"Cannot convert {date!r} to a date.")
+    return date
+
+def day_index(date):
+    """Get the index along the time axis of an input file for the given date.
+
+    Maps a date onto the noleap calendar used by the X, Y and prediction
+    files, in which index 0 is January 2nd and February 29th is dropped.
+
+    Parameters
+    ----------
+    date : str, datetime.date, datetime.datetime or numpy.datetime64
+        The date to find the index of.
+
+    Returns
+    -------
+    year : int
+        The year of the file that contains the date.
+    index : int
+        The index of the date along the time axis of that file.
+
+    Examples
+    --------
+    >>> day_index('2019-01-02')
+    (2019, 0)
+    >>> day_index('2020-12-31')
+    (2020, 363)
+    """
+    date = to_date(date)
+    if date.month == 2 and date.day == 29:
+        raise ValueError(f"February 29th is not in the input files, date = {date}.")
+    if date.month == 1 and date.day == 1:
+        raise ValueError(f"January 1st is only used as day t-1, date = {date}.")
+    # Count the days since January 2nd, skipping February 29th
+    index = (date - datetime.date(date.year, 1, 2)).days
+    if date.month > 2 and calendar.isleap(date.year):
+        index -= 1
+    return date.year, index
+
+def index_date(year, index):
+    """Get the date at the given index along the time axis of an input file.
+
+    The inverse of day_index().
+
+    Parameters
+    ----------
+    year : int
+        The year of the file.
+    index : int
+        The index along the time axis of the file, in the range [0, 364).
+
+    Returns
+    -------
+    date : datetime.date
+        The date at that index.
+
+    Examples
+    --------
+    >>> index_date(2020, 363)
+    datetime.date(2020, 12, 31)
+    """
+    if index < 0 or index >= N_DAYS:
+        raise ValueError(f"Index must be in the range [0, {N_DAYS}), index = {index}.")
+    date = datetime.date(year, 1, 2) + datetime.timedelta(days=int(index))
+    # Skip February 29th in leap years
+    if calendar.isleap(year) and date >= datetime.date(year, 2, 29):
+        date += datetime.timedelta(days=1)
+    return date
+
+@functools.lru_cache(maxsize=32)
+def _axis_weights(src_bytes, dst_bytes):
+    """Cached worker for axis_weights(), keyed on the raw coordinate bytes."""
+    src = np.frombuffer(src_bytes, dtype=np.float64)
+    dst = np.frombuffer(dst_bytes, dtype=np.float64)
+    # Sort the source coordinates, as they may be descending (ERA5 latitude)
+    #   or shifted to a different longitude convention (TCR-2)
+    order = np.argsort(src, kind='stable')
+    s_src = src[order]
+    # Find the source points on either side of each destination point
+    hi = np.clip(np.searchsorted(s_src, dst), 1, len(s_src) - 1)
+    lo = hi - 1
+    weight = (dst - s_src[lo]) / (s_src[hi] - s_src[lo])
+    # Destination points outside of the source range become NaN, as with xarray's interp
+    valid = (dst >= s_src[0]) & (dst <= s_src[-1])
+    lo, hi = order[lo], order[hi]
+    for arr in (lo, hi, weight, valid):
+        arr.setflags(write=False)
+    return lo, hi, weight, valid
+
+def axis_weights(src, dst):
+    """Get the linear interpolation operator from one coordinate axis to another.
+
+    The operators are cached, so they are only computed once per pair of axes.
+
+    Parameters
+    ----------
+    src : numpy.ndarray
+        The source coordinate values. Need not be sorted.
+    dst : numpy.ndarray
+        The destination coordinate values.
+
+    Returns
+    -------
+    lo : numpy.ndarray
+        Index into src of the lower neighbour of each destination point.
+    hi : numpy.ndarray
+        Index into src of the upper neighbour of each destination point.
+    weight : numpy.ndarray
+        Weight of the upper neighbour of each destination point.
+    valid : numpy.ndarray
+        False where the destination point is outside of the source range.
+    """
+    src = np.ascontiguousarray(src, dtype=np.float64)
+    dst = np.ascontiguousarray(dst, dtype=np.float64)
+    return _axis_weights(src.tobytes(), dst.tobytes())
+
+def regrid(field, src_lats, src_lons, lats, lons):
+    """Bilinearly interpolate the given field onto the Unet grid.
+
+    Gives the same result as `xarray.Dataset.interp(lat=lats, lon=lons)`,
+    but reuses the cached operators from axis_weights().
+
+    Parameters
+    ----------
+    field : numpy.ndarray
+        The field to regrid, of shape (..., len(src_lats), len(src_lons)).
+    src_lats : numpy.ndarray
+        The latitude values of the field.
+    src_lons : numpy.ndarray
+        The longitude values of the field.
+    lats : numpy.ndarray
+        The latitude values to interpolate to.
+    lons : numpy.ndarray
+        The longitude values to interpolate to.
+
+    Returns
+    -------
+    regridded : numpy.ndarray
+        The field of shape (..., len(lats), len(lons)).
+
+    Examples
+    --------
+    >>> lats, lons = unox.load_lats_lons()
+    >>> regridded = regrid(field, era5.latitude.values, era5.longitude.values, lats, lons)
+    """
+    field = np.asarray(field, dtype=np.float64)
+    y0, y1, wy, vy = axis_weights(src_lats, lats)
+    x0, x1, wx, vx = axis_weights(src_lons, lons)
+    # Gather the four neighbours of each destination point
+    wy = wy[:, None]
+    regridded = ((1 - wy) * (1 - wx) * field[..., y0[:, None], x0]
+                 + (1 - wy) * wx * field[..., y0[:, None], x1]
+                 + wy * (1 - wx) * field[..., y1[:, None], x0]
+                 + wy * wx * field[..., y1[:, None], x1])
+    regridded[..., ~(vy[:, None] & vx)] = np.nan
+    return regridded
+
+@functools.lru_cache(maxsize=4)
+def _read_epa(csvfile, mtime):
+    """Read and cache an EPA csv file. The mtime is part of the cache key."""
+    import pandas as pd
+    epa = pd.read_csv(csvfile, usecols=['Date Local', 'Latitude', 'Longitude', 'Arithmetic Mean'])
+    epa['Date Local'] = pd.to_datetime(epa['Date Local']).dt.date
+    return epa
+
+def add_epa_day(no2, tcr2_lats, tcr2_lons, csvfile, date, lats, lons):
+    """Replace TCR-2 NO2 values with EPA data for a single day.
+
+    The single-day, vectorized equivalent of make2d() in datafiles/inputfiles.py.
+    Each EPA measurement replaces the value of the nearest TCR-2 grid point
+    within one grid cell, on the part of the TCR-2 grid north of the southern
+    edge and west of the eastern edge of the Unet domain.
+
+    Parameters
+    ----------
+    no2 : numpy.ndarray
+        TCR-2 NO2 values of shape (len(tcr2_lats), len(tcr2_lons)). Modified in place.
+    tcr2_lats : numpy.ndarray
+        The latitude values of the TCR-2 grid.
+    tcr2_lons : numpy.ndarray
+        The longitude values of the TCR-2 grid, in the range [-180, 180].
+    csvfile : str
+        Path to the EPA daily NO2 csv file.
+    date : datetime.date
+        The day to take from the EPA data.
+    lats : numpy.ndarray
+        The latitude values of the Unet grid.
+    lons : numpy.ndarray
+        The longitude values of the Unet grid.
+
+    Returns
+    -------
+    no2 : numpy.ndarray
+        The NO2 values with the EPA data added.
+    """
+    epa = _read_epa(csvfile, os.path.getmtime(csvfile))
+    today = epa[epa['Date Local'] == date]
+    # Grid points that make2d() selects from. The longitudes are not sorted
+    #   after the change of convention, so sort them for the lookup
+    lat_idx = np.where(tcr2_lats >= np.min(lats))[0]
+    lon_idx = np.where(tcr2_lons <= np.max(lons))[0]
+    lon_idx = lon_idx[np.argsort(tcr2_lons[lon_idx], kind='stable')]
+    # Find the nearest grid point within one grid cell of each measurement
+    grid = ugrid.Grid(tcr2_lats[lat_idx], tcr2_lons[lon_idx])
+    i, j = grid.index(today['Latitude'].values, today['Longitude'].values, tolerance=1.125)
+    keep = (i >= 0) & (j >= 0)
+    i, j = lat_idx[i], lon_idx[j]
+    no2[i[keep], j[keep]] = today['Arithmetic Mean'].values[keep]
+    return no2
+
+def tcr2_day(date, stage=1, datadir='.', lats=None, lons=None):
+    """Get the daily mean surface NO2 for one day on the Unet grid.
+
+    Reads only the time steps of the given day from the TCR-2 file. For
+    stage 2, the EPA measurements of that day are added as in xinput().
+
+    Parameters
+    ----------
+    date : str or datetime.date
+        The day to get.
+    stage : int
+        Stage of the data (1 or 2).
+    datadir : str
+        Path to the directory containing the TROPESS/ and US_EPA/ directories.
+    lats : numpy.ndarray, optional
+        The latitude values of the Unet grid. Loaded from datadir if not given.
+    lons : numpy.ndarray, optional
+        The longitude values of the Unet grid. Loaded from datadir if not given.
+
+    Returns
+    -------
+    no2 : numpy.ndarray
+        Surface NO2 of shape (len(lats), len(lons)).
+    """
+    import xarray as xr
+    date = to_date(date)
+    if lats is None or lons is None:
+        lats, lons = unox.load_lats_lons(datadir)
+    with xr.open_dataset(f'{datadir}/TROPESS/TROPESS_reanalysis_2hr_no2_sfc_{date.year}.nc') as tcr2:
+        # The year in the TCR-2 files is unreliable, so find the time steps
+        #   of the day by the position of the day within the file, as xinput() does
+        days, day_of_step = np.unique(tcr2.time.values.astype('datetime64[D]'), return_inverse=True)
+        steps = np.where(day_of_step == (date - datetime.date(date.year, 1, 1)).days)[0]
+        if len(steps) == 0:
+            raise ValueError(f"No TCR-2 data for {date}.")
+        no2 = tcr2.no2.isel(time=steps).mean('time').transpose('lat', 'lon').values / 1000
+        tcr2_lats = tcr2.lat.values
+        # Change longitude coordinate convention to match other data
+        tcr2_lons = (tcr2.lon.values + 180) % 360 - 180
+    if stage == 2:
+        no2 = add_epa_day(no2, tcr2_lats, tcr2_lons, f'{datadir}/US_EPA/daily_42602_{date.year}.csv', date, lats, lons)
+    return regrid(no2, tcr2_lats, tcr2_lons, lats, lons)
+
+def era5_day(date, variable, era5dir, lats, lons):
+    """Get the daily mean of an ERA5 variable for one day on the Unet grid.
+
+    Reads only the time steps of the given day from the monthly ERA5 file,
+    as downloaded by datafiles/download_era5.py.
+
+    Parameters
+    ----------
+    date : str or datetime.date
+        The day to get.
+    variable : str
+        The ERA5 variable short name, e.g. 'u10'.
+    era5dir : str
+        Path to the directory containing the <year>/ directories of ERA5 files.
+    lats : numpy.ndarray
+        The latitude values of the Unet grid.
+    lons : numpy.ndarray
+        The longitude values of the Unet grid.
+
+    Returns
+    -------
+    field : numpy.ndarray
+        The rescaled daily mean of shape (len(lats), len(lons)).
+    """
+    import xarray as xr
+    date = to_date(date)
+    path = f'{era5dir}/{date.year}/{date.year}_{date.month:02d}_{variable}.nc'
+    with xr.open_dataset(path) as era5:
+        steps = np.where(era5.valid_time.values.astype('datetime64[D]') == np.datetime64(date))[0]
+        if len(steps) == 0:
+            raise ValueError(f"No ERA5 {variable} data for {date} in {path}.")
+        field = getattr(era5, variable).isel(valid_time=steps).transpose('valid_time', 'latitude', 'longitude').values
+        # Regridding is linear, so regrid each time step and then take the daily mean
+        field = regrid(field, era5.latitude.values, era5.longitude.values, lats, lons).mean(axis=0)
+    return field * ERA5_SCALES.get(variable, 1)
+
+def open_day_store(file_path, shape, dtype=np.float64):
+    """Open a year file to read or write single days.
+
+    Opens the given .npy file memory-mapped. If it does not exist yet,
+    it is created with all values set to NaN, marking days that have not
+    been written.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the .npy file.
+    shape : tuple
+        The shape of a single day, e.g. (56, 120, 9).
+    dtype : numpy.dtype
+        The data type of a new file.
+
+    Returns
+    -------
+    store : numpy.memmap
+        The memory-mapped year of shape (N_DAYS, *shape).
+    """
+    if os.path.exists(file_path):
+        store = np.load(file_path, mmap_mode='r+')
+        if store.shape != (N_DAYS, *shape):
+            raise ValueError(f"{file_path} has shape {store.shape}, expected {(N_DAYS, *shape)}.")
+        return store
+    os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+    store = np.lib.format.open_memmap(file_path, mode='w+', dtype=dtype, shape=(N_DAYS, *shape))
+    store[:] = np.nan
+    return store
+
+def write_day(file_path, date, values, dtype=np.float64):
+    """Write a single day into a year file.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the .npy year file. Created if it does not exist.
+    date : str or datetime.date
+        The day to write.
+    values : numpy.ndarray
+        The values of the day.
+    dtype : numpy.dtype
+        The data type of a new file.
+    """
+    year, index = day_index(date)
+    store = open_day_store(file_path, np.shape(values), dtype)
+    store[index] = values
+    store.flush()
+    del store
+
+def read_day(file_path, date):
+    """Read a single day from a year file.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the .npy year file.
+    date : str or datetime.date
+        The day to read.
+
+    Returns
+    -------
+    values : numpy.ndarray or None
+        The values of the day, or None if the file or the day is missing.
+    """
+    year, index = day_index(date)
+    if not os.path.exists(file_path):
+        return None
+    values = np.array(np.load(file_path, mmap_mode='r')[index])
+    if np.isnan(values).all():
+        return None
+    return values
+
+def x_path(store_dir, stage, year):
+    """Path of the X input file of the given stage and year in store_dir."""
+    return f'{store_dir}/stage{stage}/x/X_{year}.npy'
+
+def pred_path(run_dir, stage, year):
+    """Path of the prediction file of the given stage and year in run_dir."""
+    return f'{run_dir}/stage{stage}_output/pred_X_{year}.npy'
+
+def xinput_day(date, stage, datadir='.', era5dir='.', store_dir='inputfiles'):
+    """Build the X input for a single day.
+
+    The single-day equivalent of xinput() in datafiles/inputfiles.py.
+    The day t-1 NO2 channel is taken from the day t NO2 channel of the
+    previous day in the store, when that day has already been processed.
+
+    Parameters
+    ----------
+    date : str or datetime.date
+        The day t to build the input for.
+    stage : int
+        Stage of the data (1 or 2).
+    datadir : str
+        Path to the directory containing lats.npy, lons.npy, TROPESS/ and US_EPA/.
+    era5dir : str
+        Path to the directory containing the <year>/ directories of ERA5 files.
+    store_dir : str
+        Path to the directory containing the stage<stage>/x/ X input files.
+
+    Returns
+    -------
+    x_day : numpy.ndarray
+        The input of shape (len(lats), len(lons), len(CHANNELS)).
+
+    Examples
+    --------
+    >>> x_day = xinput_day('2019-07-19', stage=2)
+    """
+    date = to_date(date)
+    lats, lons = unox.load_lats_lons(datadir)
+    x_day = np.empty((len(lats), len(lons), len(CHANNELS)))
+    # Day t NO2
+    x_day[:, :, 0] = tcr2_day(date, stage, datadir, lats, lons)
+    # Day t-1 NO2, reused from the store when available.
+    #   January 1st and February 29th are never stored as day t, so they are always computed,
+    #   as xinput() only drops the February 29th rows after the shift
+    previous = date - datetime.timedelta(days=1)
+    stored = None
+    if not ((previous.month == 1 and previous.day == 1) or (previous.month == 2 and previous.day == 29)):
+        stored = read_day(x_path(store_dir, stage, previous.year), previous)
+    if stored is not None:
+        x_day[:, :, 1] = stored[:, :, 0]
+    else:
+        x_day[:, :, 1] = tcr2_day(previous, stage, datadir, lats, lons)
+    # Meteorological fields for day t
+    for i, variable in enumerate(ERA5_VARIABLES):
+        x_day[:, :, 2+i] = era5_day(date, variable, era5dir, lats, lons)
+    return x_day
+
+def predict_day(model, x_day):
+    """Predict a single day with the given model.
+
+    Parameters
+    ----------
+    model : model.core.Unet or keras.Model
+        Any model with a predict() method taking a batch of inputs.
+    x_day : numpy.ndarray
+        The input of a single day, of shape (lat, lon, channels).
+
+    Returns
+    -------
+    pred : numpy.ndarray
+        The prediction of shape (lat, lon, 1).
+    """
+    return np.asarray(model.predict(x_day[np.newaxis]))[0]
+
+def update_day(date, model, stage, run_dir, datadir='.', era5dir='.', store_dir='inputfiles'):
+    """Process one new day: build its input, store it and predict it.
+
+    Builds the X input of the day with xinput_day(), writes it into the
+    X input file of its year in store_dir, predicts the day and writes the
+    prediction into the prediction file of its year in run_dir, updating
+    its monthly, seasonal and annual rollups and its quantile sketch, and
+    the pixel stores of both files if they exist, see unox.pixels.
+
+    Parameters
+    ----------
+    date : str or datetime.date
+        The new day.
+    model : model.core.Unet or keras.Model
+        The trained model of the given stage.
+    stage : int
+        Stage of the data (1 or 2).
+    run_dir : str
+        Path to the run directory to write predictions in, e.g. 'HPC_runs/test_unet_601760'.
+    datadir : str
+        Path to the directory containing lats.npy, lons.npy, TROPESS/ and US_EPA/.
+    era5dir : str
+        Path to the directory containing the <year>/ directories of ERA5 files.
+    store_dir : str
+        Path to the directory containing the stage<stage>/x/ X input files.
+
+    Returns
+    -------
+    pred : numpy.ndarray
+        The prediction of the day, of shape (lat, lon, 1).
+
+    Examples
+    --------
+    >>> unet = Unet()
+    >>> unet.load_weights('HPC_runs/test_unet_601760/unet_stage2_model.h5')
+    >>> pred = update_day('2021-07-19', unet, 2, 'HPC_runs/test_unet_601760')
+    """
+    date = to_date(date)
+    x_day = xinput_day(date, stage, datadir, era5dir, store_dir)
+    write_day(x_path(store_dir, stage, date.year), date, x_day)
+    pred = predict_day(model, x_day)
+    write_day(pred_path(run_dir, stage, date.year), date, pred, dtype=pred.dtype)
+    # unox.rollups, unox.sketch and unox.pixels read the year files through unox.loaders, which imports this module
+    from unox import pixels
+    from unox import rollups
+    from unox import sketch
+    rollups.update_rollup(pred_path(run_dir, stage, date.year), date)
+    # A sketch cannot forget the old values of the day, so it is built again from the file
+    sketch.sketch_file(pred_path(run_dir, stage, date.year))
+    pixels.update_day(x_path(store_dir, stage, date.year), date)
+    pixels.update_day(pred_path(run_dir, stage, date.year), date)
+    return pred
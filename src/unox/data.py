@@ -1,6 +1,8 @@
 import numpy as np
-import xarray as xr
-import warnings
+
+from unox import grid as ugrid
+from unox import reducers as ureducers
+from unox import regions as uregions
 
 def get_extent(xr_dataset,
                shift_lons=False):
@@ -57,6 +59,8 @@ def get_lats_lons(xr_dataset,
     ----------
     xr_dataset : xarray.Dataset or xarray.DataArray
         The xarray data to verify.
+    shift_lons : bool, optional
+        If True, shift the longitude values from the range [0, 360] to [-180, 180].
 
     Returns
     -------
@@ -65,6 +69,12 @@ def get_lats_lons(xr_dataset,
     lons : numpy.ndarray
         Array of longitude values.
 
+    Raises
+    ------
+    ValueError
+        If any latitude is outside [-90, 90], or any longitude is outside
+        [-180, 180] (or [-180, 360] if shift_lons is False), or not finite.
+
     Examples
     --------
     >>> lats, lons = get_lats_lons()
@@ -74,11 +84,14 @@ def get_lats_lons(xr_dataset,
     # Get the latitude and longitude values
     lats = xr_dataset.lat.values
     lons = xr_dataset.lon.values
-    # Verify the latitude and longitude values
-    map(verify_lat, lats)
+    # Verify the latitude and longitude values, in a single pass over each array
+    lats = verify_lat_array(lats)
     if shift_lons:
-        lons = np.array(list(map(shift_lon, lons)))
-    map(verify_lon, lons)
+        lons = shift_lon_array(lons)
+        lons = verify_lon_array(lons)
+    else:
+        # Without shifting, the longitudes may be in either convention
+        lons = verify_lon_array(lons, lon_range=(-180, 360))
     return lats, lons
 
 # def compare_lats_lons((lats1, lons1), (lats2, lons2)):
@@ -94,7 +107,9 @@ def verify_dataset(xr_dataset):
     xr_dataset : xarray.Dataset or xarray.DataArray
         The xarray data to verify.
     """
-    # Verify that xr_dataset is an xarray Dataset or DataArray
+    # Verify that xr_dataset is an xarray Dataset or DataArray. xarray is
+    #   imported here rather than with the module, to keep imports cheap
+    import xarray as xr
     if not isinstance(xr_dataset, xr.Dataset) and not isinstance(xr_dataset, xr.DataArray):
         raise TypeError("xr_dataset must be an xarray Dataset or DataArray.")
     # Verify that the dataset has lat and lon coordinates
@@ -146,13 +161,14 @@ def clean_num_list(val_list):
 
     Parameters
     ----------
-    val_list : list
+    val_list : list or numpy.ndarray
         The list of values to clean.
 
     Returns
     -------
-    return_list : list
-        The cleaned list of values.
+    return_list : list or numpy.ndarray
+        The cleaned list of values. For a numeric numpy array, the
+        flattened array of its finite values.
 
     Examples
     --------
@@ -161,6 +177,12 @@ def clean_num_list(val_list):
     >>> val_list = clean_list([1, 2, 3, np.nan, None, np.inf, -np.inf])
     [1, 2, 3]
     """
+    # Arrays of numbers are cleaned in a single pass
+    if isinstance(val_list, np.ndarray) and val_list.dtype.kind in 'biuf':
+        return_list = val_list[np.isfinite(val_list)]
+        if len(return_list) == 0:
+            raise ValueError("No valid numbers in the input list.")
+        return return_list
     # Create an empty list to store cleaned values
     return_list = []
     for val in val_list:
@@ -266,23 +288,156 @@ def shift_lon(lon_value):
         raise ValueError(f"Longitude value must be in the range [0, 360], lon_value = {lon_value}.")
     return lon_value - 180
 
-def get_vminmax(arrays):
+def _verify_range(values, lo, hi, name):
+    """Verify that all values are finite numbers in [lo, hi], in a single pass.
+
+    Returns the values as a numpy array. The error message gives the
+    indices and values of the first offending entries.
+    """
+    arr = np.asarray(values)
+    if arr.dtype.kind not in 'biuf':
+        try:
+            arr = arr.astype(np.float64)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} values must be numbers, got an array of {arr.dtype}.") from None
+    with np.errstate(invalid='ignore'):
+        bad = ~np.isfinite(arr) | (arr < lo) | (arr > hi)
+    if bad.any():
+        where = np.argwhere(bad)[:5]
+        index = [tuple(int(i) for i in w) if arr.ndim > 1 else int(w[0]) for w in where]
+        raise ValueError(f"{name} values must be finite and in the range [{lo}, {hi}], but {int(bad.sum())} "
+                         f"of {arr.size} are not, e.g. {arr[bad][:5].tolist()} at indices {index}.")
+    return arr
+
+def verify_lat_array(lats):
+    """Verify that all the given latitude values are valid.
+
+    The array equivalent of verify_lat(), checking the whole array in a
+    single NumPy pass.
+
+    Parameters
+    ----------
+    lats : array_like
+        The latitude values to verify.
+
+    Returns
+    -------
+    lats : numpy.ndarray
+        The verified latitude values.
+
+    Raises
+    ------
+    ValueError
+        If any value is not a finite number in the range [-90, 90]. The
+        message gives the indices of the offending values.
+
+    Examples
+    --------
+    >>> lats = verify_lat_array(np.load('datafiles/lats.npy'))
+    """
+    return _verify_range(lats, -90, 90, 'Latitude')
+
+def verify_lon_array(lons, lon_range=(-180, 180)):
+    """Verify that all the given longitude values are valid.
+
+    The array equivalent of verify_lon(), checking the whole array in a
+    single NumPy pass.
+
+    Parameters
+    ----------
+    lons : array_like
+        The longitude values to verify.
+    lon_range : tuple, optional
+        The (min, max) range of valid values. Use (0, 360) or (-180, 360)
+        for data in the [0, 360] convention.
+
+    Returns
+    -------
+    lons : numpy.ndarray
+        The verified longitude values.
+
+    Raises
+    ------
+    ValueError
+        If any value is not a finite number in lon_range. The message
+        gives the indices of the offending values.
+
+    Examples
+    --------
+    >>> lons = verify_lon_array(np.load('datafiles/lons.npy'))
+    """
+    return _verify_range(lons, lon_range[0], lon_range[1], 'Longitude')
+
+def shift_lon_array(lons):
+    """Shift all the given longitude values from the range [0, 360] to [-180, 180].
+
+    The array equivalent of shift_lon().
+
+    Parameters
+    ----------
+    lons : array_like
+        The longitude values to shift.
+
+    Returns
+    -------
+    lons : numpy.ndarray
+        The shifted longitude values.
+
+    Raises
+    ------
+    ValueError
+        If any value is not a finite number in the range [0, 360].
+
+    Examples
+    --------
+    >>> lons = shift_lon_array([0, 45.3, 200, 360])
+    array([-180. , -134.7,   20. ,  180. ])
+    """
+    return _verify_range(lons, 0, 360, 'Longitude') - 180
+
+def verify_coords(xr_dataset, lon_range=(-180, 360)):
+    """Verify the dataset and all of its latitude and longitude values.
+
+    Parameters
+    ----------
+    xr_dataset : xarray.Dataset or xarray.DataArray
+        The xarray data to verify.
+    lon_range : tuple, optional
+        The (min, max) range of valid longitude values. The default accepts
+        both the [-180, 180] and [0, 360] conventions.
+
+    Raises
+    ------
+    TypeError, ValueError
+        If the dataset or any of its coordinate values is invalid.
+    """
+    verify_dataset(xr_dataset)
+    verify_lat_array(xr_dataset.lat.values)
+    verify_lon_array(xr_dataset.lon.values, lon_range)
+
+def get_vminmax(arrays, percentiles=None):
     """Get the minimum and maximum values across the given arrays.
 
-    Flattens and concatenates the given arrays and returns the minimum
-    and maximum values, ignoring NaN values.
+    Streams over the given arrays chunk by chunk, in parallel, and returns
+    the minimum and maximum values, ignoring NaN values. The arrays are
+    never concatenated, so they can be large memory-mapped files.
 
     Parameters
     ----------
     arrays : list of numpy.ndarray
         The arrays to get the minimum and maximum values from.
+    percentiles : tuple of float, optional
+        (lower, upper) percentiles to return instead of the minimum and
+        maximum, e.g. (1, 99) for a colour range that a few outlier cells
+        do not dominate. They are estimated with quantile sketches, see
+        unox.reducers.Summary.quantile().
 
     Returns
     -------
     vmin : float
-        The minimum value across the arrays.
+        The minimum value, or the lower percentile, across the arrays.
     vmax : float
-        The maximum value across the arrays.
+        The maximum value, or the upper percentile, across the arrays.
 
     Examples
     --------
@@ -290,17 +445,15 @@ def get_vminmax(arrays):
     >>> vmin, vmax = get_vminmax(arrays)
     (1, 6)
     """
-    # Flatten and concatenate the arrays
-    flat_arrays = np.concatenate([arr.flatten() for arr in arrays])
-    # Get the minimum and maximum values
-    #   Catch warning for all-NaN arrays
-    with warnings.catch_warnings():
-        warnings.filterwarnings('error', category=RuntimeWarning)
-        try:
-            vmin = np.nanmin(flat_arrays)
-            vmax = np.nanmax(flat_arrays)
-        except RuntimeWarning as e:
-            raise ValueError(f"{e}. Does input array contain any non-NaN values?")
+    summary = ureducers.summarize(arrays, quantiles=percentiles is not None)
+    if summary.count == 0:
+        raise ValueError("All values are NaN. Does input array contain any non-NaN values?")
+    if percentiles is None:
+        return summary.min, summary.max
+    lower, upper = percentiles
+    if not 0 <= lower <= upper <= 100:
+        raise ValueError(f"The percentiles {percentiles} are not increasing values between 0 and 100.")
+    vmin, vmax = summary.quantile([lower / 100, upper / 100])
     return vmin, vmax
 
 def get_max_abs_val(val_list):
@@ -348,8 +501,10 @@ def restrict_domain(arrs_to_restrict, lats, lons, restricting_data):
         The latitude values of the arrays to restrict.
     lons : numpy.ndarray
         The longitude values of the arrays to restrict.
-    restricting_data : xarray.Dataset or xarray.DataArray
-        The dataset to restrict the arrays to.
+    restricting_data : xarray.Dataset or xarray.DataArray or unox.regions.Region
+        The dataset to restrict the arrays to, or a region of their grid.
+        Cells of the bounding box of a region that are outside it are set
+        to NaN.
     
     Returns
     -------
@@ -367,20 +522,21 @@ def restrict_domain(arrs_to_restrict, lats, lons, restricting_data):
     >>> nox = xr.open_dataset('datafiles/nox_2019_t106_US.nc')
     >>> stage1_restricted = restrict_domain([nox], lats, lons, nox)
     """
+    if isinstance(restricting_data, uregions.Region):
+        region = restricting_data
+        if not (np.array_equal(region.grid.lats, lats) and np.array_equal(region.grid.lons, lons)):
+            raise ValueError("The region is not on the grid of the arrays.")
+        return region.masked(arrs_to_restrict), region.lats, region.lons
+
     # Get the latitude and longitude values from the restricting data
     lat_r, lon_r = get_lats_lons(restricting_data)
 
-    # I feel like this should work, but I can't figure it out right now
-    this_extent = get_extent(restricting_data)
-
-    # Find indices of lats and lons that are in the restricting data
-    latmin = np.where(np.abs(lats-np.min(lat_r))<0.1)[0][0]
-    latmax = np.where(np.abs(lats-np.max(lat_r))<0.1)[0][0] + 1
-    lonmin = np.where(np.abs(lons-np.min(lon_r))<0.1)[0][0]
-    lonmax = np.where(np.abs(lons-np.max(lon_r))<0.1)[0][0] + 1
+    # Find the box of grid points of the restricting data
+    try:
+        region = uregions.box_region((np.min(lat_r), np.max(lat_r), np.min(lon_r), np.max(lon_r)),
+                                     ugrid.Grid(lats, lons), tolerance=0.1)
+    except ValueError:
+        raise ValueError("The extent of the restricting data is not on the grid of the arrays.")
 
     # Narrow the data to just this region
-    arrs_to_return = []
-    for arr in arrs_to_restrict:
-        arrs_to_return.append(arr[:,latmin:latmax,lonmin:lonmax,:])
-    return arrs_to_return, lat_r, lon_r
\ No newline at end of file
+    return region.view(list(arrs_to_restrict)), lat_r, lon_r
@@ -0,0 +1,229 @@
+import functools
+import os
+import numpy as np
+
+# Mean radius of the Earth, in m
+EARTH_RADIUS = 6371000.
+
+def _edges(values):
+    """Edges between the cells centred on the given increasing values.
+
+    The inner edges are the midpoints between neighbouring values, and the
+    outer edges are half a step beyond the first and last values.
+    """
+    mid = (values[1:] + values[:-1]) / 2
+    first = values[0] - (mid[0] - values[0]) if len(values) > 1 else values[0] - 0.5
+    last = values[-1] + (values[-1] - mid[-1]) if len(values) > 1 else values[-1] + 0.5
+    return np.concatenate([[first], mid, [last]])
+
+def _readonly(arr):
+    """Make the array read-only, so that it can be shared safely."""
+    arr.setflags(write=False)
+    return arr
+
+class Grid:
+    """The latitude and longitude grid of the Unet domain.
+
+    Maps points to grid indices with array arithmetic rather than searches:
+    the index is first estimated from the mean spacing of the grid, then
+    corrected with the cell edges. For the nearly regular grids used here,
+    a single correction is enough, so lookups are O(1) per point.
+
+    Parameters
+    ----------
+    lats : numpy.ndarray
+        The latitude values of the grid, in increasing order.
+    lons : numpy.ndarray
+        The longitude values of the grid, in increasing order.
+
+    Examples
+    --------
+    >>> grid = get_grid()
+    >>> i, j = grid.index([40.7, 34.1], [-74.0, -118.2])
+    """
+
+    def __init__(self, lats, lons):
+        self.lats = _readonly(np.array(lats, dtype=np.float64))
+        self.lons = _readonly(np.array(lons, dtype=np.float64))
+        for name, values in [('lats', self.lats), ('lons', self.lons)]:
+            if values.ndim != 1 or len(values) == 0:
+                raise ValueError(f"{name} must be a non-empty 1D array.")
+            if np.any(np.diff(values) <= 0):
+                raise ValueError(f"{name} must be strictly increasing.")
+        self.lat_bounds = _readonly(np.clip(_edges(self.lats), -90, 90))
+        self.lon_bounds = _readonly(_edges(self.lons))
+
+    def __repr__(self):
+        return f"Grid(shape={self.shape}, extent={self.extent})"
+
+    @property
+    def shape(self):
+        """The (lat, lon) shape of the grid."""
+        return (len(self.lats), len(self.lons))
+
+    @property
+    def extent(self):
+        """The extent of the grid points as (lat_min, lat_max, lon_min, lon_max),
+        as returned by unox.data.get_extent()."""
+        return (self.lats[0], self.lats[-1], self.lons[0], self.lons[-1])
+
+    @property
+    def bounds_extent(self):
+        """The extent of the grid cells as (lat_min, lat_max, lon_min, lon_max)."""
+        return (self.lat_bounds[0], self.lat_bounds[-1], self.lon_bounds[0], self.lon_bounds[-1])
+
+    @functools.cached_property
+    def cell_areas(self):
+        """The area of each grid cell in m², of shape (lat, lon)."""
+        sin_lat = np.sin(np.radians(self.lat_bounds))
+        dlon = np.radians(np.diff(self.lon_bounds))
+        areas = EARTH_RADIUS**2 * np.outer(np.diff(sin_lat), dlon)
+        return _readonly(areas)
+
+    def lat_index(self, lat, tolerance=None):
+        """Index of the nearest grid latitude of each value.
+
+        Parameters
+        ----------
+        lat : float or array_like
+            Latitude values.
+        tolerance : float, optional
+            Maximum distance to the nearest grid latitude. The index of
+            values farther away is -1. If None, values outside the grid
+            get the index of the first or last latitude. Values that are
+            not finite always get the index -1.
+
+        Returns
+        -------
+        index : numpy.ndarray
+            Array of indices, of the same shape as lat.
+        """
+        return _nearest(self.lats, self.lat_bounds, lat, tolerance)
+
+    def lon_index(self, lon, tolerance=None):
+        """Index of the nearest grid longitude of each value, as in lat_index()."""
+        return _nearest(self.lons, self.lon_bounds, lon, tolerance)
+
+    def index(self, lat, lon, tolerance=None):
+        """Indices of the nearest grid point of each point.
+
+        Parameters
+        ----------
+        lat : float or array_like
+            Latitude values of the points.
+        lon : float or array_like
+            Longitude values of the points.
+        tolerance : float, optional
+            Maximum distance along each axis to the nearest grid point, as in lat_index().
+
+        Returns
+        -------
+        i : numpy.ndarray
+            Latitude indices of the points.
+        j : numpy.ndarray
+            Longitude indices of the points.
+        """
+        return self.lat_index(lat, tolerance), self.lon_index(lon, tolerance)
+
+    def box_slices(self, box):
+        """Convert a latitude and longitude box to slices along the lat and lon axes.
+
+        Parameters
+        ----------
+        box : tuple or None
+            The box as (lat_min, lat_max, lon_min, lon_max), as returned by
+            unox.data.get_extent(). Grid points on the edges are included.
+            None selects the whole grid.
+
+        Returns
+        -------
+        lat_slice : slice
+            The slice along the latitude axis.
+        lon_slice : slice
+            The slice along the longitude axis.
+        """
+        if box is None:
+            return slice(None), slice(None)
+        lat_min, lat_max, lon_min, lon_max = box
+        lat_slice = slice(np.searchsorted(self.lats, lat_min, 'left'), np.searchsorted(self.lats, lat_max, 'right'))
+        lon_slice = slice(np.searchsorted(self.lons, lon_min, 'left'), np.searchsorted(self.lons, lon_max, 'right'))
+        if lat_slice.start >= lat_slice.stop or lon_slice.start >= lon_slice.stop:
+            raise ValueError(f"The box {box} does not contain any grid points.")
+        return lat_slice, lon_slice
+
+    def subgrid(self, lat_slice, lon_slice):
+        """The part of the grid selected by the given slices."""
+        return Grid(self.lats[lat_slice], self.lons[lon_slice])
+
+def _nearest(values, edges, points, tolerance=None):
+    """Index of the nearest of the increasing values to each point."""
+    points = np.asarray(points, dtype=np.float64)
+    finite = np.isfinite(points)
+    points = np.where(finite, points, values[0])
+    n = len(values)
+    if n == 1:
+        index = np.zeros(points.shape, dtype=np.intp)
+    else:
+        # Estimate the index from the mean spacing
+        step = (values[-1] - values[0]) / (n - 1)
+        index = np.clip(np.rint((points - values[0]) / step), 0, n - 1).astype(np.intp)
+        # Move to the neighbouring cell until the point is within the cell edges.
+        #   Cell i covers (edges[i], edges[i+1]], so ties go to the lower index
+        while True:
+            down = (index > 0) & (points <= edges[index])
+            up = (index < n - 1) & (points > edges[index + 1])
+            if not (down.any() or up.any()):
+                break
+            index = index - down + up
+    if tolerance is not None:
+        index = np.where(np.abs(values[index] - points) <= tolerance, index, -1)
+    # Points that are not finite have no nearest grid point
+    return np.where(finite, index, -1)
+
+def load_grid(path='datafiles/'):
+    """Load the grid from the lats.npy and lons.npy files in the given directory.
+
+    Parameters
+    ----------
+    path : str
+        Path to the directory containing the grid files.
+
+    Returns
+    -------
+    grid : Grid
+        The grid.
+    """
+    lats = np.load(os.path.join(path, 'lats.npy'))
+    lons = np.load(os.path.join(path, 'lons.npy'))
+    return Grid(lats, lons)
+
+@functools.lru_cache(maxsize=8)
+def _cached_grid(path, lats_mtime, lons_mtime):
+    """Load the grid. The modification times are part of the cache key."""
+    return load_grid(path)
+
+def get_grid(path=None):
+    """Get the Unet grid, loading it only once per process.
+
+    Parameters
+    ----------
+    path : str, optional
+        Path to the directory containing lats.npy and lons.npy. Defaults
+        to the datafiles/ directory, found with unox.verify_path().
+
+    Returns
+    -------
+    grid : Grid
+        The shared grid. Its arrays are read-only.
+
+    Examples
+    --------
+    >>> grid = get_grid()
+    >>> areas = grid.cell_areas
+    """
+    if path is None:
+        from unox import unox
+        path = unox.verify_path('datafiles/')
+    path = os.path.abspath(path)
+    return _cached_grid(path, os.path.getmtime(os.path.join(path, 'lats.npy')),
+                        os.path.getmtime(os.path.join(path, 'lons.npy')))
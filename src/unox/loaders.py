@@ -0,0 +1,482 @@
+import datetime
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from unox import unox
+from unox import daily
+from unox import grid as ugrid
+from unox import quantize
+from unox import shm
+
+# Maximum number of memory-mapped files kept open
+CACHE_SIZE = 64
+
+# Size of the blocks read at once by load_years(), in bytes
+READ_BLOCK = 64 * 2**20
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _open_memmap(file_path, mtime, size):
+    """Open a .npy file memory-mapped. The mtime and size are part of the cache key."""
+    if shm.enabled():
+        return shm.open_shared(file_path)
+    if file_path.endswith(quantize.CODES_SUFFIX):
+        return quantize.QuantizedArray(file_path)
+    return np.load(file_path, mmap_mode='r')
+
+def open_array(file_path):
+    """Open a .npy file memory-mapped, reusing an already open handle.
+
+    Handles are kept in a bounded least-recently-used cache, so opening
+    the same file repeatedly is nearly free. A file that has changed on
+    disk since it was opened is opened again. Quantized files, ending in
+    '.q.npy', are opened as unox.quantize.QuantizedArray, which decodes
+    the values that are selected from it.
+
+    If UNOX_SHM_ADDRESS is set, the file is instead opened through the
+    dataset server at that address, see unox.shm, so that all processes
+    on the node share a single copy of it in memory.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the .npy file.
+
+    Returns
+    -------
+    arr : numpy.memmap or unox.quantize.QuantizedArray
+        The read-only, memory-mapped array.
+
+    Examples
+    --------
+    >>> arr = open_array(unox.get_pred_data(stage=1, HPC_run='test_unet_601760', year=2019))
+    """
+    stat = os.stat(file_path)
+    return _open_memmap(os.path.abspath(file_path), stat.st_mtime, stat.st_size)
+
+def clear_cache():
+    """Close all cached memory-mapped files."""
+    _open_memmap.cache_clear()
+
+def date_segments(dates):
+    """Split the given dates into a time index for each year file.
+
+    Parameters
+    ----------
+    dates : str, datetime.date, tuple or list
+        A single date, a (start, end) tuple of dates (both included),
+        or a list of dates.
+
+    Returns
+    -------
+    segments : list of tuple
+        A list of (year, index) pairs in the order of the dates, where index
+        is a slice or an array of indices along the time axis of the year file.
+
+    Examples
+    --------
+    >>> date_segments(('2019-12-30', '2020-01-03'))
+    [(2019, slice(362, 364, None)), (2020, slice(0, 2, None))]
+    """
+    if isinstance(dates, tuple):
+        start, end = daily.to_date(dates[0]), daily.to_date(dates[1])
+        if end < start:
+            raise ValueError(f"End date {end} is before start date {start}.")
+        segments = []
+        for year in range(start.year, end.year + 1):
+            # Index of the first and last day of the range within this year.
+            #   January 1st and February 29th are not in the files, so step over them
+            first = max(start, daily.to_date(f'{year}-01-02'))
+            last = end if end.year == year else daily.to_date(f'{year}-12-31')
+            if first > last:
+                continue
+            i0 = daily.day_index(_skip_missing(first, +1))[1]
+            i1 = daily.day_index(_skip_missing(last, -1))[1]
+            if i1 >= i0:
+                segments.append((year, slice(i0, i1 + 1)))
+        return segments
+    if not isinstance(dates, (list, np.ndarray)):
+        year, index = daily.day_index(dates)
+        return [(year, slice(index, index + 1))]
+    segments = []
+    for date in dates:
+        year, index = daily.day_index(date)
+        if segments and segments[-1][0] == year:
+            segments[-1][1].append(index)
+        else:
+            segments.append((year, [index]))
+    return [(year, np.array(index)) for year, index in segments]
+
+def _skip_missing(date, step):
+    """Move the date by one day in the direction of step if it is February 29th."""
+    if date.month == 2 and date.day == 29:
+        return date + datetime.timedelta(days=step)
+    return date
+
+def channel_index(channels, x_or_y='x'):
+    """Convert channel names or numbers to an index along the channel axis.
+
+    Parameters
+    ----------
+    channels : None, int, str or list of int or str
+        Channels to select. Names are those of unox.daily.CHANNELS for X
+        files, and 'nox' for Y and prediction files. None selects all channels.
+    x_or_y : str
+        'x' for X files, or 'y' for Y and prediction files.
+
+    Returns
+    -------
+    index : slice or list of int
+        The index along the channel axis.
+
+    Examples
+    --------
+    >>> channel_index(['no2', 't2m'])
+    [0, 7]
+    """
+    if channels is None:
+        return slice(None)
+    names = daily.CHANNELS if x_or_y == 'x' else ['nox']
+    single = isinstance(channels, (int, np.integer, str))
+    if single:
+        channels = [channels]
+    index = []
+    for channel in channels:
+        if isinstance(channel, str):
+            if channel not in names:
+                raise ValueError(f"Unknown channel {channel!r}, must be one of {names}.")
+            channel = names.index(channel)
+        index.append(int(channel))
+    if single:
+        return slice(index[0], index[0] + 1)
+    return index
+
+def load_slab(file_paths, segments, channels=None, box=None, x_or_y='x', grid=None):
+    """Load a slab of data from one or more year files.
+
+    Parameters
+    ----------
+    file_paths : dict
+        Path of the year file of each year in segments.
+    segments : list of tuple
+        (year, index) pairs, as returned by date_segments(). Use
+        [(year, slice(None))] for a whole year.
+    channels : None, int, str or list of int or str
+        Channels to select, as in channel_index().
+    box : tuple or None
+        (lat_min, lat_max, lon_min, lon_max) box to select, as in unox.grid.Grid.box_slices().
+    x_or_y : str
+        'x' for X files, or 'y' for Y and prediction files.
+    grid : unox.grid.Grid, optional
+        The grid of the files. Defaults to the Unet grid of unox.grid.get_grid().
+
+    Returns
+    -------
+    slab : numpy.ndarray
+        Array of shape (time, lat, lon, channel) with only the requested data.
+        It is a read-only view of the file when a single contiguous
+        selection was made, and a copy otherwise.
+    """
+    if box is not None and grid is None:
+        grid = ugrid.get_grid()
+    lat_slice, lon_slice = (slice(None), slice(None)) if box is None else grid.box_slices(box)
+    ch_index = channel_index(channels, x_or_y)
+    slabs = []
+    for year, index in segments:
+        arr = open_array(file_paths[year])
+        # Fancy indexing of the days or channels only copies the selection
+        slabs.append(arr[index, lat_slice, lon_slice][..., ch_index])
+    if len(slabs) == 1:
+        return np.asarray(slabs[0])
+    return np.concatenate(slabs, axis=0)
+
+def _year_segments(dates, year):
+    """Segments for the given dates, or for the whole of the given year."""
+    if dates is None:
+        if year is None:
+            raise ValueError("Either dates or year must be given.")
+        return [(year, slice(None))]
+    segments = date_segments(dates)
+    if len(segments) == 0:
+        raise ValueError(f"No days of the input files are in {dates}.")
+    return segments
+
+def load_sample(stage=1, x_or_y='y', dates=None, channels=None, box=None, year=None):
+    """Load a slab of sample data.
+
+    Opens the sample data files memory-mapped and returns only the
+    requested dates, channels and region.
+
+    Parameters
+    ----------
+    stage : int
+        Stage of the data (1 or 2).
+    x_or_y : str
+        'x' or 'y' to specify the type of data.
+    dates : str, datetime.date, tuple or list, optional
+        A date, a (start, end) tuple of dates or a list of dates, as in
+        date_segments(). May span several years.
+    channels : None, int, str or list of int or str
+        Channels to select, as in channel_index().
+    box : tuple or None
+        (lat_min, lat_max, lon_min, lon_max) box to select.
+    year : int, optional
+        Year to load in full, if dates is not given.
+
+    Returns
+    -------
+    slab : numpy.ndarray
+        Array of shape (time, lat, lon, channel).
+
+    Examples
+    --------
+    >>> no2 = load_sample(stage=1, x_or_y='x', dates=('2019-07-01', '2019-07-31'), channels='no2')
+    """
+    segments = _year_segments(dates, year)
+    file_paths = {y: unox.get_sample_data(stage, x_or_y, y) for y, index in segments}
+    return load_slab(file_paths, segments, channels, box, x_or_y)
+
+def load_pred(stage=1, HPC_run='test_unet_601760', dates=None, channels=None, box=None, year=None):
+    """Load a slab of prediction data.
+
+    Opens the prediction files memory-mapped and returns only the
+    requested dates, channels and region.
+
+    Parameters
+    ----------
+    stage : int
+        Stage of the data (1 or 2).
+    HPC_run : str
+        ID of the HPC run.
+    dates : str, datetime.date, tuple or list, optional
+        A date, a (start, end) tuple of dates or a list of dates, as in
+        date_segments(). May span several years.
+    channels : None, int, str or list of int or str
+        Channels to select, as in channel_index().
+    box : tuple or None
+        (lat_min, lat_max, lon_min, lon_max) box to select.
+    year : int, optional
+        Year to load in full, if dates is not given.
+
+    Returns
+    -------
+    slab : numpy.ndarray
+        Array of shape (time, lat, lon, channel).
+
+    Examples
+    --------
+    >>> pred = load_pred(stage=2, HPC_run='test_unet_601760', dates='2019-07-19')
+    """
+    segments = _year_segments(dates, year)
+    file_paths = {y: unox.get_pred_data(stage, HPC_run, y) for y, index in segments}
+    return load_slab(file_paths, segments, channels, box, 'y')
+
+def load_rollup(period, stat='mean', stage=1, HPC_run=None, years=None, channels=None, x_or_y='y'):
+    """Load a monthly, seasonal or annual aggregate from the rollups of the files.
+
+    Only the requested period is read from the small rollup files in the
+    rollups/ directory next to the year files, see unox.rollups. Missing
+    or out of date rollups are written first.
+
+    Parameters
+    ----------
+    period : str
+        One of unox.rollups.PERIODS: 'jan' to 'dec', 'djf', 'mam', 'jja',
+        'son' or 'annual'. The seasons are those of each calendar year, so
+        'djf' is January, February and December of the same year, not a
+        contiguous winter.
+    stat : str
+        One of unox.rollups.STATS: 'mean', 'max' or 'count'.
+    stage : int
+        Stage of the data (1 or 2).
+    HPC_run : str, optional
+        ID of the HPC run. If None, the sample data files are used.
+    years : int or list of int, optional
+        Years to load. Defaults to 2019.
+    channels : None, int, str or list of int or str
+        Channels to select, as in channel_index().
+    x_or_y : str
+        'x' or 'y' to specify the type of sample data.
+
+    Returns
+    -------
+    aggregate : numpy.ndarray
+        Array of shape (year, lat, lon, channel).
+
+    Examples
+    --------
+    >>> july = {run: load_rollup('jul', HPC_run=run, years=range(2014, 2020)) for run in runs}
+    """
+    # unox.rollups reads the year files through this module
+    from unox import rollups
+    if period not in rollups.PERIODS:
+        raise ValueError(f"Unknown period {period!r}, must be one of {rollups.PERIODS}.")
+    if stat not in rollups.STATS:
+        raise ValueError(f"Unknown statistic {stat!r}, must be one of {rollups.STATS}.")
+    years = [2019] if years is None else [years] if isinstance(years, (int, np.integer)) else list(years)
+    index = channel_index(channels, 'y' if HPC_run else x_or_y)
+    out = []
+    for year in years:
+        file_path = unox.get_pred_data(stage, HPC_run, year) if HPC_run else unox.get_sample_data(stage, x_or_y, year)
+        rollup = rollups.open_rollup(file_path)
+        out.append(np.asarray(rollup[rollups.STATS.index(stat), rollups.PERIODS.index(period)][..., index]))
+    return np.stack(out)
+
+def load_series(lats=None, lons=None, cells=None, stage=1, HPC_run=None, years=None, channels=None, x_or_y='y',
+                grid=None):
+    """Load the daily time series of points or grid cells, across years.
+
+    The series are read from the pixel store of the year files, see
+    unox.pixels, with a few contiguous reads per cell rather than a read
+    of every year file. The store is built first if it is missing, and
+    brought up to date with the year files.
+
+    Parameters
+    ----------
+    lats, lons : float or array_like, optional
+        The locations of the points. Each point takes the values of the
+        nearest grid cell, and must be at most half a cell away from it.
+    cells : array_like of int, optional
+        The (lat, lon) indices of the grid cells, of shape (n_cells, 2),
+        instead of points.
+    stage : int
+        Stage of the data (1 or 2).
+    HPC_run : str, optional
+        ID of the HPC run. If None, the sample data files are used.
+    years : int or list of int, optional
+        Years to load. Defaults to all years of the files.
+    channels : None, int, str or list of int or str
+        Channels to select, as in channel_index().
+    x_or_y : str
+        'x' or 'y' to specify the type of sample data.
+    grid : unox.grid.Grid, optional
+        The grid of the points. Defaults to unox.grid.get_grid().
+
+    Returns
+    -------
+    series : numpy.ndarray
+        Array of shape (point, year, time, channel).
+
+    Examples
+    --------
+    >>> # Los Angeles and New York
+    >>> series = load_series([34.05, 40.71], [-118.24, -74.01], HPC_run='test_unet_601760')
+    """
+    # unox.pixels reads the year files through this module
+    from unox import pixels
+    if (cells is None) == (lats is None or lons is None):
+        raise ValueError("Either lats and lons or cells must be given.")
+    if cells is not None:
+        i, j = np.asarray(cells, dtype=np.int64).reshape(-1, 2).T
+    else:
+        grid = grid or ugrid.get_grid()
+        # Points more than half a cell away from every grid point are outside the domain
+        tolerance = max(np.max(np.diff(grid.lats)), np.max(np.diff(grid.lons))) / 2
+        i, j = grid.index(np.atleast_1d(lats), np.atleast_1d(lons), tolerance)
+        if np.any((i < 0) | (j < 0)):
+            raise ValueError(f"Points outside the grid: {np.flatnonzero((i < 0) | (j < 0))}.")
+    if HPC_run:
+        store_dir = unox.verify_path(f'HPC_runs/{HPC_run}/stage{stage}_output') + '/pred_X' + pixels.PIXELS_SUFFIX
+    else:
+        sample_dir = unox.verify_path(f'sample_data/stage{stage}/{x_or_y}')
+        store_dir = f'{sample_dir}/{x_or_y.upper()}{pixels.PIXELS_SUFFIX}'
+    years = None if years is None else [years] if isinstance(years, (int, np.integer)) else list(years)
+    series = pixels.query(store_dir, i, j, years, channel_index(channels, 'y' if HPC_run else x_or_y))
+    n_years = len(years) if years is not None else len(pixels.read_index(store_dir)['years'])
+    return series.reshape(len(i), n_years, -1, series.shape[-1])
+
+def _npy_layout(file_path):
+    """Read the shape, dtype, memory order and data offset of a .npy file."""
+    with open(file_path, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        return shape, dtype, fortran_order, f.tell()
+
+def _read_into(file_path, out, dtype, fortran_order, offset):
+    """Read the data of a .npy file into out, a C-contiguous array of the same shape."""
+    if fortran_order or dtype.hasobject:
+        out[...] = np.load(file_path, mmap_mode='r')
+        return
+    with open(file_path, 'rb', buffering=0) as f:
+        f.seek(offset)
+        if dtype == out.dtype:
+            # Read straight into the output, block by block
+            view = memoryview(out.reshape(-1).view(np.uint8))
+            pos = 0
+            while pos < len(view):
+                n = f.readinto(view[pos:pos + READ_BLOCK])
+                if not n:
+                    raise ValueError(f"{file_path} is shorter than its header says.")
+                pos += n
+        else:
+            # Read blocks of rows in the dtype of the file, and cast them into the output
+            row_bytes = max(1, int(np.prod(out.shape[1:])) * dtype.itemsize)
+            rows = max(1, READ_BLOCK // row_bytes)
+            buf = np.empty((rows,) + out.shape[1:], dtype=dtype)
+            for start in range(0, len(out), rows):
+                block = buf[:min(rows, len(out) - start)]
+                n = f.readinto(memoryview(block.reshape(-1).view(np.uint8)))
+                if n != block.nbytes:
+                    raise ValueError(f"{file_path} is shorter than its header says.")
+                out[start:start + len(block)] = block
+
+def load_years(file_paths, dtype=None, max_workers=None, verbose=False):
+    """Load several year files concatenated along the time axis.
+
+    The files are read concurrently by a pool of threads, directly into
+    a single preallocated array, so no intermediate copy is made. The
+    replacement for np.concatenate([np.load(f) for f in file_paths]).
+
+    Parameters
+    ----------
+    file_paths : list of str
+        Paths to the .npy files, in the order to concatenate them. All
+        dimensions but the first must be the same.
+    dtype : numpy.dtype, optional
+        The dtype of the output. Each file is cast while it is read.
+        Defaults to the common dtype of the files.
+    max_workers : int, optional
+        Number of threads reading files. Defaults to one per file, at
+        most 8.
+    verbose : bool
+        If True, print the amount of data read and the read throughput.
+
+    Returns
+    -------
+    arr : numpy.ndarray
+        The concatenated array.
+
+    Examples
+    --------
+    >>> xtrain = load_years(sorted(glob.glob('sample_data/stage1/x/X_20*.npy'))[:14], dtype=np.float32)
+    """
+    file_paths = list(file_paths)
+    if len(file_paths) == 0:
+        raise ValueError("No files to load.")
+    layouts = [_npy_layout(file_path) for file_path in file_paths]
+    shapes = [layout[0] for layout in layouts]
+    for file_path, shape in zip(file_paths, shapes):
+        if len(shape) == 0 or shape[1:] != shapes[0][1:]:
+            raise ValueError(f"{file_path} has shape {shape}, which cannot be concatenated with {shapes[0]}.")
+    dtype = np.result_type(*[layout[1] for layout in layouts]) if dtype is None else np.dtype(dtype)
+    starts = np.cumsum([0] + [shape[0] for shape in shapes])
+    out = np.empty((starts[-1],) + tuple(shapes[0][1:]), dtype=dtype)
+    if max_workers is None:
+        max_workers = min(len(file_paths), 8)
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_read_into, file_path, out[start:stop], layout[1], layout[2], layout[3])
+                   for file_path, layout, start, stop in zip(file_paths, layouts, starts[:-1], starts[1:])]
+        for future in futures:
+            future.result()
+    if verbose:
+        seconds = time.perf_counter() - t0
+        nbytes = sum(int(np.prod(shape)) * layout[1].itemsize for shape, layout in zip(shapes, layouts))
+        print(f"Read {len(file_paths)} files, {nbytes / 2**30:.2f} GiB in {seconds:.2f} s "
+              f"({nbytes / 2**30 / max(seconds, 1e-9):.2f} GiB/s)")
+    return out
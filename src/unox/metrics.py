@@ -0,0 +1,319 @@
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from unox import unox
+from unox import daily
+from unox import loaders
+
+# Sufficient statistics of the pairs of truth (t) and prediction (p) values of each group
+FIELDS = ('n', 'mean_t', 'mean_p', 'm2_t', 'm2_p', 'c_tp', 'sse', 'sse_nonzero')
+
+# Metrics computed from the statistics, see Stats.metrics()
+METRICS = ('n', 'bias', 'rmse', 'mse', 'mse_nonzero', 'r2', 'r', 'slope', 'intercept')
+
+def _divide(a, b):
+    """a / b, with NaN where b is 0."""
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    return np.divide(a, b, out=np.full(np.broadcast(a, b).shape, np.nan), where=b != 0)
+
+class Stats:
+    """Mergeable sufficient statistics of pairs of truth and prediction values.
+
+    Each field is an array with one entry per group of pairs, e.g. per
+    (month, lat, lon). The means and centred sums of squares and products
+    are merged with the pairwise update of Chan et al., which stays
+    accurate for long series, unlike raw sums of squares.
+
+    Parameters
+    ----------
+    n : numpy.ndarray
+        Number of pairs of each group.
+    mean_t, mean_p : numpy.ndarray
+        Mean truth and prediction values.
+    m2_t, m2_p : numpy.ndarray
+        Sums of the squared deviations of the truth and prediction values from their means.
+    c_tp : numpy.ndarray
+        Sum of the products of the deviations of the truth and prediction values.
+    sse : numpy.ndarray
+        Sum of the squared errors.
+    sse_nonzero : numpy.ndarray
+        Sum of the squared errors of the pairs where the truth is not 0.
+
+    Examples
+    --------
+    >>> stats = Stats.from_arrays(truth, pred, axis=0)
+    >>> rmse = stats.rmse
+    """
+
+    def __init__(self, n, mean_t, mean_p, m2_t, m2_p, c_tp, sse, sse_nonzero):
+        self.n = np.asarray(n, dtype=np.int64)
+        self.mean_t, self.mean_p = np.asarray(mean_t, dtype=np.float64), np.asarray(mean_p, dtype=np.float64)
+        self.m2_t, self.m2_p = np.asarray(m2_t, dtype=np.float64), np.asarray(m2_p, dtype=np.float64)
+        self.c_tp = np.asarray(c_tp, dtype=np.float64)
+        self.sse, self.sse_nonzero = np.asarray(sse, dtype=np.float64), np.asarray(sse_nonzero, dtype=np.float64)
+
+    def __repr__(self):
+        return f"Stats(shape={self.shape}, n={int(self.n.sum())})"
+
+    def __getitem__(self, key):
+        return Stats(*(getattr(self, f)[key] for f in FIELDS))
+
+    @property
+    def shape(self):
+        """The shape of the groups."""
+        return self.n.shape
+
+    @classmethod
+    def zeros(cls, shape=()):
+        """Statistics of groups without any pairs."""
+        return cls(*(np.zeros(shape) for f in FIELDS))
+
+    @classmethod
+    def from_arrays(cls, truth, pred, axis=None):
+        """Statistics of the pairs of values of two arrays, reduced along the given axes.
+
+        Pairs where the truth or the prediction is NaN are ignored.
+
+        Parameters
+        ----------
+        truth, pred : array_like
+            The truth and predicted values, of the same shape.
+        axis : int or tuple of int, optional
+            The axes to reduce. Defaults to all of them.
+
+        Returns
+        -------
+        stats : Stats
+            The statistics, of the shape of the arrays without the reduced axes.
+        """
+        t, p = np.asarray(truth, dtype=np.float64), np.asarray(pred, dtype=np.float64)
+        if t.shape != p.shape:
+            raise ValueError(f"The truth has shape {t.shape}, but the prediction has shape {p.shape}.")
+        valid = ~(np.isnan(t) | np.isnan(p))
+        t, p = np.where(valid, t, 0), np.where(valid, p, 0)
+        n = np.sum(valid, axis=axis, keepdims=True)
+        mean_t, mean_p = _divide(np.sum(t, axis=axis, keepdims=True), n), _divide(np.sum(p, axis=axis, keepdims=True), n)
+        dt = np.where(valid, t - np.nan_to_num(mean_t), 0)
+        dp = np.where(valid, p - np.nan_to_num(mean_p), 0)
+        err2 = (p - t)**2
+        fields = [n, np.nan_to_num(mean_t), np.nan_to_num(mean_p), np.sum(dt**2, axis=axis, keepdims=True),
+                  np.sum(dp**2, axis=axis, keepdims=True), np.sum(dt * dp, axis=axis, keepdims=True),
+                  np.sum(err2, axis=axis, keepdims=True), np.sum(np.where(t != 0, err2, 0), axis=axis, keepdims=True)]
+        return cls(*(np.squeeze(f, axis=axis) if axis is not None else f.reshape(()) for f in fields))
+
+    @classmethod
+    def from_groups(cls, truth, pred, groups, n_groups):
+        """Statistics of pairs of values, per group given by an integer label of each pair.
+
+        Pairs where the truth or the prediction is NaN are ignored.
+
+        Parameters
+        ----------
+        truth, pred : array_like
+            The truth and predicted values, of the same shape.
+        groups : array_like of int
+            The group of each pair, from 0 to n_groups - 1.
+        n_groups : int
+            Number of groups.
+
+        Returns
+        -------
+        stats : Stats
+            The statistics, of shape (n_groups,).
+        """
+        t, p = np.asarray(truth, dtype=np.float64).ravel(), np.asarray(pred, dtype=np.float64).ravel()
+        g = np.asarray(groups).ravel()
+        valid = ~(np.isnan(t) | np.isnan(p))
+        t, p, g = t[valid], p[valid], g[valid]
+        def total(values):
+            return np.bincount(g, values, minlength=n_groups)
+        n = np.bincount(g, minlength=n_groups)
+        mean_t, mean_p = np.nan_to_num(_divide(total(t), n)), np.nan_to_num(_divide(total(p), n))
+        dt, dp = t - mean_t[g], p - mean_p[g]
+        err2 = (p - t)**2
+        return cls(n, mean_t, mean_p, total(dt**2), total(dp**2), total(dt * dp),
+                   total(err2), total(np.where(t != 0, err2, 0)))
+
+    def merge(self, other):
+        """The statistics of the pairs of both, group by group."""
+        n = self.n + other.n
+        # Weight of the other statistics in the merged means
+        w = _divide(other.n, n)
+        w = np.where(n == 0, 0, w)
+        d_t, d_p = other.mean_t - self.mean_t, other.mean_p - self.mean_p
+        return Stats(n, self.mean_t + d_t * w, self.mean_p + d_p * w,
+                     self.m2_t + other.m2_t + d_t**2 * self.n * w,
+                     self.m2_p + other.m2_p + d_p**2 * self.n * w,
+                     self.c_tp + other.c_tp + d_t * d_p * self.n * w,
+                     self.sse + other.sse, self.sse_nonzero + other.sse_nonzero)
+
+    def reduce(self, axis=None):
+        """Merge the groups along the given axes, or all of them."""
+        n = np.sum(self.n, axis=axis, keepdims=True)
+        mean_t = np.nan_to_num(_divide(np.sum(self.n * self.mean_t, axis=axis, keepdims=True), n))
+        mean_p = np.nan_to_num(_divide(np.sum(self.n * self.mean_p, axis=axis, keepdims=True), n))
+        d_t, d_p = self.mean_t - mean_t, self.mean_p - mean_p
+        fields = [n, mean_t, mean_p,
+                  np.sum(self.m2_t + self.n * d_t**2, axis=axis, keepdims=True),
+                  np.sum(self.m2_p + self.n * d_p**2, axis=axis, keepdims=True),
+                  np.sum(self.c_tp + self.n * d_t * d_p, axis=axis, keepdims=True),
+                  np.sum(self.sse, axis=axis, keepdims=True), np.sum(self.sse_nonzero, axis=axis, keepdims=True)]
+        return Stats(*(np.squeeze(f, axis=axis) if axis is not None else f.reshape(()) for f in fields))
+
+    @property
+    def bias(self):
+        """Mean of the prediction minus the truth."""
+        return np.where(self.n > 0, self.mean_p - self.mean_t, np.nan)
+
+    @property
+    def mse(self):
+        """Mean squared error."""
+        return _divide(self.sse, self.n)
+
+    @property
+    def rmse(self):
+        """Root mean squared error."""
+        return np.sqrt(self.mse)
+
+    @property
+    def mse_nonzero(self):
+        """Mean squared error with the pairs where the truth is 0 counted as exact,
+        as in the msenonzero loss of utils/functions.py."""
+        return _divide(self.sse_nonzero, self.n)
+
+    @property
+    def r2(self):
+        """Coefficient of determination of the predictions, 1 - SS_res / SS_tot."""
+        return 1 - _divide(self.sse, self.m2_t)
+
+    @property
+    def r(self):
+        """Pearson correlation coefficient of the truth and predictions."""
+        return _divide(self.c_tp, np.sqrt(self.m2_t * self.m2_p))
+
+    @property
+    def slope(self):
+        """Slope of the least-squares regression of the predictions on the truth."""
+        return _divide(self.c_tp, self.m2_t)
+
+    @property
+    def intercept(self):
+        """Intercept of the least-squares regression of the predictions on the truth."""
+        return self.mean_p - self.slope * self.mean_t
+
+    def metrics(self):
+        """All metrics, as a dict of name -> array of the shape of the groups."""
+        return {name: getattr(self, name) for name in METRICS}
+
+def month_index(year):
+    """Month (0 to 11) of each day of the files of the given year."""
+    return np.array([daily.index_date(year, i).month - 1 for i in range(daily.N_DAYS)])
+
+def evaluate_year(truth, pred, year=2019, channel=0):
+    """Statistics of a year of truth and predictions, per month and grid cell.
+
+    The arrays are read one month at a time, so they can be memory-mapped files.
+
+    Parameters
+    ----------
+    truth, pred : array_like
+        Arrays of shape (time, lat, lon, channel), e.g. a Y file and the
+        prediction file of the same year.
+    year : int
+        The year of the files, to find the months of the days.
+    channel : int
+        The channel to evaluate.
+
+    Returns
+    -------
+    stats : Stats
+        Statistics of shape (12, lat, lon).
+    """
+    if truth.shape[0] != pred.shape[0]:
+        raise ValueError(f"The truth has {truth.shape[0]} days, but the prediction has {pred.shape[0]}.")
+    months = month_index(year)[:truth.shape[0]]
+    stats = []
+    for month in range(12):
+        days = np.flatnonzero(months == month)
+        if len(days) == 0:
+            stats.append(Stats.zeros(truth.shape[1:3]))
+            continue
+        # The days of a month are contiguous, so each month is a single read
+        days = slice(days[0], days[-1] + 1)
+        stats.append(Stats.from_arrays(np.asarray(truth[days])[..., channel], np.asarray(pred[days])[..., channel], axis=0))
+    return Stats(*(np.stack([getattr(s, f) for s in stats]) for f in FIELDS))
+
+def evaluate(pairs, channel=0, max_workers=None):
+    """Statistics of many years of truth and predictions, evaluated in parallel.
+
+    Parameters
+    ----------
+    pairs : list of tuple
+        (year, truth, pred) of each year, as in evaluate_year().
+    channel : int
+        The channel to evaluate.
+    max_workers : int, optional
+        Number of years evaluated at once. Defaults to that of ThreadPoolExecutor.
+
+    Returns
+    -------
+    stats : Stats
+        Statistics of shape (12, lat, lon), merged over the years.
+    """
+    def evaluate_pair(pair):
+        year, truth, pred = pair
+        return evaluate_year(truth, pred, year, channel)
+    with ThreadPoolExecutor(max_workers) as executor:
+        return functools.reduce(Stats.merge, executor.map(evaluate_pair, pairs))
+
+def evaluate_run(HPC_run, stage=1, years=range(2005, 2020), max_workers=None):
+    """Statistics of the predictions of an HPC run against the Y files.
+
+    Parameters
+    ----------
+    HPC_run : str
+        The HPC run, as in unox.get_pred_data().
+    stage : int
+        The stage of the predictions and Y files.
+    years : list of int
+        The years to evaluate.
+    max_workers : int, optional
+        Number of years evaluated at once.
+
+    Returns
+    -------
+    stats : Stats
+        Statistics of shape (12, lat, lon), merged over the years.
+
+    Examples
+    --------
+    >>> stats = evaluate_run('test_unet_601760', stage=1, years=[2018, 2019])
+    >>> table = results(stats)
+    """
+    pairs = [(year, loaders.open_array(unox.get_sample_data(stage, 'y', year)),
+              loaders.open_array(unox.get_pred_data(stage, HPC_run, year))) for year in years]
+    return evaluate(pairs, max_workers=max_workers)
+
+def results(stats, regions=None):
+    """The metrics of (month, lat, lon) statistics, globally, per cell, per month and per region.
+
+    Parameters
+    ----------
+    stats : Stats
+        Statistics of shape (12, lat, lon), as returned by evaluate().
+    regions : dict, optional
+        Name -> unox.regions.Region of the regions to evaluate.
+
+    Returns
+    -------
+    results : dict
+        'global', 'cell' (of shape (lat, lon)), 'month' (of shape (12,))
+        and 'region' (name -> metrics), each a dict of the metrics in METRICS.
+    """
+    cells = stats.reduce(axis=0)
+    out = {'global': cells.reduce().metrics(), 'cell': cells.metrics(),
+           'month': stats.reduce(axis=(1, 2)).metrics(), 'region': {}}
+    for name, region in (regions or {}).items():
+        out['region'][name] = cells[region.mask].reduce().metrics()
+    return out
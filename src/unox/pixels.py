@@ -0,0 +1,335 @@
+import argparse
+import contextlib
+import fcntl
+import glob
+import json
+import os
+import re
+import shutil
+import tempfile
+import numpy as np
+
+from unox import daily
+from unox import loaders
+
+# Suffix of the pixel stores. The store of pred_X_2005.npy to pred_X_2019.npy is the directory pred_X.pixels/
+PIXELS_SUFFIX = '.pixels'
+
+# Number of grid cells along the latitude and longitude axes of each tile
+TILE = (8, 8)
+
+# Name of the description of a store, in the store directory
+INDEX_NAME = 'index.json'
+
+# Suffix of the lock file of a store, next to the store so that it outlives the store being replaced
+LOCK_SUFFIX = '.lock'
+
+YEAR_PATTERN = re.compile(r'^(?P<prefix>.*)_(?P<year>\d{4})(?P<suffix>(?:\.q)?\.npy)$')
+
+def store_path(file_path):
+    """Path of the pixel store of the year file at file_path, e.g. pred_X_2019.npy or X_2019.q.npy."""
+    match = YEAR_PATTERN.match(file_path)
+    if match is None:
+        raise ValueError(f"{file_path} is not a year file.")
+    return match['prefix'] + PIXELS_SUFFIX
+
+def year_files(store_dir):
+    """The year files of a store, as a dict of year -> path, in increasing order of years.
+
+    The original file is used when a year has both it and its quantized version.
+    """
+    prefix = store_dir[:-len(PIXELS_SUFFIX)]
+    files = {}
+    for file_path in sorted(glob.glob(glob.escape(prefix) + '_*.npy')):
+        match = YEAR_PATTERN.match(file_path)
+        if match is None or match['prefix'] != prefix:
+            continue
+        year = int(match['year'])
+        if year not in files or files[year].endswith('.q.npy'):
+            files[year] = file_path
+    return dict(sorted(files.items()))
+
+def tile_path(store_dir, a, b):
+    """Path of the tile of the store with the given position along the latitude and longitude axes."""
+    return os.path.join(store_dir, f'tile_{a}_{b}.npy')
+
+def read_index(store_dir):
+    """Read the description of a store, or None if there is no store."""
+    path = os.path.join(store_dir, INDEX_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+@contextlib.contextmanager
+def _locked(store_dir, exclusive=True):
+    """Hold the lock of a store: exclusive to write it, shared to read it.
+
+    Processes writing years into the same directory, e.g. the workers of
+    model.parallel, then update the store one at a time, and readers never
+    see it half replaced.
+    """
+    with open(store_dir + LOCK_SUFFIX, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _write_index(store_dir, index):
+    """Write the description of a store, replacing the previous one at once."""
+    path = os.path.join(store_dir, INDEX_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
+
+def _tiles(index):
+    """The position and the slices along the latitude and longitude axes of each tile."""
+    (n_lat, n_lon), (tile_lat, tile_lon) = index['shape'][:2], index['tile']
+    for a, i in enumerate(range(0, n_lat, tile_lat)):
+        for b, j in enumerate(range(0, n_lon, tile_lon)):
+            yield a, b, slice(i, min(i + tile_lat, n_lat)), slice(j, min(j + tile_lon, n_lon))
+
+def _write_year(store_dir, index, year, arr):
+    """Write a year of values, of shape (time, lat, lon, channel), into the tiles of a store.
+
+    The year is read one band of tiles along the latitude axis at a time.
+    """
+    start = index['years'].index(year) * index['n_days']
+    bands = {}
+    for a, b, lat_slice, lon_slice in _tiles(index):
+        bands.setdefault(a, (lat_slice, []))[1].append((b, lon_slice))
+    for a, (lat_slice, tiles) in bands.items():
+        band = np.asarray(arr[:, lat_slice])
+        for b, lon_slice in tiles:
+            tile = np.load(tile_path(store_dir, a, b), mmap_mode='r+')
+            tile[:, :, start:start + index['n_days']] = band[:, :, lon_slice].transpose(1, 2, 0, 3)
+            tile.flush()
+            del tile
+
+def build_store(store_dir, tile=TILE):
+    """Write the pixel store of the year files of a directory.
+
+    Each tile holds TILE grid cells, with the days of all years of each
+    cell one after the other, so the time series of a cell is a single
+    contiguous read. The store is written into a new directory next to
+    the files, which then replaces the previous store while the lock of
+    the store is held, so readers never see a partial store.
+
+    Parameters
+    ----------
+    store_dir : str
+        Path to the store, as returned by store_path().
+    tile : tuple of int
+        Number of grid cells along the latitude and longitude axes of each tile.
+
+    Returns
+    -------
+    index : dict
+        The description of the store, with its 'years', the 'n_days' of
+        each year, the 'shape' (lat, lon, channel) of a day, the 'tile'
+        shape, the 'dtype' and the 'mtimes' of the year files.
+
+    Examples
+    --------
+    >>> build_store(store_path('HPC_runs/test_unet_601760/stage1_output/pred_X_2019.npy'))
+    """
+    with _locked(store_dir):
+        return _build_store(store_dir, tile)
+
+def _build_store(store_dir, tile):
+    """Write the pixel store, see build_store(). The caller holds the lock of the store."""
+    files = year_files(store_dir)
+    if not files:
+        raise FileNotFoundError(f"No year files for the store {store_dir}.")
+    arrs = {year: loaders.open_array(file_path) for year, file_path in files.items()}
+    first = next(iter(arrs.values()))
+    for year, arr in arrs.items():
+        if arr.shape != first.shape:
+            raise ValueError(f"{files[year]} has shape {arr.shape}, expected {first.shape}.")
+    index = {'years': list(files), 'n_days': first.shape[0], 'shape': list(first.shape[1:]), 'tile': list(tile),
+             'dtype': np.dtype(first.dtype).str, 'mtimes': {str(y): os.path.getmtime(f) for y, f in files.items()}}
+    parent, name = os.path.split(os.path.abspath(store_dir))
+    tmp_dir = tempfile.mkdtemp(prefix=name + '.tmp', dir=parent)
+    for a, b, lat_slice, lon_slice in _tiles(index):
+        shape = (lat_slice.stop - lat_slice.start, lon_slice.stop - lon_slice.start,
+                 len(files) * index['n_days'], index['shape'][2])
+        np.lib.format.open_memmap(tile_path(tmp_dir, a, b), mode='w+', dtype=first.dtype, shape=shape).flush()
+    for year, arr in arrs.items():
+        _write_year(tmp_dir, index, year, arr)
+    _write_index(tmp_dir, index)
+    if os.path.exists(store_dir):
+        old_dir = tempfile.mkdtemp(prefix=name + '.old', dir=parent)
+        os.replace(store_dir, old_dir)
+        os.replace(tmp_dir, store_dir)
+        shutil.rmtree(old_dir)
+    else:
+        os.replace(tmp_dir, store_dir)
+    return index
+
+def sync_store(store_dir, build=True):
+    """Bring a pixel store up to date with its year files.
+
+    Only the years whose files changed since they were written are
+    written again. The store is built in full if it is missing, or if
+    years were added or removed.
+
+    Parameters
+    ----------
+    store_dir : str
+        Path to the store, as returned by store_path().
+    build : bool
+        If False, a missing store is not built and None is returned.
+
+    Returns
+    -------
+    index : dict or None
+        The description of the store, as returned by build_store().
+    """
+    if not build and read_index(store_dir) is None:
+        return None
+    with _locked(store_dir):
+        return _sync_store(store_dir, build)
+
+def _sync_store(store_dir, build):
+    """Bring a pixel store up to date, see sync_store(). The caller holds the lock of the store."""
+    index = read_index(store_dir)
+    if index is None and not build:
+        return None
+    files = year_files(store_dir)
+    if index is None or list(files) != index['years']:
+        return _build_store(store_dir, tuple(index['tile']) if index else TILE)
+    changed = {year: f for year, f in files.items() if os.path.getmtime(f) > index['mtimes'][str(year)]}
+    for year, file_path in changed.items():
+        arr = loaders.open_array(file_path)
+        if list(arr.shape) != [index['n_days']] + index['shape']:
+            return _build_store(store_dir, tuple(index['tile']))
+        _write_year(store_dir, index, year, arr)
+        index['mtimes'][str(year)] = os.path.getmtime(file_path)
+    if changed:
+        _write_index(store_dir, index)
+    return index
+
+def update_year(file_path):
+    """Update the pixel store of a year file after the file was written, if the store exists.
+
+    Returns the description of the store, or None if there is no store.
+
+    Examples
+    --------
+    >>> np.save('HPC_runs/test_unet_601760/stage1_output/pred_X_2020.npy', pred)
+    >>> update_year('HPC_runs/test_unet_601760/stage1_output/pred_X_2020.npy')
+    """
+    return sync_store(store_path(file_path), build=False)
+
+def update_day(file_path, date):
+    """Update the pixel store of a year file after one of its days was written, if the store exists.
+
+    Only the day is written into the tiles, unless the year is new to the
+    store, which is then built again.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the .npy year file.
+    date : str or datetime.date
+        The day that was written.
+
+    Returns
+    -------
+    index : dict or None
+        The description of the store, or None if there is no store.
+    """
+    store_dir = store_path(file_path)
+    if read_index(store_dir) is None:
+        return None
+    year, day = daily.day_index(date)
+    with _locked(store_dir):
+        index = read_index(store_dir)
+        if index is None or year not in index['years']:
+            return _sync_store(store_dir, build=False)
+        values = np.asarray(np.load(file_path, mmap_mode='r')[day])
+        t = index['years'].index(year) * index['n_days'] + day
+        for a, b, lat_slice, lon_slice in _tiles(index):
+            tile = np.load(tile_path(store_dir, a, b), mmap_mode='r+')
+            tile[:, :, t] = values[lat_slice, lon_slice]
+            tile.flush()
+            del tile
+        index['mtimes'][str(year)] = os.path.getmtime(file_path)
+        _write_index(store_dir, index)
+    return index
+
+def _year_runs(index, years):
+    """Slices along the time axis of the tiles of the given years, merging consecutive years."""
+    if years is None:
+        return [slice(0, len(index['years']) * index['n_days'])]
+    positions = []
+    for year in years:
+        if year not in index['years']:
+            raise ValueError(f"The year {year} is not in the store, which has {index['years']}.")
+        positions.append(index['years'].index(year))
+    runs = []
+    for k in positions:
+        if runs and runs[-1][1] == k:
+            runs[-1][1] = k + 1
+        else:
+            runs.append([k, k + 1])
+    return [slice(start * index['n_days'], stop * index['n_days']) for start, stop in runs]
+
+def query(store_dir, i, j, years=None, channels=None, build=True):
+    """Read the time series of grid cells from a pixel store.
+
+    The series of each cell is read with one contiguous read per run of
+    consecutive years, from the memory-mapped tiles.
+
+    Parameters
+    ----------
+    store_dir : str
+        Path to the store, as returned by store_path().
+    i, j : array_like of int
+        The latitude and longitude indices of the cells.
+    years : list of int, optional
+        The years to read. Defaults to all years of the store.
+    channels : slice or list of int, optional
+        The channels to read, e.g. from unox.loaders.channel_index().
+        Defaults to all of them.
+    build : bool
+        If True, bring the store up to date with its year files first,
+        see sync_store(). Otherwise a missing store raises a FileNotFoundError.
+
+    Returns
+    -------
+    series : numpy.ndarray
+        Array of shape (cell, year * time, channel), with the days of the
+        years one after the other.
+    """
+    if build:
+        sync_store(store_dir)
+    i, j = np.atleast_1d(np.asarray(i, dtype=np.int64)), np.atleast_1d(np.asarray(j, dtype=np.int64))
+    with _locked(store_dir, exclusive=False):
+        index = read_index(store_dir)
+        if index is None:
+            raise FileNotFoundError(f"The pixel store {store_dir} does not exist.")
+        n_lat, n_lon = index['shape'][:2]
+        if np.any((i < 0) | (i >= n_lat) | (j < 0) | (j >= n_lon)):
+            raise IndexError(f"Cells outside the grid of shape {(n_lat, n_lon)}.")
+        runs = _year_runs(index, years)
+        channels = slice(None) if channels is None else channels
+        series = [None] * len(i)
+        tile_lat, tile_lon = index['tile']
+        tiles = (i // tile_lat) * n_lon + j // tile_lon
+        for key in np.unique(tiles):
+            cells = np.flatnonzero(tiles == key)
+            tile = loaders.open_array(tile_path(store_dir, i[cells[0]] // tile_lat, j[cells[0]] // tile_lon))
+            for k in cells:
+                series[k] = np.concatenate([tile[i[k] % tile_lat, j[k] % tile_lon, s] for s in runs])[:, channels]
+    return np.stack(series)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or update the pixel stores of year files.')
+    parser.add_argument('files', nargs='+', help='a year file of each store, e.g. HPC_runs/run/stage1_output/pred_X_2019.npy')
+    args = parser.parse_args()
+    for store_dir in dict.fromkeys(store_path(f) for f in args.files):
+        index = sync_store(store_dir)
+        print(f"{store_dir}: {len(index['years'])} years, {index['shape']} cells and channels")
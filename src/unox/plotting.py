@@ -1,15 +1,28 @@
-import matplotlib.pyplot as plt
-import matplotlib as mpl
 import numpy as np
-import xarray as xr
-import proplot as pplt
-from datetime import datetime
 
 from unox import unox
+from unox import daily
 from unox import data as udata
+from unox import loaders
+from unox import metrics
 from unox import plot_format as uplt_frmt
+from unox import reducers as ureducers
+from unox import sketch as usketch
 
-def plot_extent(xr_dataset=xr.open_dataset('../datafiles/nox_2019_t106_US.nc')):
+# matplotlib, proplot and xarray are imported by the functions that use them,
+#   so that importing this module stays cheap
+
+# Dataset plotted when none is given, found with unox.verify_path()
+DEFAULT_DATASET = 'datafiles/nox_2019_t106_US.nc'
+
+def _open_default(xr_dataset):
+    """Open the default dataset if no dataset is given."""
+    if xr_dataset is not None:
+        return xr_dataset
+    import xarray as xr
+    return xr.open_dataset(unox.verify_path(DEFAULT_DATASET))
+
+def plot_extent(xr_dataset=None):
     """Plots the extent of the given xarray dataset.
 
     Creates a map with the Robin projection of the entire world
@@ -17,8 +30,9 @@ def plot_extent(xr_dataset=xr.open_dataset('../datafiles/nox_2019_t106_US.nc')):
 
     Parameters
     ----------
-    xr_dataset : xarray.Dataset or xarray.DataArray
-        The xarray data for which to plot the extent.
+    xr_dataset : xarray.Dataset or xarray.DataArray, optional
+        The xarray data for which to plot the extent. Defaults to the
+        dataset in DEFAULT_DATASET.
     
     Returns
     -------
@@ -29,6 +43,8 @@ def plot_extent(xr_dataset=xr.open_dataset('../datafiles/nox_2019_t106_US.nc')):
     --------
     >>> fig = plot_extent(xr_dataset)
     """
+    import proplot as pplt
+    xr_dataset = _open_default(xr_dataset)
     # Verify the xr_dataset
     udata.verify_dataset(xr_dataset)
     # Find the min and max lat and lon values
@@ -51,7 +67,7 @@ def plot_extent(xr_dataset=xr.open_dataset('../datafiles/nox_2019_t106_US.nc')):
     # Return the figure
     return fig
 
-def plot_lats_lons(xr_dataset=xr.open_dataset('../datafiles/nox_2019_t106_US.nc'),
+def plot_lats_lons(xr_dataset=None,
                    padding=0.1):
     """Plot the latitude and longitude values in the given dataset.
 
@@ -60,8 +76,9 @@ def plot_lats_lons(xr_dataset=xr.open_dataset('../datafiles/nox_2019_t106_US.nc'
 
     Parameters
     ----------
-    xr_dataset : xarray.Dataset or xarray.DataArray
+    xr_dataset : xarray.Dataset or xarray.DataArray, optional
         The xarray data for which to plot the longitude and latitude values.
+        Defaults to the dataset in DEFAULT_DATASET.
     
     Returns
     -------
@@ -72,6 +89,8 @@ def plot_lats_lons(xr_dataset=xr.open_dataset('../datafiles/nox_2019_t106_US.nc'
     --------
     >>> fig = plot_lats_lons(xr_dataset)
     """
+    import proplot as pplt
+    xr_dataset = _open_default(xr_dataset)
     # Verify the xr_dataset
     udata.verify_dataset(xr_dataset)
     # Find the min and max lat and lon values
@@ -122,6 +141,8 @@ def plot_nc_map(datafile='../datafiles/nox_2019_t106_US.nc',
     Returns
     -------
     """
+    import xarray as xr
+    import proplot as pplt
     nox = xr.open_dataset(datafile)  #nox dataset used to make y files
     # Simplest way to plot the data
     # nox.nox[0].plot()
@@ -193,14 +214,16 @@ def plot_npy_map(this_fig,
     >>> fig, ax = plt.subplots()
     >>> plot_npy_map(ax, npy_arr, lats, lons, title='NOx emissions')
     """
+    import matplotlib.pyplot as plt
     pcm = this_ax.pcolormesh(lons, lats, npy_arr, cmap=plt.cm.seismic, shading='auto', vmin=-c_halfrange, vmax=c_halfrange)  
     this_ax.set_title(ax_title)
     this_fig.colorbar(pcm, ax=this_ax)#, label='NOx emissions (kg/m2/s)', extend='both', ticks=[-c_halfrange, 0, c_halfrange] )
 
-def plot_stage_comp_maps(truth_params={'stage': 1, 'x_or_y': 'y', 'year': 2019},
-                pred_params={'stage': -1, 'HPC_run': 'test_unet_601760', 'year': 2019},
+def plot_stage_comp_maps(truth_params={'stage': 1, 'x_or_y': 'y'},
+                pred_params={'stage': -1, 'HPC_run': 'test_unet_601760'},
                 this_date='2019-07-19T00:00:00',
-                restrict_lat_lon_to=None):
+                restrict_lat_lon_to=None,
+                percentiles=(1, 99)):
     """Plots a set of maps to compare the truth and the two stages of the model.
 
     Creates a set of 6 maps:
@@ -215,24 +238,34 @@ def plot_stage_comp_maps(truth_params={'stage': 1, 'x_or_y': 'y', 'year': 2019},
     ----------
     truth_params : dict
         Dictionary containing the parameters for the truth data.
-        Must contain 'stage', 'x_or_y', and 'year', as designated in unox.data.get_sample_data().
+        Must contain 'stage' and 'x_or_y', as designated in unox.data.get_sample_data().
     pred_params : dict
         Dictionary containing the parameters for the predicted data.
-        Must contain 'stage', 'HPC_run', and 'year', as designated in unox.data.get_pred_data().
+        Must contain 'HPC_run', as designated in unox.data.get_pred_data().
     this_date : str
-        Date and time to select from the data file.
+        Date and time to select from the data files. Also selects the year
+        of the files, so a 'year' in the parameters must be that year.
     restrict_lat_lon_to : str
         Path to a netCDF file to restrict the latitude and longitude range.
         If None, the entire dataset is used.
+    percentiles : tuple of float, optional
+        (lower, upper) percentiles of the values that set the colour range,
+        see unox.data.get_vminmax(). If None, the minimum and maximum are used.
     
     Returns
     -------
     """
-    truth = np.load(unox.get_sample_data(**truth_params))
-    # Remove `stage` from pred_params, if present
-    pred_params.pop('stage', None)
-    stage1 = np.load(unox.get_pred_data(stage=1, **pred_params))
-    stage2 = np.load(unox.get_pred_data(stage=2, **pred_params))
+    import matplotlib.pyplot as plt
+    import xarray as xr
+    # The year of the files is that of this_date
+    year = daily.to_date(this_date).year
+    for params in (truth_params, pred_params):
+        if 'year' in params and int(params['year']) != year:
+            raise ValueError(f"The year {params['year']} does not match the date {this_date}, which selects the year.")
+    # Load only the day to plot, of shape (1, lat, lon, 1)
+    truth = loaders.load_sample(truth_params['stage'], truth_params['x_or_y'], dates=this_date, channels=0)
+    stage1 = loaders.load_pred(stage=1, HPC_run=pred_params['HPC_run'], dates=this_date)
+    stage2 = loaders.load_pred(stage=2, HPC_run=pred_params['HPC_run'], dates=this_date)
 
     lats, lons = unox.load_lats_lons()
 
@@ -240,13 +273,13 @@ def plot_stage_comp_maps(truth_params={'stage': 1, 'x_or_y': 'y', 'year': 2019},
         # Restrict range
         [truth, stage1, stage2], lats, lons = udata.restrict_domain([truth, stage1, stage2], lats, lons, xr.open_dataset(restrict_lat_lon_to))
     
-    # Get the minimum and maximum values across the truth, stage1, and stage2 arrays
-    vmin, vmax = udata.get_vminmax([truth, stage1, stage2])
+    # Get the percentiles of the values across the truth, stage1, and stage2 arrays, so outlier cells do not set the colour range
+    vmin, vmax = udata.get_vminmax([truth, stage1, stage2], percentiles)
     # Get the halfrange for use with a diverging color map
     halfrange = udata.get_max_abs_val([vmin, vmax])
 
-    # Get the day of year to plot
-    day = datetime.strptime(this_date, '%Y-%m-%dT%H:%M:%S').timetuple().tm_yday
+    # The loaded arrays only contain the day to plot
+    day = 0
 
     # Make the figure with the subplots
     fig, ax = plt.subplots(2,3,figsize=(14,8))
@@ -261,7 +294,7 @@ def plot_stage_comp_maps(truth_params={'stage': 1, 'x_or_y': 'y', 'year': 2019},
 
 def plot_comparison(truth_data={'stage':1, 'x_or_y':'y', 'year':2019},
                     pred_data={'stage':1, 'HPC_run':'test_unet_601760', 'year':2019},
-                    hist_params={'bins':100, 'vmax':1000, 'vmin':10},
+                    hist_params={'bins':100, 'vmax':None, 'vmin':10},
                     restrict_lat_lon_to=None
                     ):
     """Plot a comparison of the truth and predicted data.
@@ -279,7 +312,11 @@ def plot_comparison(truth_data={'stage':1, 'x_or_y':'y', 'year':2019},
         Must contain 'stage', 'HPC_run', and 'year'.
     hist_params : dict
         Dictionary containing the parameters for the histogram.
-        Must contain 'bins', 'vmax', and 'vmin'.
+        Must contain 'bins', 'vmax', and 'vmin'. 'bins' is the number of
+        bins along each axis, with edges at quantiles of the values so that
+        each bin holds about as many values, see unox.sketch.bin_edges().
+        'vmin' and 'vmax' are the range of the counts in the colour scale;
+        a 'vmax' of None uses the largest count.
     restrict_lat_lon_to : str
         Path to a netCDF file to restrict the latitude and longitude range.
         If None, the entire dataset is used.
@@ -293,14 +330,24 @@ def plot_comparison(truth_data={'stage':1, 'x_or_y':'y', 'year':2019},
     --------
     >>> fig = plot_comparison(truth_arr, pred_arr)
     """
-    from scipy.stats import linregress
+    import matplotlib.pyplot as plt
+    import matplotlib as mpl
+    import xarray as xr
     # Load the data
-    truth = np.load(unox.get_sample_data(**truth_data))  #truth (y input file)
-    stage1 = np.load(unox.get_pred_data(**pred_data))  #stage 1 prediction
+    truth_path = unox.get_sample_data(**truth_data)
+    pred_path = unox.get_pred_data(**pred_data)
+    truth = np.load(truth_path)  #truth (y input file)
+    stage1 = np.load(pred_path)  #stage 1 prediction
     if not isinstance(restrict_lat_lon_to, type(None)):
         # Restrict range
         lats, lons = unox.load_lats_lons()
         [truth, stage1], lats, lons = udata.restrict_domain([truth, stage1], lats, lons, xr.open_dataset(restrict_lat_lon_to))
+        # Sketch the values of the restricted domain
+        sketches = [ureducers.summarize([arr], quantiles=True).sketch for arr in (truth, stage1)]
+    else:
+        # Use the sketches saved next to the files
+        sketches = [usketch.load_sketch(truth_path), usketch.load_sketch(pred_path)]
+    bins = [usketch.bin_edges(sketch, hist_params['bins']) for sketch in sketches]
     truths = truth.flatten()
     preds = stage1.flatten()
     # Create the figure
@@ -309,7 +356,7 @@ def plot_comparison(truth_data={'stage':1, 'x_or_y':'y', 'year':2019},
     my_cmap = plt.cm.jet
     my_cmap.set_under('w', 1)
     # Plot the data
-    this_hist, xedges, yedges, q = plt.hist2d(truths, preds, bins=100, norm=mpl.colors.LogNorm(vmax=hist_params['vmax'], vmin=hist_params['vmin']), cmap=plt.cm.jet)
+    this_hist, xedges, yedges, q = plt.hist2d(truths, preds, bins=bins, norm=mpl.colors.LogNorm(vmax=hist_params['vmax'], vmin=hist_params['vmin']), cmap=plt.cm.jet)
     # Count the maximum extent of the histogram where values are larger than vmin
     counts_0 = np.sum(this_hist > hist_params['vmin'], axis=0)
     counts_1 = np.sum(this_hist > hist_params['vmin'], axis=1)
@@ -324,7 +371,8 @@ def plot_comparison(truth_data={'stage':1, 'x_or_y':'y', 'year':2019},
     plt.xlim((0, axis_lim))
     plt.ylim((0, axis_lim))
     # Plot the linear regression between the truth and predicted values
-    slope, intercept, r_value, p_value, std_err = linregress(truths, preds)
+    stats = metrics.Stats.from_arrays(truths, preds)
+    slope, intercept, r_value = stats.slope, stats.intercept, stats.r
     plt.plot(xx, slope*xx+intercept, 'r--', lw=2, label='y=%.2f x + %.2f, R^2=%.2f'%(slope, intercept, r_value**2))
     # Format the plot
     plt.colorbar(extend='both', ticks=[0.1, 0] + list(range(0, 1100, 100)) )
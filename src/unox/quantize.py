@@ -0,0 +1,284 @@
+import argparse
+import glob
+import os
+import numpy as np
+
+# Suffixes of the quantized files. pred_X_2019.npy is stored as the codes in
+#   pred_X_2019.q.npy and the scales and offsets in pred_X_2019.q.npz
+CODES_SUFFIX = '.q.npy'
+PARAMS_SUFFIX = '.q.npz'
+
+# Range of the int16 codes. The smallest int16 value marks NaN
+CODE_MIN, CODE_MAX = -32767, 32767
+CODE_NAN = -32768
+
+def quantized_paths(file_path):
+    """Get the paths of the codes and parameters of the quantized version of a .npy file.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the .npy file, e.g. 'HPC_runs/test_unet_601760/stage1_output/pred_X_2019.npy'.
+
+    Returns
+    -------
+    codes_path : str
+        Path to the file of the codes, ending in '.q.npy'.
+    params_path : str
+        Path to the file of the scales and offsets, ending in '.q.npz'.
+    """
+    if file_path.endswith(CODES_SUFFIX):
+        base = file_path[:-len(CODES_SUFFIX)]
+    elif file_path.endswith('.npy'):
+        base = file_path[:-len('.npy')]
+    else:
+        raise ValueError(f"{file_path} is not a .npy file.")
+    return base + CODES_SUFFIX, base + PARAMS_SUFFIX
+
+def encode_chunk(values, dtype='int16'):
+    """Quantize one chunk of values with a single scale and offset.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        The values to quantize.
+    dtype : str
+        'int16' to store the values as integers on a uniform grid of
+        2**16 - 1 levels between the minimum and maximum of the chunk, or
+        'float16' to store them as half floats after centring and scaling.
+
+    Returns
+    -------
+    codes : numpy.ndarray
+        The codes, of the same shape as values.
+    scale : float
+        The scale of the chunk.
+    offset : float
+        The offset of the chunk.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    if not finite.any():
+        lo = hi = 0.
+    else:
+        lo, hi = np.min(values[finite]), np.max(values[finite])
+    if dtype == 'int16':
+        offset = lo
+        scale = (hi - lo) / (CODE_MAX - CODE_MIN) if hi > lo else 1.
+        codes = np.rint((values - offset) / scale) + CODE_MIN
+        codes = np.where(finite, codes, CODE_NAN).astype(np.int16)
+    elif dtype == 'float16':
+        offset = (lo + hi) / 2
+        scale = (hi - lo) / 2 if hi > lo else 1.
+        codes = ((values - offset) / scale).astype(np.float16)
+    else:
+        raise ValueError(f"Unknown dtype {dtype!r}, must be 'int16' or 'float16'.")
+    return codes, scale, offset
+
+def decode_chunk(codes, scale, offset, dtype=np.float32):
+    """Decode codes quantized with encode_chunk().
+
+    scale and offset may be arrays that broadcast against codes.
+    """
+    if codes.dtype == np.int16:
+        values = offset + (codes.astype(np.float64) - CODE_MIN) * scale
+        return np.where(codes == CODE_NAN, np.nan, values).astype(dtype)
+    return (offset + codes.astype(np.float64) * scale).astype(dtype)
+
+def decoded_dtype(src_dtype):
+    """The data type that quantized values are decoded to: that of the original file if it is a float type."""
+    src_dtype = np.dtype(src_dtype)
+    return src_dtype if np.issubdtype(src_dtype, np.floating) else np.dtype(np.float32)
+
+def quantize_file(file_path, dtype='int16', chunk=7, max_error=None):
+    """Write the quantized version of a .npy file.
+
+    The array is quantized in chunks of `chunk` entries along its first
+    (time) axis, each with its own scale and offset. The error of every
+    chunk is measured after quantizing it, on the values decoded to the
+    data type that QuantizedArray gives to readers.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the .npy file.
+    dtype : str
+        'int16' or 'float16', as in encode_chunk().
+    chunk : int
+        Number of entries along the first axis in each chunk.
+    max_error : float, optional
+        Maximum absolute error allowed. If any value would be further from
+        its original value, nothing is written and a ValueError is raised.
+
+    Returns
+    -------
+    info : dict
+        'path', 'bytes' (of the original file), 'quantized_bytes' (of both
+        quantized files) and 'max_error' (measured) of the file.
+
+    Examples
+    --------
+    >>> info = quantize_file('HPC_runs/test_unet_601760/stage1_output/pred_X_2019.npy', max_error=0.05)
+    """
+    codes_path, params_path = quantized_paths(file_path)
+    src = np.load(file_path, mmap_mode='r')
+    if src.ndim == 0 or src.shape[0] == 0:
+        raise ValueError(f"{file_path} has no first axis to quantize along.")
+    n_chunks = -(-src.shape[0] // chunk)
+    out_dtype = decoded_dtype(src.dtype)
+    scales, offsets, errors = np.empty(n_chunks), np.empty(n_chunks), np.empty(n_chunks)
+    # Write to temporary files, so that a failed conversion leaves no partial files
+    tmp_codes, tmp_params = codes_path + '.tmp', params_path + '.tmp'
+    codes = np.lib.format.open_memmap(tmp_codes, mode='w+', dtype=np.dtype(dtype), shape=src.shape)
+    try:
+        for k in range(n_chunks):
+            values = np.asarray(src[k*chunk:(k+1)*chunk])
+            codes[k*chunk:(k+1)*chunk], scales[k], offsets[k] = encode_chunk(values, dtype)
+            decoded = decode_chunk(codes[k*chunk:(k+1)*chunk], scales[k], offsets[k], out_dtype)
+            diff = np.abs(decoded.astype(np.float64) - values)
+            # NaN must stay NaN, and nothing else may become NaN
+            if np.any(np.isnan(decoded) != np.isnan(values)):
+                raise ValueError(f"Chunk {k} of {file_path} does not keep its NaN values.")
+            errors[k] = np.nanmax(diff) if np.any(~np.isnan(diff)) else 0.
+            if max_error is not None and errors[k] > max_error:
+                raise ValueError(f"Chunk {k} of {file_path} has a maximum error of {errors[k]:.3g} "
+                                 f"with {dtype}, more than {max_error:.3g}. Use smaller chunks or int16.")
+        codes.flush()
+        with open(tmp_params, 'wb') as f:
+            np.savez(f, scale=scales, offset=offsets, max_error=errors, chunk=chunk, dtype=str(src.dtype))
+    except BaseException:
+        for tmp in (tmp_codes, tmp_params):
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        raise
+    finally:
+        del codes
+    # The parameters go first, as the codes are what the loaders look for
+    os.replace(tmp_params, params_path)
+    os.replace(tmp_codes, codes_path)
+    return {'path': file_path, 'bytes': os.path.getsize(file_path),
+            'quantized_bytes': os.path.getsize(codes_path) + os.path.getsize(params_path),
+            'max_error': float(np.max(errors))}
+
+class QuantizedArray:
+    """A read-only, memory-mapped view of a quantized file, decoded on indexing.
+
+    Indexing reads only the selected codes and decodes them with the scales
+    and offsets of their chunks, to the data type of the original file, so
+    it can be used like the memory-mapped arrays of the original files.
+
+    Parameters
+    ----------
+    codes_path : str
+        Path to the file of the codes, ending in '.q.npy'.
+
+    Examples
+    --------
+    >>> arr = QuantizedArray('HPC_runs/test_unet_601760/stage1_output/pred_X_2019.q.npy')
+    >>> july = arr[181:212]
+    """
+
+    def __init__(self, codes_path):
+        self.codes = np.load(codes_path, mmap_mode='r')
+        with np.load(quantized_paths(codes_path)[1]) as params:
+            self.scale = params['scale']
+            self.offset = params['offset']
+            self.max_error = params['max_error']
+            self.chunk = int(params['chunk'])
+            self.dtype = decoded_dtype(str(params['dtype']))
+        self.shape = self.codes.shape
+        self.ndim = self.codes.ndim
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        time_key = key[0] if len(key) > 0 and key[0] is not Ellipsis else slice(None)
+        codes = np.asarray(self.codes[key])
+        chunks = np.arange(self.shape[0])[time_key] // self.chunk
+        scale, offset = self.scale[chunks], self.offset[chunks]
+        if np.ndim(chunks) > 0:
+            # Broadcast the parameters of each chunk along the other axes
+            extra = (1,) * (codes.ndim - np.ndim(chunks))
+            scale, offset = scale.reshape(scale.shape + extra), offset.reshape(offset.shape + extra)
+        return decode_chunk(codes, scale, offset, self.dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self[...]
+        return arr if dtype is None else arr.astype(dtype)
+
+def convert_run(run_dir, dtype='int16', chunk=7, max_error=None, remove=False, verbose=True):
+    """Quantize the prediction files of an HPC run.
+
+    Parameters
+    ----------
+    run_dir : str
+        Path to the directory of the run, e.g. 'HPC_runs/test_unet_601760/'.
+    dtype : str
+        'int16' or 'float16', as in encode_chunk().
+    chunk : int
+        Number of days in each chunk.
+    max_error : float, optional
+        Maximum absolute error allowed, as in quantize_file().
+    remove : bool
+        If True, remove each original file once it has been quantized.
+    verbose : bool
+        If True, print the report of the conversion.
+
+    Returns
+    -------
+    infos : list of dict
+        The information returned by quantize_file() for each file.
+
+    Examples
+    --------
+    >>> infos = convert_run('HPC_runs/test_unet_601760/', max_error=0.05, remove=True)
+    """
+    file_paths = sorted(glob.glob(os.path.join(run_dir, 'stage*_output', 'pred_X_*.npy')))
+    file_paths = [f for f in file_paths if not f.endswith(CODES_SUFFIX)]
+    infos = []
+    for file_path in file_paths:
+        infos.append(quantize_file(file_path, dtype, chunk, max_error))
+        if remove:
+            os.remove(file_path)
+    if verbose:
+        print(report(infos))
+    return infos
+
+def report(infos):
+    """Format a report of the size reduction and error of quantized files.
+
+    Parameters
+    ----------
+    infos : list of dict
+        The information returned by quantize_file().
+
+    Returns
+    -------
+    text : str
+        The report, one line per file and a total.
+    """
+    lines = [f"{'file':<60} {'MB':>8} {'MB (q)':>8} {'ratio':>6} {'max error':>10}"]
+    for info in infos:
+        lines.append(f"{info['path'][-60:]:<60} {info['bytes']/1e6:>8.2f} {info['quantized_bytes']/1e6:>8.2f} "
+                     f"{info['bytes']/info['quantized_bytes']:>6.2f} {info['max_error']:>10.3g}")
+    if infos:
+        total, quantized = sum(i['bytes'] for i in infos), sum(i['quantized_bytes'] for i in infos)
+        lines.append(f"{'total':<60} {total/1e6:>8.2f} {quantized/1e6:>8.2f} {total/quantized:>6.2f} "
+                     f"{max(i['max_error'] for i in infos):>10.3g}")
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Quantize the prediction files of HPC runs.')
+    parser.add_argument('run_dirs', nargs='+', help='directories of the runs, e.g. HPC_runs/test_unet_601760/')
+    parser.add_argument('--dtype', default='int16', choices=['int16', 'float16'])
+    parser.add_argument('--chunk', type=int, default=7, help='number of days with the same scale and offset')
+    parser.add_argument('--max-error', type=float, default=None, help='maximum absolute error allowed')
+    parser.add_argument('--remove', action='store_true', help='remove the original files')
+    args = parser.parse_args()
+    infos = []
+    for run_dir in args.run_dirs:
+        infos += convert_run(run_dir, args.dtype, args.chunk, args.max_error, args.remove, verbose=False)
+    print(report(infos))
@@ -0,0 +1,177 @@
+import functools
+import math
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from unox import sketch as usketch
+
+# Target size of the chunks read at once
+CHUNK_BYTES = 64 * 2**20
+
+class Summary:
+    """Mergeable summary of a set of values.
+
+    Summaries of disjoint parts of the data are combined with merge(), so
+    arrays of many years and runs can be summarized chunk by chunk without
+    holding them in memory together.
+
+    Parameters
+    ----------
+    size : int
+        Total number of values.
+    n_nan : int
+        Number of NaN values.
+    vmin, vmax : number, optional
+        The minimum and maximum of the values that are not NaN.
+    sketch : unox.sketch.KLLSketch, optional
+        Quantile sketch of the values, used by quantile().
+    """
+
+    def __init__(self, size=0, n_nan=0, vmin=None, vmax=None, sketch=None):
+        self.size = size
+        self.n_nan = n_nan
+        self.min = vmin
+        self.max = vmax
+        self.sketch = sketch
+
+    def __repr__(self):
+        return f"Summary(size={self.size}, n_nan={self.n_nan}, min={self.min}, max={self.max})"
+
+    @property
+    def count(self):
+        """Number of values that are not NaN."""
+        return self.size - self.n_nan
+
+    @property
+    def abs_max(self):
+        """The largest absolute value, e.g. the half range of a diverging colour scale."""
+        if self.count == 0:
+            return None
+        return max(abs(self.min), abs(self.max))
+
+    def merge(self, other):
+        """The summary of the values of both summaries."""
+        if self.count == 0 or other.count == 0:
+            vmin, vmax = (other.min, other.max) if self.count == 0 else (self.min, self.max)
+        else:
+            vmin, vmax = min(self.min, other.min), max(self.max, other.max)
+        sketches = [s.sketch for s in (self, other) if s.sketch is not None]
+        sketch = usketch.merge_sketches(sketches) if sketches else None
+        return Summary(self.size + other.size, self.n_nan + other.n_nan, vmin, vmax, sketch)
+
+    def quantile(self, q):
+        """Approximate quantiles of the values that are not NaN.
+
+        Parameters
+        ----------
+        q : float or array_like
+            Quantiles, between 0 and 1.
+
+        Returns
+        -------
+        values : float or numpy.ndarray
+            The estimated quantiles, see unox.sketch.KLLSketch.quantile().
+        """
+        if self.sketch is None:
+            raise ValueError("The summary has no quantile sketch. Use summarize(..., quantiles=True).")
+        if self.count == 0:
+            raise ValueError("Cannot take quantiles without any values that are not NaN.")
+        return self.sketch.quantile(q)
+
+def summarize_chunk(values, quantiles=False, k=usketch.DEFAULT_K, seed=None):
+    """Summarize one chunk of values.
+
+    Parameters
+    ----------
+    values : array_like
+        The values.
+    quantiles : bool
+        If True, also build a quantile sketch of the values.
+    k : int
+        Size of the quantile sketch.
+    seed : int or sequence of int, optional
+        Seed of the quantile sketch.
+
+    Returns
+    -------
+    summary : Summary
+        The summary of the chunk.
+    """
+    values = np.asarray(values)
+    nan = np.isnan(values) if values.dtype.kind in 'fc' else None
+    n_nan = int(np.count_nonzero(nan)) if nan is not None else 0
+    summary = Summary(values.size, n_nan)
+    valid = values[~nan] if n_nan else values.ravel()
+    if quantiles:
+        summary.sketch = usketch.KLLSketch(k, seed).update(valid)
+    if n_nan < values.size:
+        summary.min, summary.max = valid.min(), valid.max()
+    return summary
+
+def iter_chunks(arrays, chunk_bytes=CHUNK_BYTES):
+    """Split arrays into chunks along their first axis.
+
+    Yields (array, key) pairs such that array[key] is a chunk of about
+    chunk_bytes. Only the keys are computed, so no data is read.
+    """
+    for arr in arrays:
+        shape = np.shape(arr)
+        if len(shape) == 0:
+            yield arr, ()
+            continue
+        itemsize = np.dtype(getattr(arr, 'dtype', np.float64)).itemsize
+        row_bytes = itemsize * math.prod(shape[1:])
+        rows = max(1, chunk_bytes // max(row_bytes, 1))
+        for start in range(0, shape[0], rows):
+            yield arr, slice(start, start + rows)
+
+def _summarize_task(task, quantiles, k, seed):
+    i, (arr, key) = task
+    return summarize_chunk(arr[key] if key != () else arr, quantiles, k, (seed, i))
+
+def summarize(arrays, quantiles=False, max_workers=None, chunk_bytes=CHUNK_BYTES, k=usketch.DEFAULT_K, seed=0):
+    """Summarize arrays in one pass over chunks, without concatenating them.
+
+    Works on anything that can be sliced along its first axis and
+    converted with numpy.asarray(): arrays, memory-mapped and quantized
+    files, xarray and dask arrays. The chunks are summarized in parallel
+    threads, as numpy releases the GIL while reading and reducing them.
+
+    Parameters
+    ----------
+    arrays : list of array_like
+        The arrays to summarize. A single array is summarized along its
+        first axis, as a list of its entries.
+    quantiles : bool
+        If True, also estimate quantiles, see Summary.quantile().
+    max_workers : int, optional
+        Number of threads. Defaults to that of ThreadPoolExecutor.
+    chunk_bytes : int
+        Target size of the chunks.
+    k : int
+        Size of the quantile sketch.
+    seed : int
+        Seed of the quantile sketches. The sketch of chunk i is seeded
+        with (seed, i), so the quantiles do not change between runs.
+
+    Returns
+    -------
+    summary : Summary
+        The count, NaN count, minimum, maximum and absolute maximum of all values.
+
+    Examples
+    --------
+    >>> preds = [loaders.open_array(unox.get_pred_data(1, 'test_unet_601760', year)) for year in range(2005, 2020)]
+    >>> summary = summarize(preds, quantiles=True)
+    >>> vmin, vmax = summary.quantile([0.01, 0.99])
+    """
+    tasks = list(enumerate(iter_chunks(arrays, chunk_bytes)))
+    if not tasks:
+        return Summary(sketch=usketch.KLLSketch(k, seed) if quantiles else None)
+    task = functools.partial(_summarize_task, quantiles=quantiles, k=k, seed=seed)
+    if len(tasks) == 1 or max_workers == 1:
+        summaries = map(task, tasks)
+    else:
+        with ThreadPoolExecutor(max_workers) as executor:
+            summaries = list(executor.map(task, tasks))
+    return functools.reduce(Summary.merge, summaries)
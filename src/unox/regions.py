@@ -0,0 +1,388 @@
+import functools
+import json
+import os
+import numpy as np
+
+from unox import grid as ugrid
+
+# Number of polygon edges tested against all grid points at once
+EDGE_BLOCK = 256
+
+class Region:
+    """A region of the Unet grid, rasterized once and applied to many arrays.
+
+    The region is a boolean mask over the (lat, lon) grid. Its bounding
+    box, the mask within the box and the indices of its cells are computed
+    on first use and kept, so applying the region to arrays of many years
+    and runs does no geometry work.
+
+    The arrays are indexed along their latitude and longitude axes, which
+    are axes 1 and 2 for the (time, lat, lon, channel) arrays of the
+    sample data and predictions.
+
+    Parameters
+    ----------
+    mask : numpy.ndarray
+        Boolean array of shape grid.shape, True for the cells in the region.
+    grid : unox.grid.Grid
+        The grid of the mask.
+    name : str, optional
+        Name of the region.
+
+    Examples
+    --------
+    >>> texas = geojson_region('datafiles/us_states.geojson', names=['Texas'])
+    >>> arrs = texas.gather([truth, stage1, stage2])
+    """
+
+    def __init__(self, mask, grid, name=None):
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != grid.shape:
+            raise ValueError(f"The mask has shape {mask.shape}, but the grid has shape {grid.shape}.")
+        if not mask.any():
+            raise ValueError(f"The region {name!r} does not contain any grid points.")
+        self.mask = ugrid._readonly(mask.copy())
+        self.grid = grid
+        self.name = name
+
+    def __repr__(self):
+        return f"Region(name={self.name!r}, n_cells={self.n_cells}, extent={self.extent})"
+
+    def __and__(self, other):
+        return Region(self.mask & self._other_mask(other), self.grid, f"{self.name} & {other.name}")
+
+    def __or__(self, other):
+        return Region(self.mask | self._other_mask(other), self.grid, f"{self.name} | {other.name}")
+
+    def __invert__(self):
+        return Region(~self.mask, self.grid, f"~{self.name}")
+
+    def _other_mask(self, other):
+        if other.grid is not self.grid and (not np.array_equal(other.grid.lats, self.grid.lats)
+                                            or not np.array_equal(other.grid.lons, self.grid.lons)):
+            raise ValueError("Cannot combine regions on different grids.")
+        return other.mask
+
+    @functools.cached_property
+    def slices(self):
+        """The (lat_slice, lon_slice) of the bounding box of the region."""
+        i = np.flatnonzero(self.mask.any(axis=1))
+        j = np.flatnonzero(self.mask.any(axis=0))
+        return slice(i[0], i[-1] + 1), slice(j[0], j[-1] + 1)
+
+    @functools.cached_property
+    def box_mask(self):
+        """The mask within the bounding box of the region."""
+        return ugrid._readonly(self.mask[self.slices])
+
+    @functools.cached_property
+    def cells(self):
+        """The (lat, lon) indices of the cells of the region, relative to the bounding box."""
+        i, j = np.nonzero(self.box_mask)
+        return ugrid._readonly(i), ugrid._readonly(j)
+
+    @property
+    def n_cells(self):
+        """Number of grid cells in the region."""
+        return len(self.cells[0])
+
+    @property
+    def is_box(self):
+        """Whether the region fills its bounding box, so that views select it exactly."""
+        return self.n_cells == self.box_mask.size
+
+    @property
+    def lats(self):
+        """The latitude values of the bounding box."""
+        return self.grid.lats[self.slices[0]]
+
+    @property
+    def lons(self):
+        """The longitude values of the bounding box."""
+        return self.grid.lons[self.slices[1]]
+
+    @property
+    def extent(self):
+        """The extent of the bounding box as (lat_min, lat_max, lon_min, lon_max)."""
+        return (self.lats[0], self.lats[-1], self.lons[0], self.lons[-1])
+
+    @functools.cached_property
+    def cell_areas(self):
+        """The area in m² of each cell of the region, in the order of gather()."""
+        return ugrid._readonly(self.grid.cell_areas[self.slices][self.cells])
+
+    def view(self, arrs, lat_axis=1):
+        """Views of the bounding box of the region, without copying.
+
+        Parameters
+        ----------
+        arrs : numpy.ndarray or list of numpy.ndarray
+            Arrays with latitude and longitude on axes lat_axis and lat_axis + 1.
+        lat_axis : int
+            The latitude axis of the arrays.
+
+        Returns
+        -------
+        views : numpy.ndarray or list of numpy.ndarray
+            The arrays restricted to the bounding box. Cells of the box that
+            are outside the region are kept; see masked() and gather().
+        """
+        key = (slice(None),) * lat_axis + self.slices
+        return _map(lambda arr: arr[key], arrs)
+
+    def masked(self, arrs, lat_axis=1, fill=np.nan):
+        """The bounding box of the region, with the cells outside the region set to fill.
+
+        Regions that fill their bounding box are returned as views, as in view().
+        """
+        if self.is_box:
+            return self.view(arrs, lat_axis)
+        shape = self.box_mask.shape
+        def mask(arr):
+            box = np.array(self.view(arr, lat_axis), dtype=np.result_type(arr.dtype, type(fill)))
+            outside = (~self.box_mask).reshape((1,) * lat_axis + shape + (1,) * (box.ndim - lat_axis - 2))
+            return np.where(outside, fill, box)
+        return _map(mask, arrs)
+
+    def gather(self, arrs, lat_axis=1):
+        """The values of the cells of the region, with the lat and lon axes merged into one.
+
+        Only the bounding box is read, so this is cheap on memory-mapped arrays.
+
+        Parameters
+        ----------
+        arrs : numpy.ndarray or list of numpy.ndarray
+            Arrays with latitude and longitude on axes lat_axis and lat_axis + 1.
+        lat_axis : int
+            The latitude axis of the arrays.
+
+        Returns
+        -------
+        values : numpy.ndarray or list of numpy.ndarray
+            For (time, lat, lon, channel) arrays, arrays of shape
+            (time, n_cells, channel).
+        """
+        key = (slice(None),) * lat_axis + self.cells
+        return _map(lambda arr: np.asarray(self.view(arr, lat_axis))[key], arrs)
+
+    def scatter(self, values, lat_axis=1, fill=np.nan):
+        """Put values gathered with gather() back on the full grid, filling the other cells."""
+        values = np.asarray(values)
+        shape = values.shape[:lat_axis] + self.grid.shape + values.shape[lat_axis + 1:]
+        out = np.full(shape, fill, dtype=np.result_type(values.dtype, type(fill)))
+        lat_slice, lon_slice = self.slices
+        i, j = self.cells
+        key = (slice(None),) * lat_axis + (i + lat_slice.start, j + lon_slice.start)
+        out[key] = values
+        return out
+
+def _map(func, arrs):
+    """Apply func to one array or to each array of a list."""
+    if isinstance(arrs, (list, tuple)):
+        return [func(arr) for arr in arrs]
+    return func(arrs)
+
+def box_region(box, grid=None, name=None, tolerance=None):
+    """The region of the grid points within a latitude and longitude box.
+
+    Parameters
+    ----------
+    box : tuple
+        The box as (lat_min, lat_max, lon_min, lon_max), as returned by
+        unox.data.get_extent(). Grid points on the edges are included.
+    grid : unox.grid.Grid, optional
+        The grid. Defaults to unox.grid.get_grid().
+    name : str, optional
+        Name of the region.
+    tolerance : float, optional
+        If given, the corners of the box must be grid points, up to this
+        distance, and the box is snapped to them. Otherwise a ValueError
+        is raised.
+
+    Returns
+    -------
+    region : Region
+        The region.
+    """
+    grid = grid or ugrid.get_grid()
+    if tolerance is not None:
+        lat_min, lat_max, lon_min, lon_max = box
+        i = grid.lat_index([lat_min, lat_max], tolerance)
+        j = grid.lon_index([lon_min, lon_max], tolerance)
+        if min(*i, *j) < 0:
+            raise ValueError(f"The corners of the box {box} are not on the grid.")
+        box = (grid.lats[i[0]], grid.lats[i[1]], grid.lons[j[0]], grid.lons[j[1]])
+    lat_slice, lon_slice = grid.box_slices(box)
+    mask = np.zeros(grid.shape, dtype=bool)
+    mask[lat_slice, lon_slice] = True
+    return Region(mask, grid, name)
+
+def _crossings(x, y, ring):
+    """Number of edges of the ring crossed by a ray from each point towards +x."""
+    x0, y0 = ring[:, 0], ring[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    count = np.zeros(x.shape, dtype=np.intp)
+    for k in range(0, len(ring), EDGE_BLOCK):
+        e = slice(k, k + EDGE_BLOCK)
+        ex0, ey0, ex1, ey1 = (a[e, None] for a in (x0, y0, x1, y1))
+        spans = (ey0 > y) != (ey1 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = ex0 + (y - ey0) * (ex1 - ex0) / (ey1 - ey0)
+        count += np.sum(spans & (x < x_cross), axis=0)
+    return count
+
+def polygon_mask(polygon, grid):
+    """Mask of the grid points inside a polygon, with the even-odd rule.
+
+    Parameters
+    ----------
+    polygon : list of array_like
+        The rings of the polygon, each of shape (n, 2) in (lon, lat) order
+        as in GeoJSON: the exterior ring, then any holes.
+    grid : unox.grid.Grid
+        The grid.
+
+    Returns
+    -------
+    mask : numpy.ndarray
+        Boolean array of shape grid.shape.
+    """
+    rings = [np.asarray(ring, dtype=np.float64)[:, :2] for ring in polygon]
+    lon, lat = np.meshgrid(grid.lons, grid.lats)
+    # Compare longitudes in the convention of the polygon
+    if max(ring[:, 0].max() for ring in rings) > 180:
+        lon = lon % 360
+    mask = np.zeros(grid.shape, dtype=bool)
+    # Only the grid points in the bounding box of the exterior ring can be inside
+    lon_min, lat_min = rings[0].min(axis=0)
+    lon_max, lat_max = rings[0].max(axis=0)
+    candidates = (lon >= lon_min) & (lon <= lon_max) & (lat >= lat_min) & (lat <= lat_max)
+    if not candidates.any():
+        return mask
+    count = sum(_crossings(lon[candidates], lat[candidates], ring) for ring in rings)
+    mask[candidates] = count % 2 == 1
+    return mask
+
+def geometry_mask(geometry, grid):
+    """Mask of the grid points inside a GeoJSON Polygon or MultiPolygon geometry."""
+    if geometry['type'] == 'Polygon':
+        return polygon_mask(geometry['coordinates'], grid)
+    if geometry['type'] == 'MultiPolygon':
+        mask = np.zeros(grid.shape, dtype=bool)
+        for polygon in geometry['coordinates']:
+            mask |= polygon_mask(polygon, grid)
+        return mask
+    if geometry['type'] == 'GeometryCollection':
+        mask = np.zeros(grid.shape, dtype=bool)
+        for part in geometry['geometries']:
+            mask |= geometry_mask(part, grid)
+        return mask
+    raise ValueError(f"Cannot rasterize a {geometry['type']} geometry, only polygons.")
+
+def polygon_region(polygon, grid=None, name=None):
+    """The region of the grid points inside a polygon, given as in polygon_mask()
+    or as a GeoJSON geometry."""
+    grid = grid or ugrid.get_grid()
+    if isinstance(polygon, dict):
+        return Region(geometry_mask(polygon, grid), grid, name)
+    return Region(polygon_mask(polygon, grid), grid, name)
+
+def load_features(file_path, name_property='name'):
+    """Load the polygons of a GeoJSON file, such as state borders or land areas.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the GeoJSON file, with a FeatureCollection, a Feature or a geometry.
+    name_property : str
+        Property of the features that holds their names.
+
+    Returns
+    -------
+    features : dict
+        Name of each feature -> its geometry. Features without a name are
+        named by their position in the file.
+    """
+    with open(file_path) as f:
+        content = json.load(f)
+    if content['type'] == 'FeatureCollection':
+        features = content['features']
+    elif content['type'] == 'Feature':
+        features = [content]
+    else:
+        features = [{'type': 'Feature', 'properties': {}, 'geometry': content}]
+    return {str((feature.get('properties') or {}).get(name_property, k)): feature['geometry']
+            for k, feature in enumerate(features)}
+
+@functools.lru_cache(maxsize=32)
+def _cached_regions(file_path, mtime, name_property, grid):
+    """Rasterize every feature of a GeoJSON file. The modification time is part of the cache key."""
+    masks = {}
+    for name, geometry in load_features(file_path, name_property).items():
+        mask = geometry_mask(geometry, grid)
+        # Features outside the grid have no region
+        if mask.any():
+            masks[name] = Region(mask, grid, name)
+    return masks
+
+def geojson_regions(file_path, grid=None, name_property='name'):
+    """The regions of all features of a GeoJSON file, rasterized once per process.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the GeoJSON file, e.g. of state or province borders.
+    grid : unox.grid.Grid, optional
+        The grid. Defaults to unox.grid.get_grid().
+    name_property : str
+        Property of the features that holds their names.
+
+    Returns
+    -------
+    regions : dict
+        Name -> Region of each feature that covers grid points. The
+        dictionary is shared between calls and must not be modified.
+
+    Examples
+    --------
+    >>> states = geojson_regions('datafiles/us_states.geojson')
+    >>> texas = states['Texas'].gather(stage1)
+    """
+    grid = grid or ugrid.get_grid()
+    file_path = os.path.abspath(file_path)
+    return _cached_regions(file_path, os.path.getmtime(file_path), name_property, grid)
+
+def geojson_region(file_path, names=None, grid=None, name_property='name', name=None):
+    """The union of the features of a GeoJSON file, e.g. a land mask.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the GeoJSON file.
+    names : list of str, optional
+        Names of the features to combine. Defaults to all of them.
+    grid : unox.grid.Grid, optional
+        The grid. Defaults to unox.grid.get_grid().
+    name_property : str
+        Property of the features that holds their names.
+    name : str, optional
+        Name of the region. Defaults to the names of the features.
+
+    Returns
+    -------
+    region : Region
+        The region. Its complement ~region is e.g. the ocean of a land mask.
+
+    Examples
+    --------
+    >>> land = geojson_region('datafiles/land.geojson', name='land')
+    >>> ocean = ~land
+    """
+    regions = geojson_regions(file_path, grid, name_property)
+    names = list(regions) if names is None else list(names)
+    missing = [n for n in names if n not in regions]
+    if missing:
+        raise KeyError(f"{missing} are not features on the grid in {file_path}.")
+    grid = regions[names[0]].grid
+    mask = np.logical_or.reduce([regions[n].mask for n in names])
+    return Region(mask, grid, name or ', '.join(names))
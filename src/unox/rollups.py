@@ -0,0 +1,200 @@
+import argparse
+import glob
+import os
+import re
+import numpy as np
+
+from unox import loaders
+from unox import metrics
+
+# Periods of the rollups, in order: the months, the seasons and the year. Each rollup covers
+#   one calendar year, so 'djf' is January, February and December of the same year, not the
+#   contiguous winter that starts in the December of the previous year
+MONTHS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+SEASONS = {'djf': [0, 1, 11], 'mam': [2, 3, 4], 'jja': [5, 6, 7], 'son': [8, 9, 10]}
+PERIODS = MONTHS + list(SEASONS) + ['annual']
+
+# Statistics of each period and grid cell. count is the number of days that are not NaN
+STATS = ['mean', 'max', 'count']
+
+# Directory and suffix of the rollup files. The rollup of stage1_output/pred_X_2019.npy is
+#   stage1_output/rollups/pred_X_2019.rollup.npy, out of the way of globs like X_20*.npy over the year files
+ROLLUP_DIR = 'rollups'
+ROLLUP_SUFFIX = '.rollup.npy'
+
+YEAR_PATTERN = re.compile(r'_(?P<year>\d{4})(?:\.q)?\.npy$')
+
+def rollup_path(file_path):
+    """Path of the rollup of a .npy or quantized '.q.npy' file."""
+    directory, name = os.path.split(file_path)
+    for suffix in ('.q.npy', '.npy'):
+        if name.endswith(suffix):
+            return os.path.join(directory, ROLLUP_DIR, name[:-len(suffix)] + ROLLUP_SUFFIX)
+    raise ValueError(f"{file_path} is not a .npy file.")
+
+def file_year(file_path):
+    """The year of a file named like X_2019.npy or pred_X_2019.npy."""
+    match = YEAR_PATTERN.search(os.path.basename(file_path))
+    if match is None:
+        raise ValueError(f"Cannot find the year of {file_path}.")
+    return int(match['year'])
+
+def _month_slices(n_days, year):
+    """The slice of days of each month, for a file of n_days days."""
+    months = metrics.month_index(year)[:n_days]
+    slices = []
+    for month in range(12):
+        days = np.flatnonzero(months == month)
+        slices.append(slice(days[0], days[-1] + 1) if len(days) else slice(0, 0))
+    return slices
+
+def _month_stats(arr, days):
+    """The sum, maximum and count of the values of the given days, per cell."""
+    values = np.asarray(arr[days], dtype=np.float64)
+    if len(values) == 0:
+        shape = arr.shape[1:]
+        return np.zeros(shape), np.full(shape, np.nan), np.zeros(shape)
+    valid = ~np.isnan(values)
+    # fmax ignores NaN values, and gives NaN only where all values are NaN
+    return np.nansum(values, axis=0), np.fmax.reduce(values, axis=0), valid.sum(axis=0)
+
+def _fill_periods(rollup):
+    """Compute the seasons and the year of a rollup from its months."""
+    mean, vmax, count = rollup[0, :12].astype(np.float64), rollup[1, :12], rollup[2, :12].astype(np.float64)
+    total = np.where(count > 0, mean, 0) * count
+    for k, months in enumerate(list(SEASONS.values()) + [list(range(12))]):
+        n = count[months].sum(axis=0)
+        rollup[0, 12 + k] = np.divide(total[months].sum(axis=0), n, out=np.full(n.shape, np.nan), where=n > 0)
+        rollup[1, 12 + k] = np.fmax.reduce(vmax[months], axis=0)
+        rollup[2, 12 + k] = n
+
+def compute_rollup(arr, year):
+    """The rollup of a year of daily values.
+
+    Parameters
+    ----------
+    arr : array_like
+        Array of shape (time, lat, lon, channel). It is read one month at a time.
+    year : int
+        The year of the array, to find the months of its days.
+
+    Returns
+    -------
+    rollup : numpy.ndarray
+        float32 array of shape (len(STATS), len(PERIODS), lat, lon, channel).
+        rollup[STATS.index(stat), PERIODS.index(period)] is the given
+        statistic of the period, e.g. the July means. The seasons are
+        those of the calendar year, so 'djf' is January, February and
+        December of the year.
+    """
+    rollup = np.empty((len(STATS), len(PERIODS)) + arr.shape[1:], dtype=np.float32)
+    for month, days in enumerate(_month_slices(arr.shape[0], year)):
+        total, vmax, count = _month_stats(arr, days)
+        rollup[0, month] = np.divide(total, count, out=np.full(total.shape, np.nan), where=count > 0)
+        rollup[1, month], rollup[2, month] = vmax, count
+    _fill_periods(rollup)
+    return rollup
+
+def write_rollup(file_path, year=None):
+    """Compute the rollup of a .npy file and write it in the rollups/ directory next to the file.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the .npy file, e.g. a prediction or Y file.
+    year : int, optional
+        The year of the file. Defaults to the year in its name.
+
+    Returns
+    -------
+    path : str
+        Path to the rollup file.
+
+    Examples
+    --------
+    >>> np.save('HPC_runs/test_unet_601760/stage1_output/pred_X_2019.npy', pred)
+    >>> write_rollup('HPC_runs/test_unet_601760/stage1_output/pred_X_2019.npy')
+    """
+    year = file_year(file_path) if year is None else year
+    rollup = compute_rollup(loaders.open_array(file_path), year)
+    path = rollup_path(file_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, rollup)
+    os.replace(tmp_path, path)
+    return path
+
+def update_rollup(file_path, date):
+    """Update the rollup of a file after one of its days was written.
+
+    Only the month of the day is read again. The rollup is written in
+    full if it does not exist yet.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the .npy file.
+    date : datetime.date
+        The day that was written.
+
+    Returns
+    -------
+    path : str
+        Path to the rollup file.
+    """
+    path = rollup_path(file_path)
+    if not os.path.exists(path):
+        return write_rollup(file_path, date.year)
+    arr = np.load(file_path, mmap_mode='r')
+    rollup = np.load(path, mmap_mode='r+')
+    month = date.month - 1
+    total, vmax, count = _month_stats(arr, _month_slices(arr.shape[0], date.year)[month])
+    rollup[0, month] = np.divide(total, count, out=np.full(total.shape, np.nan), where=count > 0)
+    rollup[1, month], rollup[2, month] = vmax, count
+    _fill_periods(rollup)
+    rollup.flush()
+    del rollup
+    # Mark the rollup as up to date with the file
+    os.utime(path)
+    return path
+
+def open_rollup(file_path, build=True):
+    """Open the rollup of a .npy file memory-mapped, building it if it is missing or out of date.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the .npy file.
+    build : bool
+        If True, write the rollup if needed. Otherwise a missing or out of
+        date rollup raises a FileNotFoundError.
+
+    Returns
+    -------
+    rollup : numpy.memmap
+        The rollup, as returned by compute_rollup().
+    """
+    path = rollup_path(file_path)
+    if not (os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(file_path)):
+        if not build:
+            raise FileNotFoundError(f"The rollup of {file_path} is missing or older than the file.")
+        write_rollup(file_path)
+    return loaders.open_array(path)
+
+def rollup_run(run_dir):
+    """Write the rollups of the prediction files of an HPC run.
+
+    Returns the paths of the rollup files.
+    """
+    file_paths = sorted(glob.glob(os.path.join(run_dir, 'stage*_output', 'pred_X_*.npy')))
+    file_paths = [f for f in file_paths if not (f.endswith('.q.npy') and os.path.exists(f[:-len('.q.npy')] + '.npy'))]
+    return [write_rollup(file_path) for file_path in file_paths]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write the monthly, seasonal and annual rollups of HPC runs.')
+    parser.add_argument('run_dirs', nargs='+', help='directories of the runs, e.g. HPC_runs/test_unet_601760/')
+    args = parser.parse_args()
+    for run_dir in args.run_dirs:
+        for path in rollup_run(run_dir):
+            print(f"Wrote {path}")
@@ -0,0 +1,317 @@
+import os
+import re
+import numpy as np
+
+from unox import catalog
+
+# Patterns of the training artifacts, relative to the root of the runs directory
+LOG_PATTERN = re.compile(r'(?P<run>[^/]+)/unet_stage(?P<stage>\d+)_log\.csv$')
+CHECKPOINT_PATTERN = re.compile(r'(?P<run>[^/]+)/unet_checkpt_(?P<val_loss>[-\d.]+|nan|inf)_(?P<r2>[-\d.]+|nan|inf)_stage(?P<stage>\d+)\.h5$')
+
+# Columns of the CSVLogger logs kept in the registry, and their names in it
+LOG_COLUMNS = {'epoch': 'epoch', 'loss': 'loss', 'val_loss': 'val_loss', 'r2_keras': 'r2',
+               'val_r2_keras': 'val_r2', 'wall_time': 'wall_time'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS run_sources (
+    path TEXT PRIMARY KEY,
+    mtime REAL,
+    size INTEGER
+);
+CREATE TABLE IF NOT EXISTS run_epochs (
+    path TEXT,
+    run TEXT,
+    stage INTEGER,
+    epoch INTEGER,
+    loss REAL,
+    val_loss REAL,
+    r2 REAL,
+    val_r2 REAL,
+    wall_time REAL
+);
+CREATE INDEX IF NOT EXISTS run_epochs_path ON run_epochs (path);
+CREATE INDEX IF NOT EXISTS run_epochs_query ON run_epochs (run, stage);
+CREATE TABLE IF NOT EXISTS run_checkpoints (
+    path TEXT PRIMARY KEY,
+    run TEXT,
+    stage INTEGER,
+    val_loss REAL,
+    r2 REAL,
+    mtime REAL
+);
+"""
+
+def connect(root):
+    """Open the catalog of the given runs directory, with the tables of the run registry."""
+    conn = catalog.connect(root)
+    conn.executescript(SCHEMA)
+    return conn
+
+def parse_log(file_path, sep=';'):
+    """Parse a CSVLogger log of a training stage.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the unet_stage{1,2}_log.csv file.
+    sep : str
+        Separator of the log, as given to CSVLogger.
+
+    Returns
+    -------
+    rows : list of tuple
+        (epoch, loss, val_loss, r2, val_r2, wall_time) for each epoch. Values
+        missing from the log are NaN. Logs appended by several trainings
+        keep the rows of every training, in order.
+    """
+    rows = []
+    header = None
+    with open(file_path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            fields = line.strip().split(sep)
+            # A restarted training with a different set of metrics writes a new header
+            if fields[0] == 'epoch':
+                header = fields
+                continue
+            if header is None:
+                continue
+            values = dict(zip(header, fields))
+            row = []
+            for column in LOG_COLUMNS:
+                try:
+                    row.append(float(values[column]))
+                except (KeyError, ValueError):
+                    row.append(np.nan)
+            if np.isnan(row[0]):
+                continue
+            row[0] = int(row[0])
+            rows.append(tuple(row))
+    return rows
+
+def parse_checkpoint(rel_path):
+    """Parse the run, stage and metrics of a checkpoint from its path.
+
+    Parameters
+    ----------
+    rel_path : str
+        Path of the checkpoint, relative to the root of the runs directory.
+
+    Returns
+    -------
+    info : dict or None
+        The 'run', 'stage', 'val_loss' and 'r2' of the checkpoint, or None
+        if the path is not that of a checkpoint.
+
+    Examples
+    --------
+    >>> parse_checkpoint('test_unet_601760/unet_checkpt_12.34_0.87_stage1.h5')
+    {'run': 'test_unet_601760', 'stage': 1, 'val_loss': 12.34, 'r2': 0.87}
+    """
+    match = CHECKPOINT_PATTERN.search(rel_path)
+    if match is None:
+        return None
+    return {'run': match['run'], 'stage': int(match['stage']),
+            'val_loss': float(match['val_loss']), 'r2': float(match['r2'])}
+
+def refresh(root='HPC_runs/'):
+    """Bring the run registry of the given runs directory up to date.
+
+    The directories are scanned incrementally by the catalog, and only logs
+    that are new or whose size or mtime changed are parsed again, so the
+    cost of a refresh with no new training artifacts does not depend on the
+    number of epochs logged.
+
+    Parameters
+    ----------
+    root : str
+        Path to the runs directory.
+
+    Examples
+    --------
+    >>> refresh('HPC_runs/')
+    """
+    entries = catalog.list_files(root, kind='other')
+    conn = connect(root)
+    with conn:
+        known = {row[0]: (row[1], row[2]) for row in conn.execute('SELECT path, mtime, size FROM run_sources')}
+        seen = set()
+        for entry in entries:
+            rel_path = os.path.relpath(entry['path'], root).replace(os.sep, '/')
+            match = LOG_PATTERN.search(rel_path)
+            checkpoint = parse_checkpoint(rel_path)
+            if match is None and checkpoint is None:
+                continue
+            seen.add(rel_path)
+            if match is not None:
+                # Appending to a log does not change the mtime of its directory,
+                #   so the catalog may not have seen it change
+                stat = os.stat(entry['path'])
+                entry['mtime'], entry['size'] = stat.st_mtime, stat.st_size
+            if known.get(rel_path) == (entry['mtime'], entry['size']):
+                continue
+            if match is not None:
+                conn.execute('DELETE FROM run_epochs WHERE path = ?', (rel_path,))
+                conn.executemany('INSERT INTO run_epochs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                 [(rel_path, match['run'], int(match['stage'])) + row for row in parse_log(entry['path'])])
+            else:
+                conn.execute('INSERT OR REPLACE INTO run_checkpoints VALUES (?, ?, ?, ?, ?, ?)',
+                             (rel_path, checkpoint['run'], checkpoint['stage'], checkpoint['val_loss'],
+                              checkpoint['r2'], entry['mtime']))
+            conn.execute('INSERT OR REPLACE INTO run_sources VALUES (?, ?, ?)', (rel_path, entry['mtime'], entry['size']))
+        # Forget the artifacts that were removed
+        for rel_path in set(known) - seen:
+            conn.execute('DELETE FROM run_sources WHERE path = ?', (rel_path,))
+            conn.execute('DELETE FROM run_epochs WHERE path = ?', (rel_path,))
+            conn.execute('DELETE FROM run_checkpoints WHERE path = ?', (rel_path,))
+
+def _query(root, table, columns, run=None, stage=None, order='run, stage'):
+    """Query a table of the run registry into a pandas DataFrame."""
+    import pandas as pd
+    refresh(root)
+    where, values = [], []
+    if run is not None:
+        runs = [run] if isinstance(run, str) else list(run)
+        where.append(f"run IN ({', '.join('?' * len(runs))})")
+        values.extend(runs)
+    if stage is not None:
+        where.append('stage = ?')
+        values.append(stage)
+    where = ' WHERE ' + ' AND '.join(where) if where else ''
+    rows = connect(root).execute(f'SELECT {columns} FROM {table}{where} ORDER BY {order}', values).fetchall()
+    return pd.DataFrame(rows, columns=[c.strip() for c in columns.split(',')])
+
+def epochs(root='HPC_runs/', run=None, stage=None):
+    """Get the training history of the runs.
+
+    Parameters
+    ----------
+    root : str
+        Path to the runs directory.
+    run : str or list of str, optional
+        ID(s) of the HPC runs. All runs if None.
+    stage : int, optional
+        Stage of the training (1 or 2). Both stages if None.
+
+    Returns
+    -------
+    history : pandas.DataFrame
+        One row per epoch, with the columns 'run', 'stage', 'epoch', 'loss',
+        'val_loss', 'r2', 'val_r2' and 'wall_time'. The wall time is only
+        known if the log has a 'wall_time' column, and is NaN otherwise.
+
+    Examples
+    --------
+    >>> history = epochs(run='test_unet_601760', stage=1)
+    """
+    return _query(root, 'run_epochs', 'run, stage, epoch, loss, val_loss, r2, val_r2, wall_time', run, stage,
+                  order='run, stage, rowid')
+
+def checkpoints(root='HPC_runs/', run=None, stage=None):
+    """Get the checkpoints of the runs, with the metrics encoded in their names.
+
+    Parameters
+    ----------
+    root : str
+        Path to the runs directory.
+    run : str or list of str, optional
+        ID(s) of the HPC runs. All runs if None.
+    stage : int, optional
+        Stage of the training (1 or 2). Both stages if None.
+
+    Returns
+    -------
+    checkpts : pandas.DataFrame
+        One row per checkpoint, with the columns 'run', 'stage', 'val_loss',
+        'r2', 'mtime' and 'path' (relative to root).
+    """
+    return _query(root, 'run_checkpoints', 'run, stage, val_loss, r2, mtime, path', run, stage,
+                  order='run, stage, mtime')
+
+def summary(root='HPC_runs/', run=None, stage=None):
+    """Summarize each training stage of each run in a single row.
+
+    Parameters
+    ----------
+    root : str
+        Path to the runs directory.
+    run : str or list of str, optional
+        ID(s) of the HPC runs. All runs if None.
+    stage : int, optional
+        Stage of the training (1 or 2). Both stages if None.
+
+    Returns
+    -------
+    table : pandas.DataFrame
+        One row per run and stage, with the columns 'run', 'stage', 'epochs',
+        'best_epoch', 'loss', 'val_loss', 'r2', 'val_r2' (the metrics at the
+        epoch of lowest val_loss), 'best_checkpoint' and 'wall_time' in seconds.
+        The wall time is the sum of the logged epoch times if the log has them.
+        Otherwise it is estimated from the mtimes of the artifacts: the first
+        checkpoint is written at the end of the first epoch and the log at the
+        end of the last one.
+
+    Examples
+    --------
+    >>> table = summary(stage=1)
+    """
+    import pandas as pd
+    history = epochs(root, run, stage)
+    checkpts = checkpoints(root, run, stage)
+    log_mtimes = {}
+    for rel_path, mtime in connect(root).execute('SELECT path, mtime FROM run_sources'):
+        match = LOG_PATTERN.search(rel_path)
+        if match is not None:
+            log_mtimes[(match['run'], int(match['stage']))] = mtime
+    rows = []
+    for (this_run, this_stage), group in history.groupby(['run', 'stage'], sort=True):
+        best = group.loc[group['val_loss'].idxmin()] if group['val_loss'].notna().any() else group.iloc[-1]
+        these = checkpts[(checkpts['run'] == this_run) & (checkpts['stage'] == this_stage)]
+        best_checkpoint = these.loc[these['val_loss'].idxmin(), 'path'] if len(these) else None
+        if group['wall_time'].notna().any():
+            wall_time = group['wall_time'].sum()
+        elif len(these) and len(group) > 1 and (this_run, this_stage) in log_mtimes:
+            span = log_mtimes[(this_run, this_stage)] - these['mtime'].min()
+            wall_time = span * len(group) / (len(group) - 1)
+        else:
+            wall_time = np.nan
+        rows.append({'run': this_run, 'stage': this_stage, 'epochs': len(group), 'best_epoch': best['epoch'],
+                     'loss': best['loss'], 'val_loss': best['val_loss'], 'r2': best['r2'], 'val_r2': best['val_r2'],
+                     'best_checkpoint': best_checkpoint, 'wall_time': wall_time})
+    columns = ['run', 'stage', 'epochs', 'best_epoch', 'loss', 'val_loss', 'r2', 'val_r2', 'best_checkpoint', 'wall_time']
+    return pd.DataFrame(rows, columns=columns)
+
+def rank(root='HPC_runs/', stage=1, by='val_loss', ascending=None, top=None):
+    """Rank the runs by a metric of their best epoch.
+
+    Parameters
+    ----------
+    root : str
+        Path to the runs directory.
+    stage : int
+        Stage of the training (1 or 2).
+    by : str
+        Column of summary() to rank by.
+    ascending : bool, optional
+        Sort order. Defaults to descending for 'r2' and 'val_r2', and
+        ascending for the other columns.
+    top : int, optional
+        Number of runs to keep. All runs if None.
+
+    Returns
+    -------
+    table : pandas.DataFrame
+        The rows of summary() for the given stage, best first.
+
+    Examples
+    --------
+    >>> best = rank(stage=2, by='val_r2', top=10)
+    """
+    table = summary(root, stage=stage)
+    if by not in table.columns:
+        raise ValueError(f"Unknown column {by!r}, must be one of {list(table.columns)}.")
+    if ascending is None:
+        ascending = by not in ('r2', 'val_r2')
+    table = table.sort_values(by, ascending=ascending, na_position='last', kind='stable').reset_index(drop=True)
+    return table if top is None else table.head(top)
@@ -0,0 +1,177 @@
+import argparse
+import json
+import os
+import numpy as np
+
+from unox import unox
+from unox import loaders
+
+INDEX_NAME = 'index.json'
+
+def shard_paths(i):
+    """Names of the X and Y files of shard i."""
+    return f'shard_{i:05d}_x.npy', f'shard_{i:05d}_y.npy'
+
+def export_shards(stage, years, out_dir, n_shards=None, shard_size=None, seed=0, dtype=None):
+    """Export the sample data of several years as balanced, pre-shuffled shards.
+
+    The days of all years are shuffled together with a fixed seed, and split
+    into shards whose sizes differ by at most one sample. Each shard is an X
+    and a Y .npy file, and index.json lists the shards and the (year, day)
+    of every sample in them.
+
+    Parameters
+    ----------
+    stage : int
+        Stage of the data (1 or 2).
+    years : list of int
+        Years to export.
+    out_dir : str
+        Directory to write the shards to.
+    n_shards : int, optional
+        Number of shards. Either n_shards or shard_size must be given.
+    shard_size : int, optional
+        Maximum number of samples in each shard.
+    seed : int
+        Seed of the shuffle.
+    dtype : numpy.dtype, optional
+        dtype of the shards, e.g. np.float32. Defaults to that of the files.
+
+    Returns
+    -------
+    index : dict
+        The content of index.json.
+
+    Examples
+    --------
+    >>> index = export_shards(1, range(2005, 2019), 'shards/stage1', n_shards=16)
+    """
+    years = list(years)
+    x_files = {year: unox.get_sample_data(stage, 'x', year) for year in years}
+    y_files = {year: unox.get_sample_data(stage, 'y', year) for year in years}
+    lengths = [loaders.open_array(x_files[year]).shape[0] for year in years]
+    for year, n in zip(years, lengths):
+        if loaders.open_array(y_files[year]).shape[0] != n:
+            raise ValueError(f"The X and Y files of {year} have different numbers of days.")
+    # (year, day) of every sample, in shuffled order
+    samples = np.array([(year, day) for year, n in zip(years, lengths) for day in range(n)])
+    samples = samples[np.random.default_rng(seed).permutation(len(samples))]
+    if n_shards is None:
+        if shard_size is None:
+            raise ValueError("Either n_shards or shard_size must be given.")
+        n_shards = -(-len(samples) // shard_size)
+    if not 0 < n_shards <= len(samples):
+        raise ValueError(f"Cannot split {len(samples)} samples into {n_shards} shards.")
+    os.makedirs(out_dir, exist_ok=True)
+    shards = []
+    for i, shard in enumerate(np.array_split(samples, n_shards)):
+        names = shard_paths(i)
+        for name, files in zip(names, [x_files, y_files]):
+            src = loaders.open_array(files[years[0]])
+            out = np.lib.format.open_memmap(os.path.join(out_dir, name), mode='w+',
+                                            dtype=dtype or src.dtype, shape=(len(shard),) + src.shape[1:])
+            # Read the days of each year in increasing order, then put them in their shuffled place
+            for year in np.unique(shard[:, 0]):
+                where = np.where(shard[:, 0] == year)[0]
+                order = np.argsort(shard[where, 1])
+                out[where[order]] = loaders.open_array(files[year])[shard[where[order], 1]]
+            out.flush()
+            del out
+        shards.append({'x': names[0], 'y': names[1], 'n': len(shard), 'samples': shard.tolist()})
+    index = {'stage': stage, 'years': years, 'seed': seed, 'n_samples': len(samples), 'shards': shards}
+    # The index is written last, so that it only exists for complete exports
+    with open(os.path.join(out_dir, INDEX_NAME), 'w') as f:
+        json.dump(index, f)
+    return index
+
+def load_index(shard_dir):
+    """Load the index.json of a directory of shards."""
+    with open(os.path.join(shard_dir, INDEX_NAME)) as f:
+        return json.load(f)
+
+class ShardReader:
+    """Stream the batches of one worker from a directory of shards.
+
+    Every epoch, the shards are shuffled and dealt out to the workers, so
+    each worker reads different shards in different epochs. The samples of
+    the shards of a worker are shuffled together. Both shuffles only depend
+    on the seed and the epoch, so all workers agree on them without
+    communicating. All workers run the same number of batches per epoch,
+    which is set by the worker with the fewest samples.
+
+    Parameters
+    ----------
+    shard_dir : str
+        Directory written by export_shards().
+    rank : int
+        Index of this worker, from 0 to world_size - 1.
+    world_size : int
+        Number of workers.
+    batch_size : int
+        Number of samples in each batch.
+    seed : int
+        Seed of the shuffles.
+
+    Examples
+    --------
+    >>> reader = ShardReader('shards/stage1', rank=0, world_size=4, batch_size=30)
+    >>> for epoch in range(250):
+    ...     for x, y in reader.epoch(epoch):
+    ...         unet.model.train_on_batch(x, y)
+    """
+
+    def __init__(self, shard_dir, rank=0, world_size=1, batch_size=30, seed=0):
+        self.shard_dir = shard_dir
+        self.index = load_index(shard_dir)
+        if not 0 <= rank < world_size:
+            raise ValueError(f"rank must be in [0, {world_size}), got {rank}.")
+        if world_size > len(self.index['shards']):
+            raise ValueError(f"Cannot share {len(self.index['shards'])} shards between {world_size} workers.")
+        self.rank, self.world_size = rank, world_size
+        self.batch_size, self.seed = batch_size, seed
+
+    def shards(self, epoch):
+        """Indices of the shards of this worker in the given epoch."""
+        order = np.random.default_rng([self.seed, epoch]).permutation(len(self.index['shards']))
+        return sorted(order[self.rank::self.world_size].tolist())
+
+    def steps(self, epoch):
+        """Number of batches of every worker in the given epoch."""
+        order = np.random.default_rng([self.seed, epoch]).permutation(len(self.index['shards']))
+        sizes = [sum(self.index['shards'][i]['n'] for i in order[r::self.world_size]) for r in range(self.world_size)]
+        return min(sizes) // self.batch_size
+
+    def epoch(self, epoch):
+        """Yield the (x, y) batches of this worker in the given epoch."""
+        shards = self.shards(epoch)
+        arrays = [(loaders.open_array(os.path.join(self.shard_dir, self.index['shards'][i]['x'])),
+                   loaders.open_array(os.path.join(self.shard_dir, self.index['shards'][i]['y']))) for i in shards]
+        # (shard, sample) of every sample of this worker, shuffled together
+        samples = np.array([(k, j) for k, i in enumerate(shards) for j in range(self.index['shards'][i]['n'])])
+        samples = samples[np.random.default_rng([self.seed, epoch, self.rank]).permutation(len(samples))]
+        for step in range(self.steps(epoch)):
+            batch = samples[step*self.batch_size:(step+1)*self.batch_size]
+            x = np.empty((len(batch),) + arrays[0][0].shape[1:], dtype=arrays[0][0].dtype)
+            y = np.empty((len(batch),) + arrays[0][1].shape[1:], dtype=arrays[0][1].dtype)
+            # Read each shard once per batch, in increasing order of the samples
+            for k in np.unique(batch[:, 0]):
+                where = np.where(batch[:, 0] == k)[0]
+                where = where[np.argsort(batch[where, 1])]
+                x[where] = arrays[k][0][batch[where, 1]]
+                y[where] = arrays[k][1][batch[where, 1]]
+            yield x, y
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the sample data of several years as shuffled shards.')
+    parser.add_argument('stage', type=int)
+    parser.add_argument('first_year', type=int)
+    parser.add_argument('last_year', type=int)
+    parser.add_argument('out_dir')
+    parser.add_argument('--n-shards', type=int, default=None)
+    parser.add_argument('--shard-size', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dtype', default=None, help='e.g. float32')
+    args = parser.parse_args()
+    index = export_shards(args.stage, range(args.first_year, args.last_year + 1), args.out_dir,
+                          args.n_shards, args.shard_size, args.seed, args.dtype)
+    print(f"Wrote {len(index['shards'])} shards of {index['n_samples']} samples to {args.out_dir}")
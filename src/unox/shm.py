@@ -0,0 +1,367 @@
+import argparse
+import collections
+import hashlib
+import os
+import secrets
+import shutil
+import threading
+import warnings
+import weakref
+from multiprocessing.managers import BaseManager
+import numpy as np
+
+from unox import quantize
+
+# Directory of the shared arrays. /dev/shm is a tmpfs on Linux, so the arrays
+#   stay in RAM and every process that maps them shares the same pages
+DEFAULT_DIR = '/dev/shm/unox' if os.path.isdir('/dev/shm') else os.path.join(os.path.expanduser('~'), '.cache', 'unox', 'shm')
+
+# Environment variables that point the loaders at a running server
+ADDRESS_VAR = 'UNOX_SHM_ADDRESS'
+AUTHKEY_VAR = 'UNOX_SHM_AUTHKEY'
+
+# Suffix of the file with the random key of a server started without one, next to its socket
+KEY_SUFFIX = '.key'
+
+def parse_size(size):
+    """Convert a size such as 32G, 500M or 1024 to a number of bytes."""
+    if isinstance(size, (int, float)):
+        return int(size)
+    units = {'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+    size = size.strip().upper().rstrip('B')
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+def _alive(pid):
+    """Whether the process with the given pid is still running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class DatasetStore:
+    """Arrays loaded once into shared memory, with reference counts and eviction.
+
+    Each array is a plain .npy file in shm_dir, which clients open
+    memory-mapped. Arrays that no live process references are evicted,
+    least recently used first, when the total size would exceed the
+    capacity. Evicting an array only unlinks its file, so processes that
+    still have it mapped keep a valid view.
+
+    Parameters
+    ----------
+    shm_dir : str
+        Directory to store the arrays in, ideally on a tmpfs such as /dev/shm.
+    capacity : int or str
+        Maximum total size of the arrays, e.g. '32G'.
+    """
+
+    def __init__(self, shm_dir=DEFAULT_DIR, capacity='16G'):
+        self.shm_dir = shm_dir
+        self.capacity = parse_size(capacity)
+        os.makedirs(shm_dir, mode=0o700, exist_ok=True)
+        # Source path -> entry, in least recently used order
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.loading = {}
+
+    def acquire(self, file_path, pid):
+        """Load the array of file_path if needed, and add a reference from pid.
+
+        Returns the path of the shared .npy file.
+        """
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        key = (stat.st_mtime, stat.st_size)
+        while True:
+            with self.lock:
+                entry = self.entries.get(file_path)
+                if entry is not None and entry['key'] == key:
+                    entry['refs'][pid] += 1
+                    self.entries.move_to_end(file_path)
+                    return entry['path']
+                event = self.loading.get(file_path)
+                if event is None:
+                    # Load it in this thread, and make the others wait for it
+                    event = self.loading[file_path] = threading.Event()
+                    break
+            event.wait()
+        try:
+            shm_path, nbytes = self._load(file_path)
+            with self.lock:
+                old = self.entries.pop(file_path, None)
+                if old is not None:
+                    self._unlink(old)
+                self._evict(nbytes)
+                self.entries[file_path] = {'path': shm_path, 'key': key, 'nbytes': nbytes,
+                                           'refs': collections.Counter({pid: 1})}
+            return shm_path
+        finally:
+            with self.lock:
+                self.loading.pop(file_path).set()
+
+    def release(self, file_path, pid):
+        """Remove a reference from pid to the array of file_path."""
+        with self.lock:
+            entry = self.entries.get(os.path.abspath(file_path))
+            if entry is not None and entry['refs'][pid] > 0:
+                entry['refs'][pid] -= 1
+                if entry['refs'][pid] == 0:
+                    del entry['refs'][pid]
+
+    def stats(self):
+        """List the arrays in the store, least recently used first."""
+        with self.lock:
+            return [{'file_path': file_path, 'shm_path': entry['path'], 'nbytes': entry['nbytes'],
+                     'refs': dict(entry['refs'])} for file_path, entry in self.entries.items()]
+
+    def clear(self):
+        """Remove all arrays from the store, referenced or not."""
+        with self.lock:
+            for entry in self.entries.values():
+                self._unlink(entry)
+            self.entries.clear()
+
+    def _load(self, file_path):
+        """Copy the array of file_path into shm_dir, decoding quantized files."""
+        name = hashlib.sha1(file_path.encode()).hexdigest()[:16] + '_' + os.path.basename(file_path)
+        if name.endswith(quantize.CODES_SUFFIX):
+            name = name[:-len(quantize.CODES_SUFFIX)] + '.npy'
+        shm_path = os.path.join(self.shm_dir, name)
+        tmp_path = f'{shm_path}.{threading.get_ident()}.tmp'
+        if file_path.endswith(quantize.CODES_SUFFIX):
+            # Decode once here, rather than in every client
+            with open(tmp_path, 'wb') as f:
+                np.save(f, np.asarray(quantize.QuantizedArray(file_path)))
+        else:
+            shutil.copyfile(file_path, tmp_path)
+        os.replace(tmp_path, shm_path)
+        return shm_path, os.path.getsize(shm_path)
+
+    def _evict(self, nbytes):
+        """Evict unreferenced arrays until nbytes more fit in the capacity."""
+        total = sum(entry['nbytes'] for entry in self.entries.values())
+        for file_path in list(self.entries):
+            if total + nbytes <= self.capacity:
+                return
+            entry = self.entries[file_path]
+            # References of processes that died without releasing them do not count
+            for pid in [pid for pid in entry['refs'] if not _alive(pid)]:
+                del entry['refs'][pid]
+            if not entry['refs']:
+                self._unlink(self.entries.pop(file_path))
+                total -= entry['nbytes']
+        if total + nbytes > self.capacity:
+            warnings.warn(f"The shared arrays use {(total + nbytes) / 2**30:.2f} GiB, more than the capacity of "
+                          f"{self.capacity / 2**30:.2f} GiB, because all of them are in use.")
+
+    def _unlink(self, entry):
+        """Remove the file of an entry. Processes that have it mapped keep their view."""
+        try:
+            os.remove(entry['path'])
+        except FileNotFoundError:
+            pass
+
+class StoreManager(BaseManager):
+    """Manager that serves a DatasetStore to client processes."""
+
+# The store of the server process
+_store = None
+
+def _get_store():
+    return _store
+
+def _init_store(shm_dir, capacity):
+    global _store
+    _store = DatasetStore(shm_dir, capacity)
+
+StoreManager.register('store', callable=_get_store)
+
+def default_address(shm_dir=DEFAULT_DIR):
+    """The address of the server: UNOX_SHM_ADDRESS, or a socket in shm_dir."""
+    return os.environ.get(ADDRESS_VAR, os.path.join(shm_dir, 'server.sock'))
+
+def key_path(address):
+    """Path of the file with the key of the server at address, if it was started without one."""
+    return address + KEY_SUFFIX
+
+def _encode(authkey):
+    """The key as bytes, as the managers need it."""
+    return authkey.encode() if isinstance(authkey, str) else authkey
+
+def _server_authkey(authkey, address):
+    """The key of a new server: the given one, UNOX_SHM_AUTHKEY, or a new random one.
+
+    A random key is written next to the socket in a file that only the
+    user can read, so that only their processes can connect. The server
+    unpickles what clients send, so it must never run with a known key.
+    """
+    authkey = authkey or os.environ.get(AUTHKEY_VAR)
+    if authkey is None:
+        authkey = secrets.token_hex(32)
+        path = key_path(address)
+        tmp_path = path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w') as f:
+            f.write(authkey)
+        os.replace(tmp_path, path)
+    return _encode(authkey)
+
+def _client_authkey(authkey, address):
+    """The key to connect to a server: the given one, UNOX_SHM_AUTHKEY, or the key file of the server."""
+    authkey = authkey or os.environ.get(AUTHKEY_VAR)
+    if authkey is None:
+        path = key_path(address)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No key for the dataset server at {address}. Set {AUTHKEY_VAR}, "
+                                    f"or start the server as this user so that it writes {path}.")
+        with open(path) as f:
+            authkey = f.read().strip()
+    return _encode(authkey)
+
+def _remove_key(address):
+    """Remove the key file of a stopped server, if it has one."""
+    try:
+        os.remove(key_path(address))
+    except FileNotFoundError:
+        pass
+
+def start(shm_dir=DEFAULT_DIR, capacity='16G', address=None, authkey=None):
+    """Start a dataset server in a new process.
+
+    Parameters
+    ----------
+    shm_dir : str
+        Directory to store the arrays in.
+    capacity : int or str
+        Maximum total size of the arrays, e.g. '32G'.
+    address : str, optional
+        Path of the Unix socket to listen on. Defaults to default_address().
+    authkey : bytes or str, optional
+        Key that clients need to connect. Defaults to UNOX_SHM_AUTHKEY,
+        or else to a random key that is written to key_path(address),
+        readable only by the user, where the clients of the user find it.
+
+    Returns
+    -------
+    manager : StoreManager
+        The started manager. Stop the server with stop(manager).
+
+    Examples
+    --------
+    >>> manager = start(capacity='32G')
+    """
+    os.makedirs(shm_dir, mode=0o700, exist_ok=True)
+    address = address or default_address(shm_dir)
+    manager = StoreManager(address=address, authkey=_server_authkey(authkey, address))
+    manager.start(_init_store, (shm_dir, capacity))
+    return manager
+
+def stop(manager):
+    """Remove the arrays of a server started with start(), and stop it."""
+    manager.store().clear()
+    manager.shutdown()
+    _remove_key(manager.address)
+
+def serve(shm_dir=DEFAULT_DIR, capacity='16G', address=None, authkey=None):
+    """Run a dataset server in this process until it is interrupted, as start() does."""
+    _init_store(shm_dir, capacity)
+    address = address or default_address(shm_dir)
+    manager = StoreManager(address=address, authkey=_server_authkey(authkey, address))
+    server = manager.get_server()
+    print(f"Serving shared arrays from {shm_dir} on {server.address}")
+    try:
+        server.serve_forever()
+    finally:
+        _store.clear()
+        _remove_key(address)
+
+# The client of each process, and the address it is connected to
+_clients = {}
+
+def connect(address=None, authkey=None):
+    """Connect to a dataset server, reusing the connection of this process.
+
+    Parameters
+    ----------
+    address : str, optional
+        Path of the socket of the server. Defaults to default_address().
+    authkey : bytes or str, optional
+        Key of the server. Defaults to UNOX_SHM_AUTHKEY, or else to the
+        key file of the server, see start().
+
+    Returns
+    -------
+    store : proxy of DatasetStore
+        The store of the server.
+    """
+    address = address or default_address()
+    key = (os.getpid(), address)
+    if key not in _clients:
+        manager = StoreManager(address=address, authkey=_client_authkey(authkey, address))
+        manager.connect()
+        _clients[key] = manager.store()
+    return _clients[key]
+
+def enabled():
+    """Whether the loaders should use a dataset server, i.e. UNOX_SHM_ADDRESS is set."""
+    return bool(os.environ.get(ADDRESS_VAR))
+
+def _release(store, file_path, pid):
+    """Release a reference, ignoring a server that is no longer running."""
+    try:
+        store.release(file_path, pid)
+    except (OSError, EOFError):
+        pass
+
+def open_shared(file_path, address=None, authkey=None):
+    """Open the shared copy of a .npy file, loading it into the server if needed.
+
+    The returned array is a zero-copy, read-only view of the shared memory.
+    The reference of this process is released once the array and all of
+    its views have been garbage collected.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the .npy file, or to a quantized '.q.npy' file, which the
+        server decodes.
+    address : str, optional
+        Path of the socket of the server. Defaults to default_address().
+    authkey : bytes or str, optional
+        Key of the server.
+
+    Returns
+    -------
+    arr : numpy.memmap
+        The shared array.
+
+    Examples
+    --------
+    >>> arr = open_shared(unox.get_pred_data(stage=1, HPC_run='test_unet_601760', year=2019))
+    """
+    store = connect(address, authkey)
+    pid = os.getpid()
+    shm_path = store.acquire(os.path.abspath(file_path), pid)
+    arr = np.load(shm_path, mmap_mode='r')
+    weakref.finalize(arr, _release, store, os.path.abspath(file_path), pid)
+    return arr
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve arrays in shared memory to the unox loaders. '
+                                     f'Set {ADDRESS_VAR} to the socket of the server in the clients.')
+    parser.add_argument('command', choices=['serve', 'stats'])
+    parser.add_argument('--dir', default=DEFAULT_DIR, help='directory of the shared arrays, ideally on a tmpfs')
+    parser.add_argument('--capacity', default='16G', help='maximum total size of the shared arrays, e.g. 32G')
+    parser.add_argument('--address', default=None, help='path of the socket of the server')
+    args = parser.parse_args()
+    if args.command == 'serve':
+        serve(args.dir, args.capacity, args.address)
+    else:
+        for entry in connect(args.address or default_address(args.dir)).stats():
+            print(f"{entry['nbytes'] / 2**20:10.1f} MiB  refs={sum(entry['refs'].values()):<3d} {entry['file_path']}")
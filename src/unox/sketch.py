@@ -0,0 +1,279 @@
+import argparse
+import glob
+import os
+import numpy as np
+
+# Suffix of the sketch files. The sketch of pred_X_2019.npy is pred_X_2019.sketch.npz
+SKETCH_SUFFIX = '.sketch.npz'
+
+# Default size of the sketches. The rank error of the quantiles is about 1 / DEFAULT_K
+DEFAULT_K = 400
+
+# Ratio of the capacities of successive levels, as in the KLL paper
+CAPACITY_RATIO = 2 / 3
+
+class KLLSketch:
+    """Mergeable quantile sketch of a stream of values (Karnin, Lang and Liberty, 2016).
+
+    The sketch keeps a few thousand values in levels of compactors. Every
+    value at level h stands for 2**h values of the stream. When a level
+    is full, it is sorted and every other value, starting at a random
+    offset, moves to the next level. The size of the sketch grows only
+    with the logarithm of the number of values, and sketches of different
+    files, years, runs or regions merge into the sketch of all of them.
+
+    NaN values are ignored. The minimum and maximum are kept exactly.
+
+    Parameters
+    ----------
+    k : int
+        Capacity of the top level. The rank error of quantiles is about 1 / k.
+    seed : int, optional
+        Seed of the random offsets of the compactions.
+
+    Examples
+    --------
+    >>> sketch = KLLSketch()
+    >>> sketch.update(np.load(unox.get_pred_data(stage=1, HPC_run='test_unet_601760', year=2019)))
+    >>> vmin, vmax = sketch.quantile([0.01, 0.99])
+    """
+
+    def __init__(self, k=DEFAULT_K, seed=None):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.n = 0
+        self.min = None
+        self.max = None
+        self.rng = np.random.default_rng(seed)
+
+    def __repr__(self):
+        return f"KLLSketch(k={self.k}, n={self.n}, size={self.size})"
+
+    @property
+    def size(self):
+        """Number of values kept in the sketch."""
+        return sum(len(level) for level in self.levels)
+
+    def capacity(self, h):
+        """Capacity of level h. The top level has capacity k, and lower levels less."""
+        return max(2, int(np.ceil(self.k * CAPACITY_RATIO**(len(self.levels) - 1 - h))))
+
+    def update(self, values):
+        """Add values to the sketch.
+
+        Parameters
+        ----------
+        values : array_like
+            The values. NaN values are ignored.
+
+        Returns
+        -------
+        self : KLLSketch
+            The sketch.
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.n += len(values)
+        vmin, vmax = values.min(), values.max()
+        self.min = vmin if self.min is None else min(self.min, vmin)
+        self.max = vmax if self.max is None else max(self.max, vmax)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """Add the values of another sketch to this one.
+
+        Returns
+        -------
+        self : KLLSketch
+            The sketch.
+        """
+        if other.n == 0:
+            return self
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, level in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self.n += other.n
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _compress(self):
+        """Compact the lowest full level until no level is full."""
+        while True:
+            full = [h for h, level in enumerate(self.levels) if len(level) >= self.capacity(h)]
+            if not full:
+                return
+            h = full[0]
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            level = np.sort(self.levels[h])
+            # An odd value out stays at this level
+            n_even = len(level) - len(level) % 2
+            self.levels[h] = level[n_even:]
+            promoted = level[:n_even][self.rng.integers(2)::2]
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+
+    def _weighted(self):
+        """The sorted values of the sketch and the number of values each stands for."""
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.**h) for h, level in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        return values[order], weights[order]
+
+    def quantile(self, q):
+        """Approximate quantiles of the values.
+
+        Parameters
+        ----------
+        q : float or array_like
+            Quantiles, between 0 and 1.
+
+        Returns
+        -------
+        values : float or numpy.ndarray
+            The quantiles. 0 and 1 give the exact minimum and maximum.
+        """
+        if self.n == 0:
+            raise ValueError("Cannot take quantiles of an empty sketch.")
+        values, weights = self._weighted()
+        ranks = np.cumsum(weights) / np.sum(weights)
+        q = np.asarray(q, dtype=np.float64)
+        if np.any((q < 0) | (q > 1)):
+            raise ValueError(f"Quantiles must be between 0 and 1, got {q}.")
+        index = np.minimum(np.searchsorted(ranks, q, side='left'), len(values) - 1)
+        result = np.where(q == 0, self.min, np.where(q == 1, self.max, values[index]))
+        return float(result) if result.ndim == 0 else result
+
+    def rank(self, x):
+        """Approximate fraction of the values that are at most x."""
+        if self.n == 0:
+            raise ValueError("Cannot take ranks of an empty sketch.")
+        values, weights = self._weighted()
+        cumulative = np.concatenate([[0.], np.cumsum(weights)]) / np.sum(weights)
+        result = cumulative[np.searchsorted(values, x, side='right')]
+        return float(result) if np.ndim(result) == 0 else result
+
+    def save(self, file_path):
+        """Save the sketch to a .npz file."""
+        with open(file_path, 'wb') as f:
+            np.savez(f, values=np.concatenate(self.levels), sizes=[len(level) for level in self.levels],
+                     n=self.n, k=self.k, extremes=[np.nan if self.min is None else self.min,
+                                                   np.nan if self.max is None else self.max])
+
+    @classmethod
+    def load(cls, file_path, seed=None):
+        """Load a sketch saved with save()."""
+        with np.load(file_path) as f:
+            sketch = cls(int(f['k']), seed)
+            sketch.levels = np.split(f['values'], np.cumsum(f['sizes'])[:-1])
+            sketch.n = int(f['n'])
+            if sketch.n:
+                sketch.min, sketch.max = f['extremes'].tolist()
+        return sketch
+
+def merge_sketches(sketches, seed=0):
+    """Merge sketches, e.g. of several years, runs or regions, into a new sketch.
+
+    The seed of the new sketch is fixed, so merging the same sketches in
+    the same order always gives the same sketch.
+    """
+    sketches = list(sketches)
+    merged = KLLSketch(max([s.k for s in sketches], default=DEFAULT_K), seed)
+    for sketch in sketches:
+        merged.merge(sketch)
+    return merged
+
+def sketch_path(file_path):
+    """Path of the sketch of a .npy or quantized '.q.npy' file."""
+    for suffix in ('.q.npy', '.npy'):
+        if file_path.endswith(suffix):
+            return file_path[:-len(suffix)] + SKETCH_SUFFIX
+    raise ValueError(f"{file_path} is not a .npy file.")
+
+def sketch_file(file_path, k=DEFAULT_K, save=True, max_workers=None):
+    """Build the sketch of the values of a .npy file, and save it next to the file.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the .npy file, e.g. a prediction file.
+    k : int
+        Size of the sketch.
+    save : bool
+        If True, save the sketch to sketch_path(file_path).
+    max_workers : int, optional
+        Number of threads reading the file, as in unox.reducers.summarize().
+
+    Returns
+    -------
+    sketch : KLLSketch
+        The sketch.
+    """
+    from unox import loaders
+    from unox import reducers
+    sketch = reducers.summarize([loaders.open_array(file_path)], quantiles=True, max_workers=max_workers, k=k).sketch
+    if save:
+        tmp_path = sketch_path(file_path) + '.tmp'
+        sketch.save(tmp_path)
+        os.replace(tmp_path, sketch_path(file_path))
+    return sketch
+
+def load_sketch(file_path, build=True):
+    """Load the saved sketch of a .npy file, building it if it is missing or out of date.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the .npy file.
+    build : bool
+        If True, build and save the sketch if needed. Otherwise a missing
+        or out of date sketch raises a FileNotFoundError.
+
+    Returns
+    -------
+    sketch : KLLSketch
+        The sketch.
+
+    Examples
+    --------
+    >>> years = range(2014, 2020)
+    >>> sketch = merge_sketches(load_sketch(unox.get_pred_data(1, 'test_unet_601760', year)) for year in years)
+    >>> vmin, vmax = sketch.quantile([0.01, 0.99])
+    """
+    path = sketch_path(file_path)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(file_path):
+        return KLLSketch.load(path)
+    if not build:
+        raise FileNotFoundError(f"The sketch of {file_path} is missing or older than the file.")
+    return sketch_file(file_path)
+
+def sketch_run(run_dir, k=DEFAULT_K):
+    """Build and save the sketches of the prediction files of an HPC run.
+
+    Returns the paths of the files that were sketched.
+    """
+    file_paths = sorted(glob.glob(os.path.join(run_dir, 'stage*_output', 'pred_X_*.npy')))
+    # Quantized files only stand in for the original files that were removed
+    file_paths = [f for f in file_paths if not (f.endswith('.q.npy') and os.path.exists(f[:-len('.q.npy')] + '.npy'))]
+    for file_path in file_paths:
+        sketch_file(file_path, k)
+    return file_paths
+
+def bin_edges(sketch, bins=100, lower=0., upper=1.):
+    """Histogram bin edges with about the same number of values in each bin."""
+    return np.unique(sketch.quantile(np.linspace(lower, upper, bins + 1)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the quantile sketches of the prediction files of HPC runs.')
+    parser.add_argument('run_dirs', nargs='+', help='directories of the runs, e.g. HPC_runs/test_unet_601760/')
+    parser.add_argument('--k', type=int, default=DEFAULT_K, help='size of the sketches')
+    args = parser.parse_args()
+    for run_dir in args.run_dirs:
+        for file_path in sketch_run(run_dir, args.k):
+            print(f"Sketched {file_path}")
@@ -0,0 +1,214 @@
+import calendar
+import functools
+import os
+import numpy as np
+
+from unox import unox
+from unox import loaders
+from unox import metrics
+from unox import grid as ugrid
+
+# Columns of the EPA daily csv files that identify a monitoring site
+SITE_COLUMNS = ['State Code', 'County Code', 'Site Num']
+
+# Column of the EPA daily csv files that groups the stations into networks
+NETWORK_COLUMN = 'State Name'
+
+def epa_path(year, datadir='.'):
+    """Path of the EPA daily NO2 csv file of the given year."""
+    return f'{datadir}/US_EPA/daily_42602_{year}.csv'
+
+@functools.lru_cache(maxsize=8)
+def _read_observations(csvfile, mtime, network):
+    """Read and cache the observations of an EPA csv file. The mtime is part of the cache key."""
+    import pandas as pd
+    columns = pd.read_csv(csvfile, nrows=0).columns
+    usecols = ['Date Local', 'Latitude', 'Longitude', 'Arithmetic Mean']
+    usecols += [c for c in SITE_COLUMNS + [network] if c in columns and c not in usecols]
+    epa = pd.read_csv(csvfile, usecols=usecols)
+    if all(c in epa for c in SITE_COLUMNS):
+        epa['station'] = (epa['State Code'].astype(str).str.zfill(2) + '-' + epa['County Code'].astype(str).str.zfill(3)
+                          + '-' + epa['Site Num'].astype(str).str.zfill(4))
+    else:
+        # Without site codes, a station is a location
+        epa['station'] = epa['Latitude'].round(4).astype(str) + ',' + epa['Longitude'].round(4).astype(str)
+    epa['network'] = epa[network].astype(str) if network in epa else 'all'
+    epa['date'] = pd.to_datetime(epa['Date Local']).values.astype('datetime64[D]')
+    # Several instruments of a site measure the same day, so average them
+    return (epa.groupby(['station', 'date'], as_index=False)
+               .agg(value=('Arithmetic Mean', 'mean'), lat=('Latitude', 'first'), lon=('Longitude', 'first'),
+                    network=('network', 'first')))
+
+def read_observations(csvfile, network=NETWORK_COLUMN):
+    """Read the daily observations of each station from an EPA csv file.
+
+    Parameters
+    ----------
+    csvfile : str
+        Path to the EPA daily NO2 csv file, e.g. 'US_EPA/daily_42602_2019.csv'.
+    network : str
+        Column that groups the stations into networks, e.g. 'State Name'
+        or 'CBSA Name'. If the file does not have it, all stations are in
+        the network 'all'.
+
+    Returns
+    -------
+    observations : pandas.DataFrame
+        Columns 'station', 'date' (numpy.datetime64), 'value', 'lat', 'lon'
+        and 'network', with one row per station and day. The frame is
+        shared between calls and must not be modified.
+    """
+    return _read_observations(os.path.abspath(csvfile), os.path.getmtime(csvfile), network)
+
+def day_indices(dates, year):
+    """Indices along the time axis of the files of the given year of many dates.
+
+    The vectorized equivalent of unox.daily.day_index(). Dates that are
+    not in the files of the year (other years, January 1st and February
+    29th) get the index -1.
+    """
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    leap = calendar.isleap(year)
+    # Days since January 1st. Day 59 of a leap year is February 29th
+    day = (dates - np.datetime64(f'{year}-01-01', 'D')).astype(np.int64)
+    valid = (day >= 1) & (day < 365 + leap) & ~(leap & (day == 59))
+    index = day - 1 - (leap & (day > 59))
+    return np.where(valid, index, -1)
+
+class StationIndex:
+    """The grid cell of each station, found once for all years and runs.
+
+    Parameters
+    ----------
+    stations : array_like of str
+        The identifiers of the stations.
+    lats, lons : array_like
+        The location of each station.
+    networks : array_like of str
+        The network of each station.
+    grid : unox.grid.Grid, optional
+        The grid. Defaults to unox.grid.get_grid().
+
+    Examples
+    --------
+    >>> index = StationIndex.from_csvs([epa_path(year) for year in range(2014, 2020)])
+    >>> results = evaluate_runs(['test_unet_601760'], range(2014, 2020), index)
+    """
+
+    def __init__(self, stations, lats, lons, networks, grid=None):
+        self.grid = grid or ugrid.get_grid()
+        self.stations = np.asarray(stations, dtype=str)
+        self.lats, self.lons = np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64)
+        self.networks, self.network_index = np.unique(np.asarray(networks, dtype=str), return_inverse=True)
+        # Stations more than half a cell away from every grid point are outside the domain
+        tolerance = max(np.max(np.diff(self.grid.lats)), np.max(np.diff(self.grid.lons))) / 2
+        self.i, self.j = self.grid.index(self.lats, self.lons, tolerance)
+        self.inside = (self.i >= 0) & (self.j >= 0)
+        self._order = np.argsort(self.stations, kind='stable')
+
+    def __len__(self):
+        return len(self.stations)
+
+    def __repr__(self):
+        return f"StationIndex(n_stations={len(self)}, n_inside={int(self.inside.sum())}, n_networks={len(self.networks)})"
+
+    @classmethod
+    def from_csvs(cls, csvfiles, grid=None, network=NETWORK_COLUMN):
+        """Build the index of all stations in the given EPA csv files."""
+        import pandas as pd
+        frames = [read_observations(csvfile, network)[['station', 'lat', 'lon', 'network']] for csvfile in csvfiles]
+        sites = pd.concat(frames).drop_duplicates('station').sort_values('station')
+        return cls(sites['station'].values, sites['lat'].values, sites['lon'].values, sites['network'].values, grid)
+
+    def positions(self, stations):
+        """Positions in the index of the given stations, -1 for unknown stations."""
+        stations = np.asarray(stations, dtype=str)
+        sorted_stations = self.stations[self._order]
+        k = np.minimum(np.searchsorted(sorted_stations, stations), len(self) - 1)
+        return np.where(sorted_stations[k] == stations, self._order[k], -1)
+
+def match_year(observations, year, index):
+    """The observations of a year that fall on the grid, and where to find them in the files.
+
+    Parameters
+    ----------
+    observations : pandas.DataFrame
+        As returned by read_observations().
+    year : int
+        The year of the files.
+    index : StationIndex
+        The stations.
+
+    Returns
+    -------
+    station : numpy.ndarray
+        Position of the station of each observation in the index.
+    t, i, j : numpy.ndarray
+        Indices of each observation along the time, latitude and longitude axes of the files.
+    values : numpy.ndarray
+        The observed values.
+    """
+    station = index.positions(observations['station'].values)
+    t = day_indices(observations['date'].values, year)
+    keep = (station >= 0) & (t >= 0)
+    keep[keep] = index.inside[station[keep]]
+    station = station[keep]
+    return station, t[keep], index.i[station], index.j[station], observations['value'].values[keep]
+
+def gather(arr, t, i, j, channel=0):
+    """The values of an array at the given (time, lat, lon) points, in a single gather.
+
+    Only the days with points are read, in increasing order, so memory-mapped
+    files are read once.
+    """
+    days, inverse = np.unique(t, return_inverse=True)
+    block = np.asarray(arr[days])
+    return block[inverse, i, j, channel]
+
+def evaluate_runs(HPC_runs, years, index, stage=1, datadir='.', network=NETWORK_COLUMN):
+    """Statistics of the predictions of several runs against the EPA observations.
+
+    The observations of each year are read and matched to the grid once,
+    and shared by all runs.
+
+    Parameters
+    ----------
+    HPC_runs : list of str
+        The HPC runs, as in unox.get_pred_data().
+    years : list of int
+        The years.
+    index : StationIndex
+        The stations, e.g. from StationIndex.from_csvs().
+    stage : int
+        The stage of the predictions.
+    datadir : str
+        Path to the directory containing US_EPA/.
+    network : str
+        Column that groups the stations into networks, as in read_observations().
+
+    Returns
+    -------
+    results : dict
+        HPC run -> {'station': Stats of shape (n_stations,), 'network':
+        Stats of shape (n_networks,), 'all': Stats of all pairs}, in the
+        order of index.stations and index.networks. See unox.metrics.Stats.
+
+    Examples
+    --------
+    >>> results = evaluate_runs(['test_unet_601760'], [2019], index)
+    >>> rmse = dict(zip(index.networks, results['test_unet_601760']['network'].rmse))
+    """
+    n_stations, n_networks = len(index), len(index.networks)
+    results = {run: {'station': metrics.Stats.zeros(n_stations), 'network': metrics.Stats.zeros(n_networks)}
+               for run in HPC_runs}
+    for year in years:
+        station, t, i, j, values = match_year(read_observations(epa_path(year, datadir), network), year, index)
+        for run in HPC_runs:
+            pred = gather(loaders.open_array(unox.get_pred_data(stage, run, year)), t, i, j)
+            results[run]['station'] = results[run]['station'].merge(
+                metrics.Stats.from_groups(values, pred, station, n_stations))
+            results[run]['network'] = results[run]['network'].merge(
+                metrics.Stats.from_groups(values, pred, index.network_index[station], n_networks))
+    for run in HPC_runs:
+        results[run]['all'] = results[run]['network'].reduce()
+    return results
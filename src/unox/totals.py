@@ -0,0 +1,221 @@
+import functools
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from unox import catalog
+from unox import loaders
+from unox import metrics
+from unox import unox
+from unox import grid as ugrid
+from unox import regions as uregions
+
+# Seconds in a day, to turn fluxes per second into totals per day
+SECONDS_PER_DAY = 86400
+
+# Number of days multiplied by the weights at once
+CHUNK_DAYS = 31
+
+def _regions_key(regions):
+    """A short hash of the names, masks and grid of the regions, to name their cached totals."""
+    h = hashlib.sha1()
+    for name, region in regions.items():
+        h.update(name.encode())
+        h.update(np.packbits(region.mask).tobytes())
+    grid = next(iter(regions.values())).grid
+    h.update(grid.lats.tobytes())
+    h.update(grid.lons.tobytes())
+    return h.hexdigest()[:12]
+
+@functools.lru_cache(maxsize=16)
+def _cached_weights(regions):
+    """The weights of a tuple of (name, region) pairs, see weight_matrix()."""
+    from scipy import sparse
+    grid = regions[0][1].grid
+    areas = grid.cell_areas.ravel()
+    rows, cols = [], []
+    for k, (name, region) in enumerate(regions):
+        if region.grid is not grid and not (np.array_equal(region.grid.lats, grid.lats)
+                                            and np.array_equal(region.grid.lons, grid.lons)):
+            raise ValueError(f"The region {name} is not on the grid of the others.")
+        cells = np.flatnonzero(region.mask)
+        rows.append(cells)
+        cols.append(np.full(len(cells), k))
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    return sparse.csr_matrix((areas[rows], (rows, cols)), shape=(areas.size, len(regions)))
+
+def weight_matrix(regions):
+    """The sparse matrix of the area of each grid cell in each region.
+
+    Parameters
+    ----------
+    regions : dict
+        Name -> unox.regions.Region of the regions, on the same grid.
+
+    Returns
+    -------
+    weights : scipy.sparse.csr_matrix
+        Matrix of shape (lat * lon, n_regions). Entry (cell, k) is the area
+        in m² of the cell if it is in region k, else 0. It is built once
+        per process for each set of regions.
+    """
+    if not regions:
+        raise ValueError("At least one region is needed.")
+    return _cached_weights(tuple(regions.items()))
+
+def domain_regions(grid=None):
+    """A single region covering the whole grid, named 'domain'."""
+    grid = grid or ugrid.get_grid()
+    return {'domain': uregions.Region(np.ones(grid.shape, dtype=bool), grid, 'domain')}
+
+def region_totals(arr, regions, channel=0, per_day=True):
+    """Area-weighted totals of each region for each day of an array.
+
+    The array is read CHUNK_DAYS days at a time, and each chunk is a
+    single sparse matrix product, so memory-mapped files and lazy arrays
+    can be used. NaN values count as 0.
+
+    Parameters
+    ----------
+    arr : array_like
+        Array of shape (time, lat, lon, channel), e.g. fluxes in kg/m²/s.
+    regions : dict
+        Name -> unox.regions.Region of the regions.
+    channel : int
+        The channel to total.
+    per_day : bool
+        If True, multiply by the seconds of a day, e.g. to get kg/day from
+        fluxes in kg/m²/s. Otherwise the totals are in the units of the
+        array times m², e.g. kg/s.
+
+    Returns
+    -------
+    totals : numpy.ndarray
+        Array of shape (time, n_regions), in the order of regions.
+
+    Examples
+    --------
+    >>> states = regions.geojson_regions('datafiles/us_states.geojson')
+    >>> totals = region_totals(loaders.open_array(unox.get_pred_data(1, 'test_unet_601760', 2019)), states)
+    """
+    weights = weight_matrix(regions)
+    n_cells = weights.shape[0]
+    totals = np.empty((arr.shape[0], weights.shape[1]))
+    for start in range(0, arr.shape[0], CHUNK_DAYS):
+        chunk = np.asarray(arr[start:start + CHUNK_DAYS])[..., channel]
+        chunk = np.nan_to_num(chunk.reshape(len(chunk), n_cells).astype(np.float64))
+        totals[start:start + len(chunk)] = weights.T.dot(chunk.T).T
+    return totals * SECONDS_PER_DAY if per_day else totals
+
+def monthly_totals(totals, year):
+    """Sum daily totals of a year, of shape (time, n_regions), into totals per month.
+
+    The first month lacks January 1st and February lacks its 29th, as in
+    the files. Returns an array of shape (12, n_regions).
+    """
+    months = metrics.month_index(year)[:len(totals)]
+    out = np.zeros((12,) + totals.shape[1:])
+    np.add.at(out, months, totals)
+    return out
+
+def totals_path(file_path, regions):
+    """Path of the cached totals of a .npy file for a set of regions."""
+    for suffix in ('.q.npy', '.npy'):
+        if file_path.endswith(suffix):
+            return f'{file_path[:-len(suffix)]}.totals_{_regions_key(regions)}.npz'
+    raise ValueError(f"{file_path} is not a .npy file.")
+
+def file_totals(file_path, regions, channel=0, per_day=True):
+    """Daily totals of a .npy file, cached next to it.
+
+    The totals are saved the first time, and computed again when the file
+    is newer than them.
+
+    Parameters
+    ----------
+    file_path : str
+        Path to the .npy file, e.g. a prediction file.
+    regions : dict
+        Name -> unox.regions.Region of the regions.
+    channel : int
+        The channel to total.
+    per_day : bool
+        As in region_totals().
+
+    Returns
+    -------
+    totals : numpy.ndarray
+        Array of shape (time, n_regions).
+    """
+    path = totals_path(file_path, regions)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(file_path):
+        with np.load(path) as f:
+            if int(f['channel']) == channel and bool(f['per_day']) == per_day:
+                return f['totals']
+    totals = region_totals(loaders.open_array(file_path), regions, channel, per_day)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, totals=totals, names=list(regions), channel=channel, per_day=per_day)
+    os.replace(tmp_path, path)
+    return totals
+
+def run_totals(HPC_run, regions, stage=1, years=range(2005, 2020), max_workers=None):
+    """Daily totals of the predictions of an HPC run, for several years.
+
+    Parameters
+    ----------
+    HPC_run : str
+        The HPC run, as in unox.get_pred_data().
+    regions : dict
+        Name -> unox.regions.Region of the regions.
+    stage : int
+        The stage of the predictions.
+    years : list of int
+        The years.
+    max_workers : int, optional
+        Number of years totalled at once.
+
+    Returns
+    -------
+    totals : numpy.ndarray
+        Array of shape (year, time, n_regions).
+
+    Examples
+    --------
+    >>> totals = run_totals('test_unet_601760', states, years=[2018, 2019])
+    >>> july = monthly_totals(totals[-1], 2019)[6]
+    """
+    file_paths = [unox.get_pred_data(stage, HPC_run, year) for year in years]
+    with ThreadPoolExecutor(max_workers) as executor:
+        return np.stack(list(executor.map(lambda f: file_totals(f, regions), file_paths)))
+
+def catalog_totals(root, regions, stage=None, max_workers=None):
+    """Daily totals of every prediction file in the catalog of a directory.
+
+    Parameters
+    ----------
+    root : str
+        Path to the directory of the runs, e.g. 'HPC_runs/'.
+    regions : dict
+        Name -> unox.regions.Region of the regions.
+    stage : int, optional
+        Only total the predictions of this stage.
+    max_workers : int, optional
+        Number of files totalled at once.
+
+    Returns
+    -------
+    totals : dict
+        (run, stage, year) -> array of shape (time, n_regions).
+    """
+    entries = catalog.list_files(root, kind='pred', stage=stage)
+    # Use the original file when a run has both it and its quantized version
+    keys = {}
+    for entry in entries:
+        key = (entry['run'], entry['stage'], entry['year'])
+        if key not in keys or keys[key].endswith('.q.npy'):
+            keys[key] = entry['path']
+    with ThreadPoolExecutor(max_workers) as executor:
+        totals = executor.map(lambda f: file_totals(f, regions), keys.values())
+        return dict(zip(keys, totals))
@@ -1,11 +1,15 @@
-import numpy as np
 import os
 
+from unox import catalog
+from unox import grid as ugrid
+from unox import quantize
+
 def load_lats_lons(path='../datafiles/'):
     """Load latitude and longitude data from files.
 
     Loads arrays of latitude and longitude values that cover 
-    the region of interest.
+    the region of interest. The files are only read once per process,
+    see unox.grid.get_grid().
 
     Parameters
     ----------
@@ -23,11 +27,9 @@ def load_lats_lons(path='../datafiles/'):
     --------
     >>> lats, lons = load_lats_lons()
     """
-    with open(path+'/lats.npy', 'rb') as f:
-        lats = np.load(f)
-    with open(path+'/lons.npy', 'rb') as f:
-        lons = np.load(f)
-    return lats, lons
+    grid = ugrid.get_grid(path)
+    # Return copies, as the arrays of the shared grid are read-only
+    return grid.lats.copy(), grid.lons.copy()
 
 def verify_path(path):
     """Verify that the path to the data files is correct.
@@ -169,10 +171,9 @@ def get_sample_data(stage=1, x_or_y='y', year=2019):
     file_path = f'sample_data/stage{stage}/{x_or_y}/{x_or_y.upper()}_{year}.npy'
     # Verify the path
     file_path = verify_path(file_path)
-    # Find the available data files
-    data_files = show_available_data('sample_data/')
-    # Check if the file exists
-    if file_path not in data_files:
+    # Check if the file exists, using the catalog of the data directory
+    #   rather than listing every file in it
+    if catalog.lookup(file_path, verify_path('sample_data/')) is None:
         raise FileNotFoundError(f"File {file_path} not found.")
     return file_path
 
@@ -180,7 +181,9 @@ def get_pred_data(stage=1, HPC_run='test_unet_601760', year=2019):
     """Get the path of a prediction data file.
 
     Builds the path to a specific prediction data file
-    based on the stage, HPC_run ID, and year.
+    based on the stage, HPC_run ID, and year. If the run only has the
+    quantized version of the file, the path of its codes is returned,
+    which unox.loaders.open_array() decodes transparently.
 
     Parameters
     ----------
@@ -206,11 +209,14 @@ def get_pred_data(stage=1, HPC_run='test_unet_601760', year=2019):
         raise ValueError("Stage must be 1 or 2.")
     # Build the file path
     file_path = f'HPC_runs/{HPC_run}/stage{stage}_output/pred_X_{year}.npy'
-    # Verify the path
-    file_path = verify_path(file_path)
-    # Find the available data files
-    data_files = show_available_data('HPC_runs/')
-    # Check if the file exists
-    if file_path not in data_files:
-        raise FileNotFoundError(f"File {file_path} not found.")
-    return file_path
\ No newline at end of file
+    # Use the quantized file if only that exists, see unox.quantize
+    for this_path in [file_path, quantize.quantized_paths(file_path)[0]]:
+        try:
+            this_path = verify_path(this_path)
+        except FileNotFoundError:
+            continue
+        # Check if the file exists, using the catalog of the data directory
+        #   rather than listing every file in it
+        if catalog.lookup(this_path, verify_path('HPC_runs/')) is not None:
+            return this_path
+    raise FileNotFoundError(f"File {file_path} not found.")
\ No newline at end of file
@@ -0,0 +1,124 @@
+import numpy as np
+
+from unox import unox
+from unox import daily
+from unox import loaders
+from unox import grid as ugrid
+
+def _import_dask_array():
+    """Import dask.array, which is needed for the lazy views."""
+    try:
+        import dask.array as da
+    except ImportError as e:
+        raise ImportError("The lazy views in unox.views need dask, install it with the views extra, `pip install unox[views]`.") from e
+    return da
+
+def year_times(year):
+    """Get the dates of the time axis of the input files of the given year.
+
+    Parameters
+    ----------
+    year : int
+        The year of the files.
+
+    Returns
+    -------
+    times : numpy.ndarray
+        Array of numpy.datetime64 dates, starting on January 2nd and
+        without February 29th.
+
+    Examples
+    --------
+    >>> times = year_times(2019)
+    """
+    return np.array([np.datetime64(daily.index_date(year, i), 'ns') for i in range(daily.N_DAYS)])
+
+def _lazy_year(file_path, n_lat, n_lon, n_channels, chunks):
+    """A lazy array of a year file, or of NaN values if the file is missing."""
+    da = _import_dask_array()
+    shape = (daily.N_DAYS, n_lat, n_lon, n_channels)
+    if file_path is None:
+        return da.full(shape, np.nan, chunks=(chunks, -1, -1, -1), dtype=np.float32)
+    arr = loaders.open_array(file_path)
+    if arr.shape != shape:
+        raise ValueError(f"{file_path} has shape {arr.shape}, expected {shape}.")
+    return da.from_array(arr, chunks=(chunks, -1, -1, -1), lock=False, name=f'unox-{file_path}')
+
+def _find(function, *args):
+    """The path returned by function(*args), or None if the file does not exist."""
+    try:
+        return function(*args)
+    except FileNotFoundError:
+        return None
+
+def open_dataset(years, stages=(1, 2), HPC_runs=(), x=True, y=True, chunks=30):
+    """Open sample data and predictions as a single lazily loaded xarray Dataset.
+
+    The year files are opened memory-mapped and wrapped in dask arrays, so
+    selections and reductions only read the chunks they need, in parallel.
+    Combinations of stage, year and run without a file are filled with NaN.
+
+    Parameters
+    ----------
+    years : int or list of int
+        Years to include, concatenated along the time axis.
+    stages : int or list of int
+        Stages to include, along the 'stage' dimension.
+    HPC_runs : str or list of str
+        IDs of the HPC runs whose predictions to include, along the 'run' dimension.
+    x : bool
+        If True, include the X input channels as variables named after
+        unox.daily.CHANNELS, with dimensions (stage, time, lat, lon).
+    y : bool
+        If True, include the Y data as the variable 'nox', with dimensions
+        (stage, time, lat, lon).
+    chunks : int
+        Number of days in each chunk.
+
+    Returns
+    -------
+    ds : xarray.Dataset
+        The dataset, with the 'time', 'lat', 'lon', 'stage' and 'run'
+        coordinates. Predictions are in the variable 'pred', with
+        dimensions (stage, run, time, lat, lon).
+
+    Examples
+    --------
+    >>> ds = open_dataset(range(2014, 2020), stages=[1, 2], HPC_runs=['test_unet_601760'])
+    >>> july = ds.pred.sel(time=ds.time.dt.month == 7).mean('time').compute()
+    """
+    import xarray as xr
+    da = _import_dask_array()
+    years = [years] if np.isscalar(years) else list(years)
+    stages = [stages] if np.isscalar(stages) else list(stages)
+    HPC_runs = [HPC_runs] if isinstance(HPC_runs, str) else list(HPC_runs)
+    grid = ugrid.get_grid()
+    lats, lons = grid.lats, grid.lons
+    coords = {'time': np.concatenate([year_times(year) for year in years]),
+              'lat': lats, 'lon': lons, 'stage': stages}
+    dims = ('stage', 'time', 'lat', 'lon')
+    data_vars = {}
+
+    def stack(paths, n_channels):
+        # Concatenate the years along time, then stack the stages
+        return da.stack([da.concatenate([_lazy_year(path, len(lats), len(lons), n_channels, chunks)
+                                         for path in stage_paths], axis=0)
+                         for stage_paths in paths])
+
+    if x:
+        paths = [[_find(unox.get_sample_data, stage, 'x', year) for year in years] for stage in stages]
+        arr = stack(paths, len(daily.CHANNELS))
+        for i, channel in enumerate(daily.CHANNELS):
+            data_vars[channel] = (dims, arr[..., i])
+    if y:
+        paths = [[_find(unox.get_sample_data, stage, 'y', year) for year in years] for stage in stages]
+        data_vars['nox'] = (dims, stack(paths, 1)[..., 0])
+    if HPC_runs:
+        arrs = [stack([[_find(unox.get_pred_data, stage, run, year) for year in years] for stage in stages], 1)[..., 0]
+                for run in HPC_runs]
+        data_vars['pred'] = (('stage', 'run', 'time', 'lat', 'lon'), da.stack(arrs, axis=1))
+        coords['run'] = HPC_runs
+    ds = xr.Dataset(data_vars, coords=coords)
+    ds.lat.attrs['units'] = 'degrees_north'
+    ds.lon.attrs['units'] = 'degrees_east'
+    return ds
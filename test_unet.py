@@ -3,6 +3,10 @@ from utils.functions import r2_keras
 from utils.functions import msenonzero
 from utils.functions import data_split
 from model.core import Unet
+from unox.loaders import load_years
+from unox.pixels import update_year
+from unox.rollups import write_rollup
+from unox.sketch import sketch_file
 from tensorflow.keras.optimizers import Adam
 from keras.callbacks import CSVLogger, EarlyStopping, ModelCheckpoint
 import numpy as np
@@ -50,8 +54,8 @@ y_files = sorted(glob.glob('sample_data/stage1/y/Y_20*.npy'))
 xtrain_files, ytrain_files = x_files[:14], y_files[:14]
 file0 = np.load(xtrain_files[0])
 print(file0.shape)
-xtrain = np.concatenate([ np.load(s) for s in xtrain_files], axis=0)
-ytrain = np.concatenate([ np.load(s) for s in ytrain_files], axis=0)
+xtrain = load_years(xtrain_files, verbose=True)
+ytrain = load_years(ytrain_files, verbose=True)
 print(xtrain.shape, ytrain.shape)
 
 #xtrain = xtrain[:,:,:,:9]
@@ -81,6 +85,9 @@ for x in xtest_files:
     xnow = np.load(x)#[:,:,:,:9]
     pred = unet.predict(xnow)
     np.save(savedir+'stage1_output/pred_' + x.split('/')[-1], pred)
+    write_rollup(savedir+'stage1_output/pred_' + x.split('/')[-1])
+    sketch_file(savedir+'stage1_output/pred_' + x.split('/')[-1])
+    update_year(savedir+'stage1_output/pred_' + x.split('/')[-1])
 
 #for y in y_files[14:]:
 #    ynow = np.load(y)
@@ -95,10 +102,10 @@ x_files = sorted(glob.glob('sample_data/stage2/x/X_20*.npy'))
 y_files = sorted(glob.glob('sample_data/stage2/y/Y_20*.npy'))
 print(x_files, y_files)
 xtrain_files, ytrain_files = x_files[:5], y_files[:5]
-xtrain = np.concatenate([ np.load(s) for s in xtrain_files], axis=0)
+xtrain = load_years(xtrain_files, verbose=True)
 #xtrain = xtrain[:,:,:,:9] #definitely not the right way to make the data the right size
 
-ytrain = np.concatenate([ np.load(s) for s in ytrain_files], axis=0)
+ytrain = load_years(ytrain_files, verbose=True)
 # print(xtrain.shape, ytrain.shape)
 
 # split into training, validation, and test sets
@@ -132,6 +139,9 @@ for x in xtest_files:
     xnow = np.load(x)#[:,:,:,:9]
     pred = unet.predict(xnow)
     np.save(savedir+'stage2_output/pred_' + x.split('/')[-1], pred)
+    write_rollup(savedir+'stage2_output/pred_' + x.split('/')[-1])
+    sketch_file(savedir+'stage2_output/pred_' + x.split('/')[-1])
+    update_year(savedir+'stage2_output/pred_' + x.split('/')[-1])
 
 #for y in y_files[14:]:
 #    ynow = np.load(y)
@@ -0,0 +1,58 @@
+from unox import bootstrap
+from unox import metrics
+from unox import grid as ugrid
+from unox import regions as uregions
+import numpy as np
+
+def sample_pairs(shape, seed=0):
+    """Random truth and predictions with large means, zeros and NaN values."""
+    rng = np.random.default_rng(seed)
+    truth = 1e4 + rng.gamma(2., 50., size=shape)
+    truth[rng.random(shape) < 0.2] = 0
+    pred = 0.8 * truth + rng.normal(5., 10., size=shape)
+    pred[rng.random(shape) < 0.05] = np.nan
+    return truth, pred
+
+def test_daily_stats():
+    """Test the daily statistics of a region."""
+    grid = ugrid.Grid(np.arange(6.), np.arange(5.))
+    truth, pred = sample_pairs((20, 6, 5, 1))
+    region = uregions.box_region((1, 3, 0, 2), grid)
+    stats = bootstrap.daily_stats(truth, pred, region=region)
+    assert stats.shape == (20,), f"Wrong shape {stats.shape}"
+    expected = metrics.Stats.from_arrays(truth[:, 1:4, 0:3, 0], pred[:, 1:4, 0:3, 0], axis=(1, 2))
+    for name, values in stats.metrics().items():
+        assert np.allclose(values, expected.metrics()[name], equal_nan=True), f"Wrong daily {name}"
+
+def test_weighted_reduce():
+    """Test that the weighted daily statistics match those of the resampled days."""
+    truth, pred = sample_pairs((30, 6, 5))
+    stats = metrics.Stats.from_arrays(truth, pred, axis=(1, 2))
+    weights = bootstrap.block_weights(30, 3, block=4, rng=np.random.default_rng(1))
+    assert np.all(weights.sum(axis=1) == 30), "Each replicate should have as many days as the data"
+    replicates = bootstrap.weighted_reduce(stats, weights)
+    for k in range(3):
+        days = np.repeat(np.arange(30), weights[k].astype(int))
+        expected = metrics.Stats.from_arrays(truth[days], pred[days])
+        for name, values in replicates[k].metrics().items():
+            assert np.isclose(values, expected.metrics()[name]), f"Wrong {name} of replicate {k}"
+
+def test_bootstrap():
+    """Test that the replicates are paired, reproducible and independent of the number of processes."""
+    truth, pred = sample_pairs((100, 4, 3))
+    stats = metrics.Stats.from_arrays(truth, pred, axis=(1, 2))
+    other = metrics.Stats.from_arrays(truth, pred + 1, axis=(1, 2))
+    a, b = bootstrap.bootstrap([stats, other], n_replicates=600, seed=3, max_workers=2)
+    assert a['rmse'].shape == (600,), f"Wrong shape {a['rmse'].shape}"
+    # The same days are drawn for both, so the bias differs by exactly 1
+    assert np.allclose(b['bias'] - a['bias'], 1), "The replicates of the two statistics are not paired"
+    single = bootstrap.bootstrap(stats, n_replicates=600, seed=3, max_workers=1)
+    assert np.allclose(single['r2'], a['r2']), "The replicates depend on the number of processes"
+    low, high = bootstrap.confidence_interval(a['rmse'])
+    assert low < stats.reduce().rmse < high, f"The RMSE {stats.reduce().rmse} is outside its interval ({low}, {high})"
+    try:
+        bootstrap.bootstrap([stats, other[:50]], n_replicates=10)
+    except ValueError:
+        assert True, "Statistics with different numbers of days should raise a ValueError"
+    else:
+        assert False, "Statistics with different numbers of days should raise a ValueError"
@@ -0,0 +1,65 @@
+from unox import catalog
+import numpy as np
+import os
+
+def make_runs(root):
+    """Create a small HPC_runs/ directory for testing."""
+    for run in ['test_unet_1', 'test_unet_2']:
+        for stage in [1, 2]:
+            os.makedirs(root / run / f'stage{stage}_output')
+            for year in [2019, 2020]:
+                np.save(root / run / f'stage{stage}_output' / f'pred_X_{year}.npy', np.zeros((3, 4, 5, 1), dtype=np.float32))
+        (root / run / 'unet_stage1_log.csv').write_text('epoch;loss\n0;1.0\n')
+
+def test_parse_path():
+    """Test the parse_path function."""
+    cases = [('test_unet_601760/stage1_output/pred_X_2019.npy', {'kind': 'pred', 'stage': 1, 'year': 2019, 'run': 'test_unet_601760'}),
+             ('stage2/x/X_2014.npy', {'kind': 'x', 'stage': 2, 'year': 2014, 'run': None}),
+             ('test_unet_601760/unet_stage1_log.csv', {'kind': 'other', 'stage': None, 'year': None, 'run': 'test_unet_601760'})]
+    for rel_path, expected in cases:
+        actual = catalog.parse_path(rel_path)
+        assert actual == expected, f"Expected {expected} for {rel_path}, but got {actual}"
+
+def test_lookup(tmp_path, tmp_path_factory, monkeypatch):
+    """Test the lookup function."""
+    monkeypatch.setenv(catalog.CACHE_VAR, str(tmp_path_factory.mktemp('cache')))
+    make_runs(tmp_path)
+    root = str(tmp_path) + '/'
+    entry = catalog.lookup(root + 'test_unet_1/stage2_output/pred_X_2020.npy', root)
+    assert entry is not None, "lookup did not find an existing file"
+    assert entry['shape'] == (3, 4, 5, 1), f"Expected shape (3, 4, 5, 1), but got {entry['shape']}"
+    assert entry['dtype'] == '<f4', f"Expected dtype <f4, but got {entry['dtype']}"
+    assert (entry['run'], entry['stage'], entry['year']) == ('test_unet_1', 2, 2020), f"Wrong metadata {entry}"
+    # Missing files are not found
+    assert catalog.lookup(root + 'test_unet_1/stage2_output/pred_X_2021.npy', root) is None, "lookup found a missing file"
+    assert catalog.lookup(root + 'test_unet_3/stage2_output/pred_X_2020.npy', root) is None, "lookup found a missing file"
+    # Overwritten files are updated
+    np.save(tmp_path / 'test_unet_1/stage2_output/pred_X_2020.npy', np.zeros((6, 4, 5, 1)))
+    entry = catalog.lookup(root + 'test_unet_1/stage2_output/pred_X_2020.npy', root)
+    assert entry['shape'] == (6, 4, 5, 1), f"lookup did not update the shape of an overwritten file: {entry['shape']}"
+
+def test_list_files(tmp_path, tmp_path_factory, monkeypatch):
+    """Test the list_files function, including incremental refreshes."""
+    monkeypatch.setenv(catalog.CACHE_VAR, str(tmp_path_factory.mktemp('cache')))
+    make_runs(tmp_path)
+    root = str(tmp_path) + '/'
+    assert len(catalog.list_files(root)) == 10, "list_files did not list all files"
+    entries = catalog.list_files(root, kind='pred', stage=1, year=2019)
+    expected = [root + 'test_unet_1/stage1_output/pred_X_2019.npy', root + 'test_unet_2/stage1_output/pred_X_2019.npy']
+    assert [e['path'] for e in entries] == expected, f"Expected {expected}, but got {entries}"
+    # The catalog is kept out of the data directory, so refreshes without changes list no directory
+    assert os.path.exists(catalog.catalog_path(root)), "The catalog was not created"
+    assert not os.path.dirname(catalog.catalog_path(root)).startswith(str(tmp_path)), "The catalog is in the data directory"
+    scanned = []
+    scan_dir = catalog._scan_dir
+    monkeypatch.setattr(catalog, '_scan_dir', lambda conn, root, rel_dir, mtime: scanned.append(rel_dir) or scan_dir(conn, root, rel_dir, mtime))
+    for _ in range(3):
+        catalog.refresh(root)
+    assert scanned == [], f"Refreshes without changes listed {scanned}"
+    # New and removed files are picked up
+    os.makedirs(tmp_path / 'test_unet_3/stage1_output')
+    np.save(tmp_path / 'test_unet_3/stage1_output/pred_X_2019.npy', np.zeros(2))
+    os.remove(tmp_path / 'test_unet_1/stage1_output/pred_X_2019.npy')
+    entries = catalog.list_files(root, kind='pred', stage=1, year=2019)
+    expected = [root + 'test_unet_2/stage1_output/pred_X_2019.npy', root + 'test_unet_3/stage1_output/pred_X_2019.npy']
+    assert [e['path'] for e in entries] == expected, f"Expected {expected}, but got {entries}"
@@ -0,0 +1,80 @@
+from unox import daily
+import xarray as xr
+import numpy as np
+import datetime
+
+def test_day_index():
+    """Test the day_index and index_date functions."""
+    # Test the first and last days of a normal and a leap year
+    cases = [('2019-01-02', (2019, 0)), ('2019-12-31', (2019, 363)),
+             ('2020-02-28', (2020, 57)), ('2020-03-01', (2020, 58)), ('2020-12-31', (2020, 363))]
+    for date, expected in cases:
+        actual = daily.day_index(date)
+        assert actual == expected, f"Expected {expected} for {date}, but got {actual}"
+        actual_date = daily.index_date(*expected)
+        assert actual_date == datetime.date.fromisoformat(date), f"Expected {date}, but got {actual_date}"
+    # Test every index of a leap year round trips
+    for index in range(daily.N_DAYS):
+        assert daily.day_index(daily.index_date(2020, index)) == (2020, index), f"day_index failed on index {index}"
+    # Test dates that are not in the input files
+    for date in ['2020-02-29', '2019-01-01']:
+        try:
+            daily.day_index(date)
+        except ValueError as e:
+            assert True, f"day_index raised an exception on invalid date {date}: {e}"
+        else:
+            assert False, f"day_index did not raise an exception on invalid date {date}"
+
+def test_regrid():
+    """Test that the regrid function matches xarray's interp."""
+    lats = np.load('datafiles/lats.npy')
+    lons = np.load('datafiles/lons.npy')
+    # Create a field on a descending latitude grid, as in ERA5
+    src_lats = np.arange(75, 10, -0.25)
+    src_lons = np.arange(-175, -39, 0.25)
+    rng = np.random.default_rng(0)
+    field = rng.random((2, len(src_lats), len(src_lons)))
+    src = xr.DataArray(field, coords={'time': [0, 1], 'lat': src_lats, 'lon': src_lons}, dims=['time', 'lat', 'lon'])
+    expected = src.interp(lat=lats, lon=lons).values
+    actual = daily.regrid(field, src_lats, src_lons, lats, lons)
+    assert np.allclose(actual, expected, equal_nan=True), "regrid does not match xarray interp"
+
+def test_write_read_day(tmp_path):
+    """Test the write_day and read_day functions."""
+    file_path = str(tmp_path / 'stage1/x/X_2019.npy')
+    # A missing file has no days
+    assert daily.read_day(file_path, '2019-07-19') is None, "read_day did not return None for a missing file"
+    values = np.ones((56, 120, 9))
+    daily.write_day(file_path, '2019-07-19', values)
+    # The written day is read back, other days are still missing
+    assert np.array_equal(daily.read_day(file_path, '2019-07-19'), values), "read_day did not return the written day"
+    assert daily.read_day(file_path, '2019-07-20') is None, "read_day did not return None for a missing day"
+    year = np.load(file_path)
+    assert year.shape == (364, 56, 120, 9), f"Expected shape (364, 56, 120, 9), but got {year.shape}"
+
+def test_predict_day():
+    """Test the predict_day function with a stand-in model."""
+    class SumModel():
+        def predict(self, x):
+            return x.sum(axis=-1, keepdims=True)
+    x_day = np.ones((56, 120, 9))
+    pred = daily.predict_day(SumModel(), x_day)
+    assert pred.shape == (56, 120, 1), f"Expected shape (56, 120, 1), but got {pred.shape}"
+    assert np.all(pred == 9), "predict_day did not return the prediction of the day"
+
+def test_xinput_day_leap_year(tmp_path, monkeypatch):
+    """Test that day t-1 of March 1st of a leap year is February 29th, as in xinput()."""
+    # Stand-ins for the TCR-2 and ERA5 readers, giving the day of the year as the value
+    def day_of_year(date, *args):
+        return np.full((56, 120), float(daily.to_date(date).timetuple().tm_yday))
+    monkeypatch.setattr(daily, 'tcr2_day', day_of_year)
+    monkeypatch.setattr(daily, 'era5_day', day_of_year)
+    store_dir = str(tmp_path)
+    for date in ['2020-02-28', '2020-03-02']:
+        daily.write_day(daily.x_path(store_dir, 1, 2020), date, np.full((56, 120, 9), -1.))
+    # February 29th is not in the store, so it is computed
+    x_day = daily.xinput_day('2020-03-01', 1, datadir='datafiles', store_dir=store_dir)
+    assert np.all(x_day[:, :, 1] == 60), "Day t-1 of March 1st is not February 29th"
+    # Other days t-1 are reused from the store
+    x_day = daily.xinput_day('2020-03-03', 1, datadir='datafiles', store_dir=store_dir)
+    assert np.all(x_day[:, :, 1] == -1), "Day t-1 was not reused from the store"
@@ -169,6 +169,12 @@ def test_get_vminmax():
         assert True, f"get_vminmax raised an exception on invalid input: {e}"
     else:
         assert False, "get_vminmax did not raise an exception on invalid input"
+
+    # Percentiles ignore a single outlier
+    outlier_array_list = [np.arange(5000.), np.append(np.arange(5000., 10000.), 1e9)]
+    vmin, vmax = udata.get_vminmax(outlier_array_list, percentiles=(1, 99))
+    assert 0 <= vmin <= 300, f"Expected vmin near 100, but got {vmin}"
+    assert 9700 <= vmax <= 10000, f"Expected vmax near 9900, but got {vmax}"
     
     # Create a sample xarray dataset for testing
     xr_dataset=xr.open_dataset('datafiles/nox_2019_t106_US.nc')
@@ -218,3 +224,55 @@ def test_get_max_abs_val():
         assert True, f"get_max_abs_val raised an exception on invalid input: {e}"
     else:
         assert False, f"get_max_abs_val did not raise an exception on invalid input: {invalid_values}"
+
+def test_verify_lat_array():
+    """Test the verify_lat_array function."""
+    valid_lats = np.array([0, 45, -45, 90, -90, 41.7])
+    assert np.array_equal(udata.verify_lat_array(valid_lats), valid_lats), "verify_lat_array failed on valid latitudes"
+    for invalid_lats in [[0, 91, 3], [-100, 0], [0, np.nan], ['45', 'abc']]:
+        try:
+            udata.verify_lat_array(invalid_lats)
+        except ValueError as e:
+            assert True, f"verify_lat_array raised an exception on invalid latitudes {invalid_lats}: {e}"
+        else:
+            assert False, f"verify_lat_array did not raise an exception on invalid latitudes {invalid_lats}"
+    # The offending indices are reported
+    try:
+        udata.verify_lat_array(np.array([0, 91, 3, -95]))
+    except ValueError as e:
+        assert '[1, 3]' in str(e), f"verify_lat_array did not report the offending indices: {e}"
+
+def test_verify_lon_array():
+    """Test the verify_lon_array function."""
+    valid_lons = np.array([0, 45, -45, 180, -180])
+    assert np.array_equal(udata.verify_lon_array(valid_lons), valid_lons), "verify_lon_array failed on valid longitudes"
+    assert len(udata.verify_lon_array([0, 358.875], lon_range=(0, 360))) == 2, "verify_lon_array failed with lon_range"
+    for invalid_lons in [[181], [-181, 0], [0, np.inf], [np.nan]]:
+        try:
+            udata.verify_lon_array(invalid_lons)
+        except ValueError as e:
+            assert True, f"verify_lon_array raised an exception on invalid longitudes {invalid_lons}: {e}"
+        else:
+            assert False, f"verify_lon_array did not raise an exception on invalid longitudes {invalid_lons}"
+
+def test_shift_lon_array():
+    """Test that shift_lon_array matches shift_lon."""
+    input = np.array([0, 45.3, 200, 360])
+    expected = np.array(list(map(udata.shift_lon, input)))
+    assert np.array_equal(udata.shift_lon_array(input), expected), f"shift_lon_array does not match shift_lon"
+    try:
+        udata.shift_lon_array([10, -1])
+    except ValueError as e:
+        assert True, f"shift_lon_array raised an exception on invalid values: {e}"
+    else:
+        assert False, "shift_lon_array did not raise an exception on invalid values"
+
+def test_get_lats_lons_invalid():
+    """Test that get_lats_lons validates all the coordinate values."""
+    invalid_xr = minimal_xr.assign_coords(lat=[-90, 95])
+    try:
+        udata.get_lats_lons(invalid_xr)
+    except ValueError as e:
+        assert True, f"get_lats_lons raised an exception on invalid latitudes: {e}"
+    else:
+        assert False, "get_lats_lons did not raise an exception on invalid latitudes"
@@ -0,0 +1,51 @@
+from unox import grid as ugrid
+from unox import data as udata
+import numpy as np
+import xarray as xr
+
+def test_index():
+    """Test that the grid lookups match a search for the nearest grid point."""
+    grid = ugrid.get_grid('datafiles/')
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(grid.lats[0] - 3, grid.lats[-1] + 3, 10000)
+    lon = rng.uniform(grid.lons[0] - 3, grid.lons[-1] + 3, 10000)
+    i, j = grid.index(lat, lon)
+    expected_i = np.abs(lat[:, None] - grid.lats).argmin(axis=1)
+    expected_j = np.abs(lon[:, None] - grid.lons).argmin(axis=1)
+    assert np.array_equal(i, expected_i), "lat_index does not match the nearest latitude"
+    assert np.array_equal(j, expected_j), "lon_index does not match the nearest longitude"
+    # Grid points map to themselves, and points too far away or not finite to -1
+    assert np.array_equal(grid.lat_index(grid.lats, tolerance=0.1), np.arange(len(grid.lats))), "lat_index failed on the grid points"
+    i = grid.lat_index([grid.lats[0] - 2, np.nan, grid.lats[3] + 0.05], tolerance=0.1)
+    assert np.array_equal(i, [-1, -1, 3]), f"Expected [-1, -1, 3], but got {i}"
+
+def test_geometry():
+    """Test the extent, cell bounds and cell areas of the grid."""
+    grid = ugrid.Grid([-45., 0., 45.], [0., 90., 180., 270.])
+    assert grid.shape == (3, 4), f"Expected shape (3, 4), but got {grid.shape}"
+    assert grid.extent == (-45., 45., 0., 270.), f"Wrong extent {grid.extent}"
+    assert np.array_equal(grid.lat_bounds, [-67.5, -22.5, 22.5, 67.5]), f"Wrong lat_bounds {grid.lat_bounds}"
+    assert np.array_equal(grid.lon_bounds, [-45., 45., 135., 225., 315.]), f"Wrong lon_bounds {grid.lon_bounds}"
+    # The cells cover the whole band of latitudes around the globe
+    band = 2 * np.pi * ugrid.EARTH_RADIUS**2 * 2 * np.sin(np.radians(67.5))
+    assert np.isclose(grid.cell_areas.sum(), band), f"Expected a total area of {band}, but got {grid.cell_areas.sum()}"
+    try:
+        ugrid.Grid([0., 0.], [0., 1.])
+    except ValueError as e:
+        assert True, f"Grid raised an exception on repeated latitudes: {e}"
+    else:
+        assert False, "Grid did not raise an exception on repeated latitudes"
+
+def test_get_grid():
+    """Test that get_grid loads the grid once and shares read-only arrays."""
+    grid = ugrid.get_grid('datafiles/')
+    assert ugrid.get_grid('datafiles/') is grid, "get_grid did not reuse the grid"
+    assert not grid.lats.flags.writeable, "The arrays of the shared grid are writeable"
+
+def test_restrict_domain(path='datafiles/nox_2019_t106_US.nc'):
+    """Test the restrict_domain function."""
+    grid = ugrid.get_grid('datafiles/')
+    nox = xr.open_dataset(path)
+    arr = np.zeros((2,) + grid.shape + (1,))
+    [restricted], lat_r, lon_r = udata.restrict_domain([arr], grid.lats, grid.lons, nox)
+    assert restricted.shape == (2, len(lat_r), len(lon_r), 1), f"Wrong restricted shape {restricted.shape}"
@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+# Startup budget in seconds for importing a module or starting a command line tool
+IMPORT_BUDGET = float(os.environ.get('UNOX_IMPORT_BUDGET', 1.0))
+
+# Packages that must only be imported when they are used
+HEAVY = ['xarray', 'pandas', 'scipy', 'matplotlib', 'proplot', 'dask', 'tensorflow', 'keras']
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def import_profile(args):
+    """Run python -X importtime with the given arguments.
+
+    Returns the total import time in seconds and the names of the imported modules.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=REPO,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, f"{args} failed: {result.stderr[-2000:]}"
+    total, modules = 0, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.add(name.strip())
+        # Only the top-level imports, as their cumulative times include the nested ones
+        if not name[1:].startswith(' '):
+            total += int(cumulative_us)
+    return total / 1e6, modules
+
+def check_budget(args):
+    """Check that the given command stays in budget and imports no heavy packages."""
+    seconds, modules = import_profile(args)
+    heavy = sorted(m for m in modules if m.split('.')[0] in HEAVY)
+    assert not heavy, f"{args} imported {heavy}"
+    assert seconds < IMPORT_BUDGET, f"{args} took {seconds:.2f} s to import, more than the budget of {IMPORT_BUDGET} s"
+
+def test_import_unox():
+    """Test that importing the unox modules is cheap."""
+    for module in ['unox', 'unox.unox', 'unox.data', 'unox.grid', 'unox.loaders', 'unox.metrics', 'unox.bootstrap',
+                   'unox.catalog', 'unox.pixels', 'unox.quantize', 'unox.reducers', 'unox.regions', 'unox.rollups',
+                   'unox.runs', 'unox.sketch', 'unox.stations', 'unox.totals', 'unox.daily', 'unox.views', 'unox.plotting']:
+        check_budget(['-c', f'import {module}'])
+
+def test_import_training_utils():
+    """Test that the data utilities of the training path do not need TensorFlow."""
+    check_budget(['-c', 'from utils.functions import data_split'])
+
+def test_cli_startup():
+    """Test that the command line tools start quickly."""
+    check_budget(['-m', 'unox.quantize', '--help'])
+    check_budget(['-m', 'unox.sketch', '--help'])
+    check_budget(['-m', 'unox.pixels', '--help'])
+    check_budget(['-m', 'model.parallel', '--help'])
@@ -0,0 +1,88 @@
+from unox import loaders
+import numpy as np
+import shutil
+import os
+
+def make_sample_data(root):
+    """Create sample_data/ and datafiles/ directories for testing, with X files
+    whose values encode the day, lat, lon and channel index."""
+    os.makedirs(root / 'sample_data/stage1/x')
+    os.makedirs(root / 'datafiles')
+    for f in ['lats.npy', 'lons.npy']:
+        shutil.copy(os.path.join('datafiles', f), root / 'datafiles' / f)
+    t, i, j, c = np.meshgrid(np.arange(364), np.arange(56), np.arange(120), np.arange(9), indexing='ij')
+    for year in [2019, 2020]:
+        np.save(root / f'sample_data/stage1/x/X_{year}.npy', year*1e8 + t*1e5 + i*1e3 + j*10 + c)
+
+def test_date_segments():
+    """Test the date_segments function."""
+    cases = [('2019-07-19', [(2019, slice(198, 199))]),
+             (('2019-12-30', '2020-01-03'), [(2019, slice(362, 364)), (2020, slice(0, 2))]),
+             (('2020-02-28', '2020-03-01'), [(2020, slice(57, 59))])]
+    for dates, expected in cases:
+        actual = loaders.date_segments(dates)
+        assert actual == expected, f"Expected {expected} for {dates}, but got {actual}"
+    actual = loaders.date_segments(['2019-07-19', '2019-07-21', '2020-01-05'])
+    assert [y for y, i in actual] == [2019, 2020], f"Wrong years in {actual}"
+    assert np.array_equal(actual[0][1], [198, 200]) and np.array_equal(actual[1][1], [3]), f"Wrong indices in {actual}"
+
+def test_channel_index():
+    """Test the channel_index function."""
+    assert loaders.channel_index(['no2', 't2m']) == [0, 7], "channel_index failed on channel names"
+    assert loaders.channel_index('nox', 'y') == slice(0, 1), "channel_index failed on a single channel"
+    try:
+        loaders.channel_index('abc')
+    except ValueError as e:
+        assert True, f"channel_index raised an exception on an unknown channel: {e}"
+    else:
+        assert False, "channel_index did not raise an exception on an unknown channel"
+
+def test_load_sample(tmp_path, monkeypatch):
+    """Test the load_sample function."""
+    make_sample_data(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    # A single day and channel
+    slab = loaders.load_sample(stage=1, x_or_y='x', dates='2019-01-03', channels='t2m')
+    assert slab.shape == (1, 56, 120, 1), f"Expected shape (1, 56, 120, 1), but got {slab.shape}"
+    assert slab[0, 2, 3, 0] == 2019e8 + 1e5 + 2e3 + 30 + 7, f"Wrong value {slab[0, 2, 3, 0]}"
+    # A range of dates across two years, a box and several channels
+    lats, lons = np.load('datafiles/lats.npy'), np.load('datafiles/lons.npy')
+    box = (lats[10], lats[12], lons[20], lons[24])
+    slab = loaders.load_sample(stage=1, x_or_y='x', dates=('2019-12-31', '2020-01-03'), channels=[0, 1], box=box)
+    assert slab.shape == (3, 3, 5, 2), f"Expected shape (3, 3, 5, 2), but got {slab.shape}"
+    expected_days = [2019e8 + 363e5, 2020e8, 2020e8 + 1e5]
+    assert np.array_equal(slab[:, 0, 0, 0], np.array(expected_days) + 10e3 + 200), f"Wrong days {slab[:, 0, 0, 0]}"
+    # The whole year
+    slab = loaders.load_sample(stage=1, x_or_y='x', year=2020)
+    assert slab.shape == (364, 56, 120, 9), f"Expected shape (364, 56, 120, 9), but got {slab.shape}"
+
+def test_open_array(tmp_path):
+    """Test that open_array reuses handles until the file changes."""
+    file_path = str(tmp_path / 'a.npy')
+    np.save(file_path, np.zeros(3))
+    assert loaders.open_array(file_path) is loaders.open_array(file_path), "open_array did not reuse the handle"
+    np.save(file_path, np.ones(4))
+    assert np.array_equal(loaders.open_array(file_path), np.ones(4)), "open_array did not reopen a changed file"
+
+def test_load_years(tmp_path, monkeypatch):
+    """Test that load_years matches np.concatenate, with and without a dtype cast."""
+    rng = np.random.default_rng(0)
+    arrays = [rng.random((n, 4, 5, 2)) for n in [3, 7, 1]]
+    file_paths = []
+    for i, arr in enumerate(arrays):
+        file_paths.append(str(tmp_path / f'{i}.npy'))
+        np.save(file_paths[-1], arr)
+    expected = np.concatenate(arrays, axis=0)
+    # Small blocks, so that files are read in several pieces
+    monkeypatch.setattr(loaders, 'READ_BLOCK', 100)
+    actual = loaders.load_years(file_paths, max_workers=2)
+    assert actual.dtype == np.float64 and np.array_equal(actual, expected), "load_years does not match np.concatenate"
+    actual = loaders.load_years(file_paths, dtype=np.float32)
+    assert actual.dtype == np.float32 and np.array_equal(actual, expected.astype(np.float32)), "load_years did not cast the data"
+    np.save(tmp_path / 'bad.npy', np.zeros((2, 4, 6, 2)))
+    try:
+        loaders.load_years(file_paths + [str(tmp_path / 'bad.npy')])
+    except ValueError as e:
+        assert True, f"load_years raised an exception on mismatched shapes: {e}"
+    else:
+        assert False, "load_years did not raise an exception on mismatched shapes"
@@ -0,0 +1,62 @@
+from unox import metrics
+from unox import grid as ugrid
+from unox import regions as uregions
+import numpy as np
+from scipy.stats import linregress
+
+def sample_pairs(shape, seed=0):
+    """Random truth and predictions, with zeros and NaN values."""
+    rng = np.random.default_rng(seed)
+    truth = rng.gamma(2., 50., size=shape)
+    truth[rng.random(shape) < 0.2] = 0
+    pred = 0.8 * truth + rng.normal(5., 10., size=shape)
+    pred[rng.random(shape) < 0.05] = np.nan
+    return truth, pred
+
+def test_stats():
+    """Test the metrics against numpy and scipy on the flattened values."""
+    truth, pred = sample_pairs((40, 6, 5))
+    stats = metrics.Stats.from_arrays(truth, pred)
+    valid = ~np.isnan(pred)
+    t, p = truth[valid], pred[valid]
+    fit = linregress(t, p)
+    assert stats.n == len(t), f"Expected {len(t)} pairs, but got {stats.n}"
+    assert np.isclose(stats.bias, np.mean(p - t)), "Wrong bias"
+    assert np.isclose(stats.rmse, np.sqrt(np.mean((p - t)**2))), "Wrong RMSE"
+    assert np.isclose(stats.mse_nonzero, np.mean(np.where(t != 0, p - t, 0)**2)), "Wrong masked MSE"
+    assert np.isclose(stats.r2, 1 - np.sum((p - t)**2) / np.sum((t - t.mean())**2)), "Wrong R²"
+    assert np.isclose(stats.slope, fit.slope) and np.isclose(stats.intercept, fit.intercept), "Wrong regression"
+    assert np.isclose(stats.r, fit.rvalue), "Wrong correlation"
+
+def test_merge_and_reduce():
+    """Test that merged and reduced statistics match those of all the pairs."""
+    truth, pred = sample_pairs((40, 6, 5), seed=1)
+    # Very different means in the two halves, to test the centred sums
+    truth[20:] += 1e4
+    pred[20:] += 1e4
+    whole = metrics.Stats.from_arrays(truth, pred, axis=0)
+    merged = metrics.Stats.from_arrays(truth[:20], pred[:20], axis=0).merge(metrics.Stats.from_arrays(truth[20:], pred[20:], axis=0))
+    reduced = metrics.Stats.from_arrays(truth.reshape(4, 10, 6, 5), pred.reshape(4, 10, 6, 5), axis=1).reduce(axis=0)
+    for stats in [merged, reduced]:
+        for name, values in stats.metrics().items():
+            assert np.allclose(values, whole.metrics()[name]), f"{name} of the merged statistics does not match"
+    total = metrics.Stats.from_arrays(truth, pred)
+    assert np.isclose(whole.reduce().slope, total.slope), "The reduced slope does not match"
+
+def test_evaluate():
+    """Test the evaluation per month, cell and region."""
+    grid = ugrid.Grid(np.arange(6.), np.arange(5.))
+    pairs = [(year, *sample_pairs((364, 6, 5, 1), seed=year)) for year in [2019, 2020]]
+    stats = metrics.evaluate(pairs, max_workers=2)
+    assert stats.shape == (12, 6, 5), f"Wrong shape {stats.shape}"
+    region = uregions.box_region((0, 2, 0, 1), grid, name='corner')
+    out = metrics.results(stats, {'corner': region})
+    truth = np.concatenate([pair[1] for pair in pairs])
+    pred = np.concatenate([pair[2] for pair in pairs])
+    assert np.isclose(out['global']['rmse'], metrics.Stats.from_arrays(truth, pred).rmse), "Wrong global RMSE"
+    assert np.allclose(out['cell']['bias'], metrics.Stats.from_arrays(truth, pred, axis=(0, 3)).bias), "Wrong bias per cell"
+    # January has 30 days per year, as the files start on January 2nd
+    january = np.concatenate([truth[:30], truth[364:394]]), np.concatenate([pred[:30], pred[364:394]])
+    assert np.isclose(out['month']['r2'][0], metrics.Stats.from_arrays(*january).r2), "Wrong R² of January"
+    corner = metrics.Stats.from_arrays(truth[:, :3, :2], pred[:, :3, :2])
+    assert np.isclose(out['region']['corner']['slope'], corner.slope), "Wrong slope of the region"
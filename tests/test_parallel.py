@@ -0,0 +1,27 @@
+from model import parallel
+import time
+
+def test_plan_cores():
+    """Test that the cores are split into contiguous groups of nearly equal size."""
+    plan = parallel.plan_cores(3, [7, 0, 1, 2, 3, 4, 5, 6])
+    assert plan == [[0, 1, 2], [3, 4, 5], [6, 7]], f"Wrong plan {plan}"
+    assert parallel.plan_cores(1, [4, 5]) == [[4, 5]], "A single worker should get all the cores"
+    for n_workers in [0, 9]:
+        try:
+            parallel.plan_cores(n_workers, range(8))
+        except ValueError as e:
+            assert True, f"plan_cores raised an exception on {n_workers} workers: {e}"
+        else:
+            assert False, f"plan_cores did not raise an exception on {n_workers} workers"
+
+def test_dead_worker():
+    """Test that a worker that dies before sending its result raises an error instead of hanging."""
+    start = time.perf_counter()
+    try:
+        # time.sleep() fails on the queue passed as its argument, so the worker dies at once
+        parallel._run_workers(time.sleep, [()])
+    except RuntimeError as e:
+        assert True, f"_run_workers raised an exception on a dead worker: {e}"
+    else:
+        assert False, "_run_workers did not raise an exception on a dead worker"
+    assert time.perf_counter() - start < 60, "_run_workers took too long to notice the dead worker"
@@ -0,0 +1,77 @@
+from unox import pixels
+from unox import loaders
+from unox import daily
+from unox import grid as ugrid
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+import os
+import numpy as np
+
+def sample_year(seed=0, shape=(364, 10, 11, 2)):
+    """A year of random values, on a small grid."""
+    return np.random.default_rng(seed).uniform(size=shape).astype(np.float32)
+
+def test_query(tmp_path):
+    """Test that the store gives the series of the year files, and follows their changes."""
+    arrs = {year: sample_year(year) for year in [2018, 2019, 2020]}
+    for year, arr in arrs.items():
+        np.save(tmp_path / f'pred_X_{year}.npy', arr)
+    store_dir = pixels.store_path(str(tmp_path / 'pred_X_2019.npy'))
+    assert pixels.update_year(str(tmp_path / 'pred_X_2019.npy')) is None, "A missing store should not be built"
+    i, j = np.array([0, 9, 4, 9]), np.array([0, 10, 3, 2])
+    series = pixels.query(store_dir, i, j, years=[2018, 2020], channels=[1])
+    assert series.shape == (4, 728, 1), f"Wrong shape {series.shape}"
+    expected = np.concatenate([arrs[2018][:, i, j, 1:], arrs[2020][:, i, j, 1:]]).transpose(1, 0, 2)
+    assert np.array_equal(series, expected), "Wrong series"
+    # A day written into a year file
+    date = datetime.date(2019, 7, 19)
+    daily.write_day(str(tmp_path / 'pred_X_2019.npy'), date, np.full((10, 11, 2), 100.))
+    pixels.update_day(str(tmp_path / 'pred_X_2019.npy'), date)
+    t = 364 + daily.day_index(date)[1]
+    series = pixels.query(store_dir, i, j, build=False)
+    assert np.all(series[:, t] == 100), "The written day is not in the store"
+    # A new year file
+    np.save(tmp_path / 'pred_X_2021.npy', sample_year(2021))
+    index = pixels.update_year(str(tmp_path / 'pred_X_2021.npy'))
+    assert index['years'] == [2018, 2019, 2020, 2021], f"Wrong years {index['years']}"
+    assert np.array_equal(pixels.query(store_dir, [5], [5], years=[2021])[0], sample_year(2021)[:, 5, 5]), \
+        "Wrong series of the new year"
+
+def test_load_series(tmp_path, monkeypatch):
+    """Test that the loaders serve the series of points from the pixel store."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('HPC_runs/run/stage1_output')
+    arrs = [sample_year(year, (364, 10, 11, 1)) for year in [2018, 2019]]
+    for year, arr in zip([2018, 2019], arrs):
+        np.save(f'HPC_runs/run/stage1_output/pred_X_{year}.npy', arr)
+    grid = ugrid.Grid(np.arange(10.), np.arange(11.))
+    series = loaders.load_series([2.1, 7.9], [3., 0.2], HPC_run='run', grid=grid)
+    assert series.shape == (2, 2, 364, 1), f"Wrong shape {series.shape}"
+    assert os.path.exists('HPC_runs/run/stage1_output/pred_X.pixels/index.json'), "The store was not written"
+    assert np.array_equal(series[1, 1], arrs[1][:, 8, 0]), "Wrong series of a point"
+    cells = loaders.load_series(cells=[(2, 3)], HPC_run='run', years=2019)
+    assert np.array_equal(cells[0, 0], series[0, 1]), "The series of a cell does not match that of its point"
+    try:
+        loaders.load_series([50.], [3.], HPC_run='run', grid=grid)
+    except ValueError as e:
+        assert True, f"load_series raised an exception on a point outside the grid: {e}"
+    else:
+        assert False, "load_series did not raise an exception on a point outside the grid"
+
+def test_concurrent_updates(tmp_path):
+    """Test that years added by several writers at once give a complete store."""
+    np.save(tmp_path / 'pred_X_2018.npy', sample_year(2018))
+    store_dir = pixels.store_path(str(tmp_path / 'pred_X_2018.npy'))
+    pixels.build_store(store_dir)
+    years = [2019, 2020, 2021, 2022]
+    for year in years:
+        np.save(tmp_path / f'pred_X_{year}.npy', sample_year(year))
+    with ThreadPoolExecutor(len(years)) as executor:
+        list(executor.map(lambda year: pixels.update_year(str(tmp_path / f'pred_X_{year}.npy')), years))
+    index = pixels.read_index(store_dir)
+    assert index['years'] == [2018] + years, f"Wrong years {index['years']}"
+    series = pixels.query(store_dir, [9], [10], build=False)[0]
+    expected = np.concatenate([sample_year(year)[:, 9, 10] for year in [2018] + years])
+    assert np.array_equal(series, expected), "Wrong series after concurrent updates"
+    assert sorted(os.listdir(tmp_path)) == sorted([f'pred_X_{year}.npy' for year in [2018] + years]
+                                                  + ['pred_X.pixels', 'pred_X.pixels.lock']), "Temporary stores were left"
@@ -0,0 +1,59 @@
+from unox import quantize
+from unox import loaders
+from unox import unox
+import numpy as np
+import os
+
+def make_pred(root, dtype=np.float32):
+    """Create a prediction file of a run for testing."""
+    os.makedirs(root / 'HPC_runs/test_unet_1/stage1_output')
+    rng = np.random.default_rng(0)
+    pred = (rng.gamma(2., 50., (30, 8, 10, 1)) * np.linspace(0.1, 3, 30)[:, None, None, None]).astype(dtype)
+    pred[3, 2, 1, 0] = np.nan
+    np.save(root / 'HPC_runs/test_unet_1/stage1_output/pred_X_2019.npy', pred)
+    return pred
+
+def test_quantize_file(tmp_path):
+    """Test that quantized files decode within their maximum error."""
+    pred = make_pred(tmp_path)
+    file_path = str(tmp_path / 'HPC_runs/test_unet_1/stage1_output/pred_X_2019.npy')
+    for dtype in ['int16', 'float16']:
+        info = quantize.quantize_file(file_path, dtype=dtype, chunk=7)
+        arr = quantize.QuantizedArray(quantize.quantized_paths(file_path)[0])
+        decoded = np.asarray(arr)
+        assert decoded.shape == pred.shape, f"Expected shape {pred.shape}, but got {decoded.shape}"
+        assert np.isnan(decoded[3, 2, 1, 0]), f"NaN was not kept with {dtype}"
+        error = np.nanmax(np.abs(decoded.astype(np.float64) - pred))
+        assert error <= info['max_error'], f"Error {error} above the reported {info['max_error']} with {dtype}"
+        assert info['quantized_bytes'] < info['bytes'], f"The quantized file is not smaller with {dtype}"
+        # Indexing decodes only the selection, with the parameters of each chunk
+        assert np.allclose(arr[5:9, 2], decoded[5:9, 2], equal_nan=True), f"Slicing does not match with {dtype}"
+        assert np.allclose(arr[[0, 13, 29], :, 4], decoded[[0, 13, 29], :, 4]), f"Fancy indexing does not match with {dtype}"
+        assert np.allclose(arr[20, 1], decoded[20, 1]), f"Integer indexing does not match with {dtype}"
+    # Float64 files decode to float64, within the same bound
+    pred = make_pred(tmp_path / 'float64', np.float64)
+    file_path64 = str(tmp_path / 'float64/HPC_runs/test_unet_1/stage1_output/pred_X_2019.npy')
+    info = quantize.quantize_file(file_path64, dtype='int16', chunk=7)
+    arr = quantize.QuantizedArray(quantize.quantized_paths(file_path64)[0])
+    assert arr.dtype == np.float64 and np.asarray(arr).dtype == np.float64, f"Float64 decoded to {arr.dtype}"
+    error = np.nanmax(np.abs(np.asarray(arr) - pred))
+    assert error <= info['max_error'] < 1e-2, f"Error {error} above the reported {info['max_error']} with float64"
+    # The maximum error is guaranteed
+    try:
+        quantize.quantize_file(file_path, dtype='float16', max_error=1e-6)
+    except ValueError as e:
+        assert True, f"quantize_file raised an exception above the maximum error: {e}"
+    else:
+        assert False, "quantize_file did not raise an exception above the maximum error"
+
+def test_quantized_loading(tmp_path, monkeypatch):
+    """Test that get_pred_data and the loaders use quantized files transparently."""
+    pred = make_pred(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    infos = quantize.convert_run('HPC_runs/test_unet_1/', remove=True, verbose=False)
+    assert len(infos) == 1, f"Expected 1 converted file, but got {len(infos)}"
+    file_path = unox.get_pred_data(stage=1, HPC_run='test_unet_1', year=2019)
+    assert file_path.endswith('pred_X_2019.q.npy'), f"get_pred_data did not find the quantized file: {file_path}"
+    slab = loaders.load_pred(stage=1, HPC_run='test_unet_1', year=2019)
+    assert np.nanmax(np.abs(slab - pred)) <= infos[0]['max_error'] * 1.0001 + 1e-4, "The loaded data is not within the maximum error"
+    assert 'total' in quantize.report(infos), "The report has no total"
@@ -0,0 +1,50 @@
+from unox import reducers
+from unox import quantize
+import numpy as np
+
+def test_summarize():
+    """Test that the chunked summary matches numpy on the concatenated arrays."""
+    rng = np.random.default_rng(0)
+    arrays = [rng.normal(size=(50, 7, 3)), rng.normal(size=(20, 7, 3)) * 5, np.arange(10)]
+    arrays[0][rng.random(arrays[0].shape) < 0.1] = np.nan
+    flat = np.concatenate([arr.ravel() for arr in arrays])
+    for max_workers in [1, 4]:
+        # Small chunks, so that every array is split into several of them
+        summary = reducers.summarize(arrays, max_workers=max_workers, chunk_bytes=200)
+        assert summary.size == flat.size, f"Expected {flat.size} values, but got {summary.size}"
+        assert summary.n_nan == np.isnan(flat).sum(), f"Wrong NaN count {summary.n_nan}"
+        assert summary.min == np.nanmin(flat) and summary.max == np.nanmax(flat), "Wrong minimum or maximum"
+        assert summary.abs_max == np.nanmax(np.abs(flat)), f"Wrong absolute maximum {summary.abs_max}"
+    # All-NaN arrays have no minimum or maximum
+    summary = reducers.summarize([np.full(5, np.nan)])
+    assert summary.count == 0 and summary.min is None, f"Wrong summary of NaN values {summary}"
+
+def test_quantiles():
+    """Test that the estimated quantiles are close to the exact ones."""
+    rng = np.random.default_rng(1)
+    arrays = [rng.lognormal(size=(100, 50)) for _ in range(4)]
+    flat = np.concatenate([arr.ravel() for arr in arrays])
+    summary = reducers.summarize(arrays, quantiles=True, chunk_bytes=20000)
+    q = np.array([0.01, 0.1, 0.5, 0.9, 0.99])
+    # Compare the ranks of the estimates with the requested ones
+    ranks = np.searchsorted(np.sort(flat), summary.quantile(q)) / flat.size
+    assert np.all(np.abs(ranks - q) < 0.005), f"The quantiles are at ranks {ranks}, not {q}"
+    # The sketches are seeded, so the quantiles are the same on every run
+    again = reducers.summarize(arrays, quantiles=True, chunk_bytes=20000, max_workers=1)
+    assert np.array_equal(again.quantile(q), summary.quantile(q)), "The quantiles changed between runs"
+    try:
+        reducers.summarize(arrays).quantile(0.5)
+    except ValueError as e:
+        assert True, f"quantile raised an exception without estimates: {e}"
+    else:
+        assert False, "quantile did not raise an exception without estimates"
+
+def test_summarize_quantized(tmp_path):
+    """Test that quantized files are summarized without decoding them whole."""
+    arr = np.random.default_rng(2).uniform(-3, 9, size=(30, 6, 5, 1)).astype(np.float32)
+    np.save(tmp_path / 'pred_X_2019.npy', arr)
+    quantize.quantize_file(str(tmp_path / 'pred_X_2019.npy'))
+    q = quantize.QuantizedArray(str(tmp_path / 'pred_X_2019.q.npy'))
+    summary = reducers.summarize([q], chunk_bytes=600)
+    assert np.isclose(summary.min, arr.min(), atol=1e-3) and np.isclose(summary.max, arr.max(), atol=1e-3), \
+        f"Wrong extremes {summary.min}, {summary.max} of the quantized file"
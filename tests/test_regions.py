@@ -0,0 +1,79 @@
+from unox import grid as ugrid
+from unox import regions as uregions
+from unox import data as udata
+import json
+import numpy as np
+
+def test_box_region():
+    """Test that box regions select the same cells as the box slices."""
+    grid = ugrid.get_grid('datafiles/')
+    box = (30, 45, -110, -90)
+    region = uregions.box_region(box, grid)
+    lat_slice, lon_slice = grid.box_slices(box)
+    arr = np.arange(2 * grid.shape[0] * grid.shape[1]).reshape((2,) + grid.shape + (1,))
+    assert region.is_box, "A box region does not fill its bounding box"
+    view = region.view(arr)
+    assert np.shares_memory(view, arr), "view() copied the array"
+    assert np.array_equal(view, arr[:, lat_slice, lon_slice]), "view() does not match the box slices"
+    gathered = region.gather(arr)
+    assert gathered.shape == (2, region.n_cells, 1), f"Wrong gathered shape {gathered.shape}"
+    assert np.array_equal(gathered, view.reshape(2, -1, 1)), "gather() does not match the box"
+    assert np.array_equal(region.scatter(gathered)[:, lat_slice, lon_slice], view), "scatter() does not invert gather()"
+    try:
+        uregions.box_region((30.3, 45, -110, -90), grid, tolerance=0.1)
+    except ValueError as e:
+        assert True, f"box_region raised an exception on a box off the grid: {e}"
+    else:
+        assert False, "box_region did not raise an exception on a box off the grid"
+
+def test_polygon_region():
+    """Test polygons with holes, their bounding boxes and masked arrays."""
+    grid = ugrid.Grid(np.arange(0., 10.), np.arange(0., 10.))
+    outer = [[1.5, 1.5], [7.5, 1.5], [7.5, 7.5], [1.5, 7.5], [1.5, 1.5]]
+    hole = [[3.5, 3.5], [5.5, 3.5], [5.5, 5.5], [3.5, 5.5], [3.5, 3.5]]
+    region = uregions.polygon_region([outer, hole], grid, name='ring')
+    expected = np.zeros(grid.shape, dtype=bool)
+    expected[2:8, 2:8] = True
+    expected[4:6, 4:6] = False
+    assert np.array_equal(region.mask, expected), "polygon_region does not match the expected mask"
+    assert region.slices == (slice(2, 8), slice(2, 8)), f"Wrong bounding box {region.slices}"
+    assert not region.is_box, "A region with a hole fills its bounding box"
+    arr = np.ones((3,) + grid.shape + (2,))
+    masked = region.masked(arr)
+    assert masked.shape == (3, 6, 6, 2), f"Wrong masked shape {masked.shape}"
+    assert np.isnan(masked[:, 2:4, 2:4]).all() and np.nansum(masked) == 3 * 32 * 2, "masked() did not mask the hole"
+    # Triangles and GeoJSON geometries, compared with a direct test of each point
+    triangle = [[0.2, 0.2], [9.1, 3.3], [4.4, 8.8]]
+    region = uregions.polygon_region({'type': 'MultiPolygon', 'coordinates': [[triangle]]}, grid)
+    lon, lat = np.meshgrid(grid.lons, grid.lats)
+    def side(a, b):
+        return (b[0] - a[0]) * (lat - a[1]) - (b[1] - a[1]) * (lon - a[0])
+    inside = (side(triangle[0], triangle[1]) > 0) & (side(triangle[1], triangle[2]) > 0) & (side(triangle[2], triangle[0]) > 0)
+    assert np.array_equal(region.mask, inside), "polygon_region does not match the points inside the triangle"
+    assert np.array_equal((~region).mask, ~inside), "The complement of the region is wrong"
+
+def test_geojson_regions(tmp_path):
+    """Test that the regions of a GeoJSON file are rasterized once and combined."""
+    grid = ugrid.get_grid('datafiles/')
+    features = [{'type': 'Feature', 'properties': {'name': name},
+                 'geometry': {'type': 'Polygon', 'coordinates': [[[w, s], [e, s], [e, n], [w, n], [w, s]]]}}
+                for name, (w, s, e, n) in {'west': (-125, 30, -105, 45), 'east': (-95, 30, -75, 45),
+                                           'far': (10, 10, 20, 20)}.items()]
+    path = tmp_path / 'regions.geojson'
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': features}))
+    regions = uregions.geojson_regions(str(path), grid)
+    assert sorted(regions) == ['east', 'west'], f"Expected the regions east and west, but got {sorted(regions)}"
+    assert uregions.geojson_regions(str(path), grid) is regions, "geojson_regions did not reuse the regions"
+    both = uregions.geojson_region(str(path), grid=grid)
+    assert both.n_cells == regions['east'].n_cells + regions['west'].n_cells, "The union of the regions is wrong"
+    west = uregions.box_region((30, 45, -125, -105), grid)
+    assert np.array_equal(regions['west'].mask, west.mask), "The GeoJSON box does not match box_region"
+
+def test_restrict_domain_region():
+    """Test that restrict_domain accepts regions."""
+    grid = ugrid.get_grid('datafiles/')
+    region = uregions.box_region((30, 45, -110, -90), grid)
+    arr = np.zeros((2,) + grid.shape + (1,))
+    [restricted], lat_r, lon_r = udata.restrict_domain([arr], grid.lats, grid.lons, region)
+    assert restricted.shape == (2, len(lat_r), len(lon_r), 1), f"Wrong restricted shape {restricted.shape}"
+    assert np.array_equal(lat_r, region.lats), "restrict_domain did not return the latitudes of the region"
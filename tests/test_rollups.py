@@ -0,0 +1,66 @@
+from unox import rollups
+from unox import loaders
+from unox import daily
+import datetime
+import glob
+import os
+import numpy as np
+
+def sample_year(seed=0):
+    """A year of random values with NaN values, on a small grid."""
+    rng = np.random.default_rng(seed)
+    arr = rng.uniform(size=(364, 4, 3, 1))
+    arr[rng.random(arr.shape) < 0.1] = np.nan
+    # A cell without any values in January
+    arr[:30, 0, 0] = np.nan
+    return arr
+
+def test_compute_rollup():
+    """Test the rollups against numpy on the days of each period."""
+    arr = sample_year()
+    rollup = rollups.compute_rollup(arr, 2019)
+    assert rollup.shape == (3, 17, 4, 3, 1), f"Wrong shape {rollup.shape}"
+    months = np.array([daily.index_date(2019, i).month - 1 for i in range(364)])
+    for period, month_list in [('jul', [6]), ('djf', [0, 1, 11]), ('annual', list(range(12)))]:
+        days = arr[np.isin(months, month_list)]
+        k = rollups.PERIODS.index(period)
+        count = np.sum(~np.isnan(days), axis=0)
+        assert np.array_equal(rollup[2, k], count), f"Wrong count of {period}"
+        assert np.allclose(rollup[0, k], np.nansum(days, axis=0) / count), f"Wrong mean of {period}"
+        assert np.allclose(rollup[1, k], np.nanmax(days, axis=0)), f"Wrong maximum of {period}"
+    assert np.isnan(rollup[0, 0, 0, 0, 0]) and rollup[2, 0, 0, 0, 0] == 0, "A cell without values has a mean"
+
+def test_update_rollup(tmp_path):
+    """Test that writing single days keeps the rollup up to date."""
+    file_path = str(tmp_path / 'pred_X_2019.npy')
+    arr = sample_year(1)
+    np.save(file_path, arr)
+    rollups.write_rollup(file_path)
+    date = datetime.date(2019, 7, 19)
+    daily.write_day(file_path, date, np.full((4, 3, 1), 100.))
+    rollups.update_rollup(file_path, date)
+    rollup = rollups.open_rollup(file_path, build=False)
+    arr[daily.day_index(date)[1]] = 100.
+    assert np.allclose(rollup, rollups.compute_rollup(arr, 2019), equal_nan=True), "The updated rollup is wrong"
+
+def test_load_rollup(tmp_path, monkeypatch):
+    """Test that the loaders serve aggregates from the rollups."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('HPC_runs/run/stage1_output')
+    arrs = [sample_year(year) for year in [2018, 2019]]
+    for year, arr in zip([2018, 2019], arrs):
+        np.save(f'HPC_runs/run/stage1_output/pred_X_{year}.npy', arr)
+    july = loaders.load_rollup('jul', HPC_run='run', years=[2018, 2019])
+    assert july.shape == (2, 4, 3, 1), f"Wrong shape {july.shape}"
+    assert os.path.exists('HPC_runs/run/stage1_output/rollups/pred_X_2019.rollup.npy'), "The rollup was not written"
+    # The globs over the year files of the training scripts must not pick up the rollups
+    assert sorted(glob.glob('HPC_runs/run/stage1_output/pred_X_20*.npy')) == [
+        f'HPC_runs/run/stage1_output/pred_X_{year}.npy' for year in [2018, 2019]], "The rollups match the year files"
+    days = [i for i in range(364) if daily.index_date(2019, i).month == 7]
+    assert np.allclose(july[1], np.nanmean(arrs[1][days], axis=0)), "Wrong July means"
+    try:
+        loaders.load_rollup('july', HPC_run='run')
+    except ValueError as e:
+        assert True, f"load_rollup raised an exception on an unknown period: {e}"
+    else:
+        assert False, "load_rollup did not raise an exception on an unknown period"
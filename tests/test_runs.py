@@ -0,0 +1,59 @@
+from unox import runs
+from unox import catalog
+import numpy as np
+import os
+
+LOG = """epoch;loss;msenonzero;r2_keras;val_loss;val_msenonzero;val_r2_keras
+0;10.0;10.0;0.1;12.0;12.0;0.05
+1;8.0;8.0;0.3;9.0;9.0;0.25
+2;7.0;7.0;0.4;9.5;9.5;0.2
+"""
+
+def make_runs(root):
+    """Create a small HPC_runs/ directory with logs and checkpoints for testing."""
+    for run, scale in [('test_unet_1', 1.0), ('test_unet_2', 0.5)]:
+        os.makedirs(root / run / 'stage1_output')
+        log = '\n'.join(line if i == 0 else ';'.join([line.split(';')[0]] + [str(float(v) * scale) for v in line.split(';')[1:]])
+                        for i, line in enumerate(LOG.strip().split('\n')))
+        (root / run / 'unet_stage1_log.csv').write_text(log + '\n')
+        for val_loss, r2 in [(12.0, 0.1), (9.0, 0.3)]:
+            (root / run / f'unet_checkpt_{val_loss*scale:.2f}_{r2*scale:.2f}_stage1.h5').write_bytes(b'')
+        np.save(root / run / 'stage1_output' / 'pred_X_2019.npy', np.zeros(2))
+
+def test_parse_checkpoint():
+    """Test the parse_checkpoint function."""
+    actual = runs.parse_checkpoint('test_unet_601760/unet_checkpt_12.34_0.87_stage1.h5')
+    expected = {'run': 'test_unet_601760', 'stage': 1, 'val_loss': 12.34, 'r2': 0.87}
+    assert actual == expected, f"Expected {expected}, but got {actual}"
+    assert runs.parse_checkpoint('test_unet_601760/unet_stage1_model.h5') is None, "parse_checkpoint parsed a model file"
+
+def test_parse_log(tmp_path):
+    """Test the parse_log function, including logs appended by a restarted training."""
+    (tmp_path / 'log.csv').write_text(LOG + 'epoch;loss;val_loss\n0;5.0;6.0\n')
+    rows = runs.parse_log(str(tmp_path / 'log.csv'))
+    assert len(rows) == 4, f"Expected 4 rows, but got {len(rows)}"
+    assert rows[1][:5] == (1, 8.0, 9.0, 0.3, 0.25), f"Wrong row {rows[1]}"
+    assert rows[3][:3] == (0, 5.0, 6.0) and np.isnan(rows[3][3]), f"Wrong row {rows[3]}"
+
+def test_summary_and_rank(tmp_path, tmp_path_factory, monkeypatch):
+    """Test the summary and rank functions, and incremental refreshes."""
+    monkeypatch.setenv(catalog.CACHE_VAR, str(tmp_path_factory.mktemp('cache')))
+    make_runs(tmp_path)
+    root = str(tmp_path) + '/'
+    history = runs.epochs(root, run='test_unet_1')
+    assert list(history['epoch']) == [0, 1, 2], f"Wrong epochs {list(history['epoch'])}"
+    table = runs.summary(root)
+    assert list(table['best_epoch']) == [1, 1], f"Wrong best epochs {list(table['best_epoch'])}"
+    assert table['best_checkpoint'][0] == 'test_unet_1/unet_checkpt_9.00_0.30_stage1.h5', f"Wrong best checkpoint {table['best_checkpoint'][0]}"
+    assert table['wall_time'].notna().all(), "The wall time was not estimated"
+    best = runs.rank(root, stage=1, by='val_loss', top=1)
+    assert list(best['run']) == ['test_unet_2'], f"Expected test_unet_2 to rank first, but got {list(best['run'])}"
+    best = runs.rank(root, stage=1, by='val_r2', top=1)
+    assert list(best['run']) == ['test_unet_1'], f"Expected test_unet_1 to rank first, but got {list(best['run'])}"
+    # Appending to a log is picked up, and removing a run forgets it
+    with open(tmp_path / 'test_unet_1' / 'unet_stage1_log.csv', 'a') as f:
+        f.write('3;1.0;1.0;0.9;1.0;1.0;0.9\n')
+    os.remove(tmp_path / 'test_unet_2' / 'unet_stage1_log.csv')
+    table = runs.summary(root)
+    assert list(table['run']) == ['test_unet_1'], f"Expected only test_unet_1, but got {list(table['run'])}"
+    assert table['epochs'][0] == 4 and table['best_epoch'][0] == 3, f"The appended epoch was not parsed: {table}"
@@ -0,0 +1,50 @@
+from unox import shards
+import numpy as np
+import os
+
+def make_sample_data(root):
+    """Create small stage-1 X and Y files whose values encode the year and day."""
+    for x_or_y, n_channels in [('x', 9), ('y', 1)]:
+        os.makedirs(root / f'sample_data/stage1/{x_or_y}')
+        for year in [2019, 2020]:
+            values = year * 100 + np.arange(10)[:, None, None, None] * np.ones((1, 2, 3, n_channels))
+            np.save(root / f'sample_data/stage1/{x_or_y}/{x_or_y.upper()}_{year}.npy', values)
+
+def test_export_shards(tmp_path, monkeypatch):
+    """Test that the shards are balanced, shuffled and contain every sample once."""
+    make_sample_data(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    index = shards.export_shards(1, [2019, 2020], 'shards', n_shards=3, dtype=np.float32)
+    assert [s['n'] for s in index['shards']] == [7, 7, 6], f"Unbalanced shards {[s['n'] for s in index['shards']]}"
+    values = []
+    for shard in index['shards']:
+        x = np.load(os.path.join('shards', shard['x']))
+        y = np.load(os.path.join('shards', shard['y']))
+        assert x.dtype == np.float32 and x.shape[1:] == (2, 3, 9), f"Wrong X shard {x.dtype} {x.shape}"
+        assert np.array_equal(x[:, 0, 0, 0], y[:, 0, 0, 0]), "The X and Y shards are not aligned"
+        expected = [year * 100 + day for year, day in shard['samples']]
+        assert np.array_equal(x[:, 0, 0, 0], expected), "The shard does not match its index"
+        values += list(x[:, 0, 0, 0])
+    assert sorted(values) == sorted([y * 100 + d for y in [2019, 2020] for d in range(10)]), "Samples are missing or repeated"
+    assert values != sorted(values), "The samples were not shuffled"
+
+def test_shard_reader(tmp_path, monkeypatch):
+    """Test that the workers read disjoint data, deterministically reshuffled every epoch."""
+    make_sample_data(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    shards.export_shards(1, [2019, 2020], 'shards', shard_size=5)
+    readers = [shards.ShardReader('shards', rank=r, world_size=2, batch_size=5, seed=1) for r in range(2)]
+    epochs = []
+    for epoch in range(3):
+        seen = []
+        for reader in readers:
+            batches = list(reader.epoch(epoch))
+            assert len(batches) == reader.steps(epoch) == 2, f"Expected 2 batches, but got {len(batches)}"
+            for x, y in batches:
+                assert np.array_equal(x[:, 0, 0, 0], y[:, 0, 0, 0]), "The X and Y batches are not aligned"
+                seen += list(x[:, 0, 0, 0])
+        assert len(set(seen)) == 20, f"The workers did not read every sample once in epoch {epoch}"
+        epochs.append([readers[0].shards(epoch), seen])
+    again = [x[:, 0, 0, 0] for x, y in readers[0].epoch(0)]
+    assert list(np.concatenate(again)) == epochs[0][1][:10], "The epoch is not deterministic"
+    assert len({tuple(e[0]) for e in epochs}) > 1 or epochs[0][1] != epochs[1][1], "The epochs were not reshuffled"
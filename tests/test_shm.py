@@ -0,0 +1,84 @@
+from unox import shm
+from unox import loaders
+import multiprocessing as mp
+import numpy as np
+import os
+import gc
+
+def _open_in_child(address, file_path, queue):
+    """Open a shared array in another process and report its path and sum."""
+    arr = shm.open_shared(file_path, address=address)
+    queue.put((arr.filename, float(arr.sum())))
+
+def test_parse_size():
+    """Test the parse_size function."""
+    assert shm.parse_size('2G') == 2 * 2**30, "parse_size failed on 2G"
+    assert shm.parse_size('500MB') == 500 * 2**20, "parse_size failed on 500MB"
+    assert shm.parse_size(1024) == 1024, "parse_size failed on an integer"
+
+def test_store(tmp_path):
+    """Test the reference counting and eviction of the store."""
+    store = shm.DatasetStore(str(tmp_path / 'shm'), capacity=3000)
+    paths = []
+    for i in range(3):
+        paths.append(str(tmp_path / f'{i}.npy'))
+        np.save(paths[-1], np.full(128, i, dtype=np.float64))
+    shm_path = store.acquire(paths[0], os.getpid())
+    assert store.acquire(paths[0], os.getpid()) == shm_path, "The array was loaded twice"
+    assert np.array_equal(np.load(shm_path), np.zeros(128)), "The shared array is wrong"
+    store.acquire(paths[1], os.getpid())
+    store.release(paths[1], os.getpid())
+    # The third array does not fit, so the unreferenced second one is evicted
+    store.acquire(paths[2], os.getpid())
+    cached = [os.path.basename(e['file_path']) for e in store.stats()]
+    assert cached == ['0.npy', '2.npy'], f"Expected 0.npy and 2.npy in the store, but got {cached}"
+    # References of dead processes do not prevent eviction
+    store.release(paths[0], os.getpid())
+    store.release(paths[0], os.getpid())
+    store.acquire(paths[0], 2**22 + 12345)
+    store.release(paths[2], os.getpid())
+    store.acquire(paths[1], os.getpid())
+    cached = [os.path.basename(e['file_path']) for e in store.stats()]
+    assert len(cached) == 2 and '1.npy' in cached, f"Eviction failed, the store has {cached}"
+    store.clear()
+    assert os.listdir(tmp_path / 'shm') == [], "clear did not remove the shared arrays"
+
+def test_server(tmp_path, monkeypatch):
+    """Test that processes share one copy of an array through the server and the loaders."""
+    file_path = str(tmp_path / 'a.npy')
+    np.save(file_path, np.arange(1000, dtype=np.float32))
+    address = str(tmp_path / 'server.sock')
+    monkeypatch.delenv(shm.AUTHKEY_VAR, raising=False)
+    manager = shm.start(str(tmp_path / 'shm'), capacity='1M', address=address)
+    try:
+        # Without a key, the server makes a random one that only the user can read
+        mode = os.stat(shm.key_path(address)).st_mode & 0o777
+        assert mode == 0o600, f"The key file has mode {oct(mode)}, expected 0o600"
+        try:
+            shm.connect(address, authkey='unox')
+        except mp.AuthenticationError:
+            assert True, "connect raised an exception with a wrong key"
+        else:
+            assert False, "connect did not raise an exception with a wrong key"
+        monkeypatch.setenv(shm.ADDRESS_VAR, address)
+        loaders.clear_cache()
+        arr = loaders.open_array(file_path)
+        assert np.array_equal(arr, np.arange(1000)), "The loaders did not return the shared array"
+        queue = mp.get_context('spawn').Queue()
+        child = mp.get_context('spawn').Process(target=_open_in_child, args=(address, file_path, queue))
+        child.start()
+        child_path, child_sum = queue.get(timeout=60)
+        child.join()
+        assert child_path == arr.filename, "The processes did not share the same copy"
+        assert child_sum == arr.sum(), "The child process read a different array"
+        stats = shm.connect(address).stats()
+        assert len(stats) == 1 and sum(stats[0]['refs'].values()) == 1, f"Wrong references {stats}"
+        # Dropping the array releases the reference of this process
+        del arr
+        loaders.clear_cache()
+        gc.collect()
+        assert shm.connect(address).stats()[0]['refs'] == {}, "The reference was not released"
+    finally:
+        loaders.clear_cache()
+        shm.stop(manager)
+    assert not os.path.exists(shm.key_path(address)), "The key file was not removed"
@@ -0,0 +1,58 @@
+from unox import sketch as usketch
+import os
+import time
+import numpy as np
+
+def rank_errors(sketch, values, q):
+    """Differences between the ranks of the estimated quantiles and the requested ones."""
+    return np.searchsorted(np.sort(values), sketch.quantile(q)) / len(values) - q
+
+def test_quantiles():
+    """Test the rank error and the size of a sketch of many values."""
+    values = np.random.default_rng(0).lognormal(size=1_000_000)
+    sketch = usketch.KLLSketch(seed=0)
+    for chunk in np.array_split(values, 37):
+        sketch.update(chunk)
+    q = np.linspace(0.01, 0.99, 99)
+    assert np.max(np.abs(rank_errors(sketch, values, q))) < 0.01, "The rank error of the sketch is too large"
+    assert sketch.size < 10 * sketch.k, f"The sketch keeps {sketch.size} values"
+    assert sketch.quantile(0) == values.min() and sketch.quantile(1) == values.max(), "The extremes are not exact"
+    assert abs(sketch.rank(np.median(values)) - 0.5) < 0.01, "Wrong rank of the median"
+
+def test_merge():
+    """Test that merged sketches of different distributions summarize all the values."""
+    rng = np.random.default_rng(1)
+    parts = [rng.normal(loc, 1, size=200_000) for loc in [0, 5, 10]]
+    parts[1][:1000] = np.nan
+    merged = usketch.merge_sketches(usketch.KLLSketch(seed=i).update(part) for i, part in enumerate(parts))
+    values = np.concatenate(parts)
+    values = values[~np.isnan(values)]
+    assert merged.n == len(values), f"Expected {len(values)} values, but got {merged.n}"
+    q = np.linspace(0.05, 0.95, 19)
+    assert np.max(np.abs(rank_errors(merged, values, q))) < 0.01, "The rank error of the merged sketch is too large"
+    edges = usketch.bin_edges(merged, bins=10)
+    counts, _ = np.histogram(values, edges)
+    assert np.all(np.abs(counts / len(values) - 0.1) < 0.02), f"The bins do not hold equal counts: {counts}"
+
+def test_persist(tmp_path):
+    """Test that sketches are saved next to the files and rebuilt when the files change."""
+    file_path = str(tmp_path / 'pred_X_2019.npy')
+    arr = np.random.default_rng(2).uniform(size=(20, 6, 5, 1))
+    np.save(file_path, arr)
+    sketch = usketch.load_sketch(file_path)
+    path = usketch.sketch_path(file_path)
+    assert path == str(tmp_path / 'pred_X_2019.sketch.npz') and os.path.exists(path), "The sketch was not saved"
+    loaded = usketch.KLLSketch.load(path)
+    assert loaded.n == sketch.n and np.array_equal(loaded.quantile([0.1, 0.5]), sketch.quantile([0.1, 0.5])), \
+        "The saved sketch differs from the built one"
+    # A newer file makes the sketch out of date
+    time.sleep(0.01)
+    np.save(file_path, arr[:10])
+    os.utime(file_path, (time.time() + 5, time.time() + 5))
+    try:
+        usketch.load_sketch(file_path, build=False)
+    except FileNotFoundError as e:
+        assert True, f"load_sketch raised an exception on an out of date sketch: {e}"
+    else:
+        assert False, "load_sketch did not raise an exception on an out of date sketch"
+    assert usketch.load_sketch(file_path).n == arr[:10].size, "The sketch was not rebuilt"
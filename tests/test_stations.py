@@ -0,0 +1,65 @@
+from unox import stations
+from unox import daily
+from unox import grid as ugrid
+import datetime
+import os
+import numpy as np
+import pandas as pd
+
+def make_epa(path, year, grid, rng):
+    """Write an EPA csv file with three sites, one of them outside the grid, and two instruments at one site."""
+    sites = [(1, 1, 1, 'Alabama', grid.lats[5] + 0.1, grid.lons[7] - 0.2),
+             (6, 37, 2, 'California', grid.lats[20], grid.lons[30]),
+             (6, 37, 3, 'California', -40., grid.lons[30])]
+    rows = []
+    for state, county, site, name, lat, lon in sites:
+        for day in pd.date_range(f'{year}-01-01', f'{year}-12-31'):
+            for poc in [1, 2] if site == 1 else [1]:
+                rows.append({'State Code': state, 'County Code': county, 'Site Num': site, 'State Name': name,
+                             'Latitude': lat, 'Longitude': lon, 'Date Local': day.strftime('%Y-%m-%d'),
+                             'Arithmetic Mean': rng.uniform(0, 30)})
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+def test_day_indices():
+    """Test that day_indices matches daily.day_index."""
+    for year in [2019, 2020]:
+        dates = np.arange(np.datetime64(f'{year-1}-12-30'), np.datetime64(f'{year+1}-01-03'))
+        expected = []
+        for date in dates.astype(datetime.date):
+            try:
+                y, index = daily.day_index(date)
+                expected.append(index if y == year else -1)
+            except ValueError:
+                expected.append(-1)
+        assert np.array_equal(stations.day_indices(dates, year), expected), f"day_indices does not match day_index in {year}"
+
+def test_evaluate_runs(tmp_path, monkeypatch):
+    """Test the station matching and statistics against a loop over the observations."""
+    grid = ugrid.get_grid('datafiles/')
+    rng = np.random.default_rng(0)
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('US_EPA')
+    make_epa(stations.epa_path(2019), 2019, grid, rng)
+    preds = {}
+    for run in ['run_a', 'run_b']:
+        os.makedirs(f'HPC_runs/{run}/stage1_output')
+        preds[run] = rng.uniform(0, 30, size=(364,) + grid.shape + (1,))
+        np.save(f'HPC_runs/{run}/stage1_output/pred_X_2019.npy', preds[run])
+    index = stations.StationIndex.from_csvs([stations.epa_path(2019)], grid)
+    assert len(index) == 3 and index.inside.tolist() == [True, True, False], f"Wrong stations {index}"
+    assert (index.i[0], index.j[0]) == (5, 7), "Wrong cell of the first station"
+    results = stations.evaluate_runs(['run_a', 'run_b'], [2019], index)
+    observations = stations.read_observations(stations.epa_path(2019))
+    for run in ['run_a', 'run_b']:
+        obs = observations[observations['station'] == '01-001-0001']
+        dates = [pd.Timestamp(d).date() for d in obs['date'].values]
+        # January 1st is not in the files
+        t = [daily.day_index(d)[1] for d in dates[1:]]
+        values = obs['value'].values[1:]
+        pred = preds[run][t, 5, 7, 0]
+        stats = results[run]['station'][0]
+        assert stats.n == 364, f"Expected 364 days at the first station, but got {stats.n}"
+        assert np.isclose(stats.rmse, np.sqrt(np.mean((pred - values)**2))), "Wrong RMSE of the first station"
+        assert results[run]['station'][2].n == 0, "The station outside the grid has pairs"
+        assert list(index.networks) == ['Alabama', 'California'], f"Wrong networks {index.networks}"
+        assert results[run]['network'][1].n == 364 and results[run]['all'].n == 728, "Wrong number of pairs"
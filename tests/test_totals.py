@@ -0,0 +1,62 @@
+from unox import totals as utotals
+from unox import grid as ugrid
+from unox import regions as uregions
+from unox import catalog
+import os
+import numpy as np
+
+def sample_regions():
+    """Two overlapping regions on a small grid."""
+    grid = ugrid.Grid(np.arange(30., 36.), np.arange(-100., -95.))
+    return {'west': uregions.box_region((30, 35, -100, -98), grid, 'west'),
+            'south': uregions.box_region((30, 31, -100, -96), grid, 'south')}
+
+def test_region_totals():
+    """Test the totals against a direct sum of the values times the cell areas."""
+    regions = sample_regions()
+    arr = np.random.default_rng(0).uniform(size=(70, 6, 5, 1))
+    arr[3, 0, 0, 0] = np.nan
+    totals = utotals.region_totals(arr, regions, per_day=False)
+    assert totals.shape == (70, 2), f"Wrong shape {totals.shape}"
+    for k, region in enumerate(regions.values()):
+        areas = region.grid.cell_areas * region.mask
+        expected = np.nansum(arr[..., 0] * areas, axis=(1, 2))
+        assert np.allclose(totals[:, k], expected), f"Wrong totals of {region.name}"
+    per_day = utotals.region_totals(arr, regions)
+    assert np.allclose(per_day, totals * utotals.SECONDS_PER_DAY), "Wrong daily totals"
+    assert utotals.weight_matrix(regions) is utotals.weight_matrix(regions), "The weights were built twice"
+    # A region on another grid of the same shape
+    shifted = ugrid.Grid(np.arange(40., 46.), np.arange(-100., -95.))
+    regions['north'] = uregions.box_region((40, 45, -100, -98), shifted, 'north')
+    try:
+        utotals.weight_matrix(regions)
+    except ValueError as e:
+        assert True, f"weight_matrix raised an exception on regions on different grids: {e}"
+    else:
+        assert False, "weight_matrix did not raise an exception on regions on different grids"
+
+def test_monthly_totals():
+    """Test that the monthly totals add up to the yearly total."""
+    totals = np.random.default_rng(1).uniform(size=(364, 3))
+    monthly = utotals.monthly_totals(totals, 2019)
+    assert monthly.shape == (12, 3) and np.allclose(monthly.sum(axis=0), totals.sum(axis=0)), "Wrong monthly totals"
+    assert np.allclose(monthly[0], totals[:30].sum(axis=0)), "January does not start on January 2nd"
+
+def test_catalog_totals(tmp_path, tmp_path_factory, monkeypatch):
+    """Test that the totals of every prediction file are computed and cached."""
+    monkeypatch.setenv(catalog.CACHE_VAR, str(tmp_path_factory.mktemp('cache')))
+    regions = sample_regions()
+    rng = np.random.default_rng(2)
+    for run in ['run_a', 'run_b']:
+        os.makedirs(tmp_path / run / 'stage1_output')
+        np.save(tmp_path / run / 'stage1_output' / 'pred_X_2019.npy', rng.uniform(size=(10, 6, 5, 1)))
+    totals = utotals.catalog_totals(str(tmp_path), regions)
+    assert sorted(totals) == [('run_a', 1, 2019), ('run_b', 1, 2019)], f"Wrong files {sorted(totals)}"
+    file_path = str(tmp_path / 'run_a' / 'stage1_output' / 'pred_X_2019.npy')
+    cached = utotals.totals_path(file_path, regions)
+    assert os.path.exists(cached), "The totals were not cached"
+    # The cached totals are used while the file is unchanged
+    with np.load(cached) as f:
+        np.savez(cached, totals=f['totals'] * 0 + 7, names=f['names'], channel=0, per_day=True)
+    os.utime(cached, (os.path.getmtime(file_path) + 1,) * 2)
+    assert np.all(utotals.file_totals(file_path, regions) == 7), "The cached totals were not used"
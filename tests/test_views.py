@@ -0,0 +1,39 @@
+from unox import views
+import numpy as np
+import shutil
+import os
+
+def make_data(root):
+    """Create sample_data/, HPC_runs/ and datafiles/ directories for testing,
+    with Y and prediction files for stage 1 only."""
+    os.makedirs(root / 'sample_data/stage1/y')
+    os.makedirs(root / 'HPC_runs/test_unet_1/stage1_output')
+    os.makedirs(root / 'datafiles')
+    for f in ['lats.npy', 'lons.npy']:
+        shutil.copy(os.path.join('datafiles', f), root / 'datafiles' / f)
+    t = np.arange(364, dtype=np.float32)[:, None, None, None] * np.ones((1, 56, 120, 1), dtype=np.float32)
+    for year in [2019, 2020]:
+        np.save(root / f'sample_data/stage1/y/Y_{year}.npy', year + t)
+        np.save(root / f'HPC_runs/test_unet_1/stage1_output/pred_X_{year}.npy', -(year + t))
+
+def test_year_times():
+    """Test the year_times function."""
+    times = views.year_times(2020)
+    assert len(times) == 364, f"Expected 364 days, but got {len(times)}"
+    assert times[0] == np.datetime64('2020-01-02') and times[-1] == np.datetime64('2020-12-31'), f"Wrong first or last day {times[[0, -1]]}"
+    assert np.datetime64('2020-02-29') not in times, "February 29th is in the time axis"
+
+def test_open_dataset(tmp_path, monkeypatch):
+    """Test the open_dataset function."""
+    make_data(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    ds = views.open_dataset([2019, 2020], stages=[1, 2], HPC_runs='test_unet_1', x=False)
+    assert dict(ds.sizes) == {'stage': 2, 'time': 728, 'lat': 56, 'lon': 120, 'run': 1}, f"Wrong sizes {dict(ds.sizes)}"
+    assert ds.nox.chunks is not None, "The dataset was not lazily loaded"
+    day = ds.sel(stage=1, time='2020-01-03')
+    assert float(day.nox[0, 0]) == 2021, f"Wrong truth value {float(day.nox[0, 0])}"
+    assert float(day.pred.sel(run='test_unet_1')[5, 7]) == -2021, f"Wrong prediction value"
+    # Missing stage 2 files are filled with NaN
+    assert bool(ds.nox.sel(stage=2).isnull().all()), "Missing files were not filled with NaN"
+    mean = ds.nox.sel(stage=1, time=slice('2019-01-02', '2019-01-04')).mean().compute()
+    assert float(mean) == 2020, f"Expected a mean of 2020, but got {float(mean)}"
@@ -1,9 +1,11 @@
-from keras import backend as K
-import tensorflow as tf
 import numpy as np
 import random
 
+#TensorFlow is only imported by the metrics, so that data_split can be used without it
+
 def r2_keras(y_true, y_pred):
+    from keras import backend as K
+    import tensorflow as tf
     y_t = tf.multiply(y_true, tf.cast(tf.not_equal(y_true, 0), tf.float32))
     y_p = tf.multiply(y_pred, tf.cast(tf.not_equal(y_true, 0), tf.float32))
     SS_res =  K.sum(K.square(y_t - y_p)) 
@@ -12,6 +14,8 @@ def r2_keras(y_true, y_pred):
   
 
 def msenonzero(y_true, y_pred):
+    from keras import backend as K
+    import tensorflow as tf
     y_t = tf.multiply(y_true, tf.cast(tf.not_equal(y_true, 0), tf.float32))
     y_p = tf.multiply(y_pred, tf.cast(tf.not_equal(y_true, 0), tf.float32))
     return K.sum(K.square(y_p - y_t), axis=-1)